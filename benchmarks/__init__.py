@@ -0,0 +1,33 @@
+"""
+Benchmarks for the Bitwarden Exporter.
+
+Run them from the repository root with the package on the path, for example:
+    PYTHONPATH=src python -m benchmarks.export --items 10000 --report report.json
+
+Functions:
+    prepare_exporter_import(exporter_args: Optional[List[str]] = None) -> None:
+        Sets the command line the exporter parses its settings from when it is imported.
+
+    split_exporter_args(argv: List[str]) -> Tuple[List[str], List[str]]:
+        Splits a benchmark command line into its own arguments and the exporter arguments after `--`.
+"""
+
+import sys
+from typing import List, Optional, Tuple
+
+
+def prepare_exporter_import(exporter_args: Optional[List[str]] = None) -> None:
+    """
+    The exporter parses its settings from the command line when `bitwarden_exporter` is first imported, so the
+    benchmarks have to replace the command line before importing any of its modules.
+    """
+    sys.argv = [sys.argv[0]] + (exporter_args if exporter_args is not None else ["--export-password", "benchmark"])
+
+
+def split_exporter_args(argv: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Returns the arguments before `--` and the arguments after it, which are passed to the exporter.
+    """
+    if "--" not in argv:
+        return argv, []
+    return argv[: argv.index("--")], argv[argv.index("--") + 1 :]
@@ -0,0 +1,187 @@
+"""
+End to end benchmark of an export against a synthetic vault and a fake `bw` CLI.
+
+Generates a vault with `benchmarks.synthetic_vault`, puts the fake `bw` of `benchmarks.fake_bw` first on PATH and
+runs the exporter in a fresh process per run, so the peak memory of every run is measured on its own. The exporter
+functions are wrapped with timers to split the wall time into phases. The report is JSON.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.export --items 100000 --latency 1.5 --report report.json \\
+        -- --bw-transport serve --download-workers 8
+
+Everything after `--` is passed to the exporter.
+"""
+
+import argparse
+import collections
+import contextlib
+import functools
+import json
+import os
+import subprocess  # nosec B404
+import sys
+import tempfile
+import time
+from typing import Any, Callable, DefaultDict, Dict, Iterator, List, Optional
+
+from . import prepare_exporter_import, split_exporter_args
+from .fake_bw import install_fake_bw
+from .synthetic_vault import add_shape_arguments, generate_vault, shape_from_arguments
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore
+
+
+class PhaseTimer:
+    """
+    Accumulates the time and the number of calls spent in each phase
+    """
+
+    def __init__(self) -> None:
+        self.seconds: DefaultDict[str, float] = collections.defaultdict(float)
+        self.calls: DefaultDict[str, int] = collections.defaultdict(int)
+
+    def wrap(self, owner: Any, name: str, phase: Optional[Callable[..., str]] = None) -> None:
+        """
+        Replaces `owner.name` with a function that times every call.
+        """
+        original = getattr(owner, name)
+
+        @functools.wraps(original)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            phase_name = phase(*args, **kwargs) if phase is not None else name.strip("_")
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.seconds[phase_name] += time.perf_counter() - start
+                self.calls[phase_name] += 1
+
+        setattr(owner, name, timed)
+
+    def wrap_generator(self, owner: Any, name: str) -> None:
+        """
+        Replaces the generator function `owner.name` with one that times the work done inside the generator.
+        """
+        original = getattr(owner, name)
+
+        @functools.wraps(original)
+        def timed(*args: Any, **kwargs: Any) -> Iterator[Any]:
+            generator = original(*args, **kwargs)
+            while True:
+                start = time.perf_counter()
+                try:
+                    value = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    self.seconds[name] += time.perf_counter() - start
+                self.calls[name] += 1
+                yield value
+
+        setattr(owner, name, timed)
+
+
+def run_child(report_path: str) -> None:
+    """
+    Runs the exporter in this process with timers installed and writes the phase report.
+    """
+    # pylint: disable=import-outside-toplevel
+    from bitwarden_exporter import BITWARDEN_SETTINGS
+    from bitwarden_exporter import __main__ as exporter_main
+    from bitwarden_exporter import attachments, keepass
+
+    timer = PhaseTimer()
+    timer.wrap(exporter_main, "bw_exec", lambda cmd, *args, **kwargs: "bw " + " ".join(cmd[:2]))
+    timer.wrap_generator(exporter_main, "iter_bw_items")
+    timer.wrap(attachments, "download_file")
+    timer.wrap(attachments.AttachmentDownloader, "wait", lambda *args, **kwargs: "wait_for_attachments")
+    for method in ("__init__", "__enter__", "process_organizations", "process_folders", "process_no_folder_items"):
+        timer.wrap(
+            keepass.KeePassStorage, method, lambda *args, method=method, **kwargs: f"keepass.{method.strip('_')}"
+        )
+    timer.wrap(keepass.KeePassStorage, "process_bw_exports")
+    timer.wrap(keepass.KeePassStorage, "__exit__", lambda *args, **kwargs: "keepass.save")
+
+    start = time.perf_counter()
+    exporter_main.main()
+    wall_seconds = time.perf_counter() - start
+
+    report: Dict[str, Any] = {
+        "wall_seconds": round(wall_seconds, 4),
+        "phases": {
+            phase: {"seconds": round(seconds, 4), "calls": timer.calls[phase]}
+            for phase, seconds in sorted(timer.seconds.items())
+        },
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None,
+        "kdbx_bytes": os.path.getsize(BITWARDEN_SETTINGS.export_location),
+    }
+    with open(report_path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file)
+
+
+def run_export(run_dir: str, env: Dict[str, str], exporter_args: List[str]) -> Dict[str, Any]:
+    """
+    Runs one export in a fresh process and returns its phase report.
+    """
+    child_report = run_dir + ".json"
+    cmd = [sys.executable, "-m", "benchmarks.export", "--child-report", child_report, "--"]
+    cmd += ["--export-password", "benchmark", "--export-location", os.path.join(run_dir, "export.kdbx")]
+    cmd += ["--tmp-dir", os.path.join(run_dir, "tmp")] + exporter_args
+    subprocess.run(cmd, env=env, check=True, stdout=subprocess.DEVNULL)  # nosec B603
+    with open(child_report, "r", encoding="utf-8") as child_report_file:
+        report: Dict[str, Any] = json.load(child_report_file)
+    return report
+
+
+def main(argv: List[str]) -> None:
+    """
+    Generate the vault, run the exporter against it and print or write the report.
+    """
+    argv, exporter_args = split_exporter_args(argv)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--child-report", help=argparse.SUPPRESS)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per fake bw call, Default: 0")
+    parser.add_argument("--runs", type=int, default=1, help="Number of exports to run, Default: 1")
+    parser.add_argument("--vault", help="Reuse a vault generated by benchmarks.synthetic_vault")
+    parser.add_argument("--report", help="Write the report to this file instead of stdout")
+    add_shape_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.child_report:
+        prepare_exporter_import(exporter_args)
+        run_child(args.child_report)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bitwarden-exporter-benchmark-") as work_dir:
+        vault_dir = args.vault or os.path.join(work_dir, "vault")
+        counts: Optional[Dict[str, int]] = None
+        if not args.vault:
+            with contextlib.redirect_stdout(sys.stderr):
+                counts = generate_vault(vault_dir, shape_from_arguments(args))
+        install_fake_bw(os.path.join(work_dir, "bin"), vault_dir, args.latency)
+        env = dict(os.environ)
+        env["PATH"] = os.path.join(work_dir, "bin") + os.pathsep + env.get("PATH", "")
+
+        runs = [run_export(os.path.join(work_dir, f"run-{run}"), env, exporter_args) for run in range(args.runs)]
+
+    report = {
+        "benchmark": "export",
+        "vault": counts if counts is not None else {"path": args.vault},
+        "latency_seconds": args.latency,
+        "exporter_args": exporter_args,
+        "runs": runs,
+        "best_wall_seconds": min(run_report["wall_seconds"] for run_report in runs) if runs else None,
+    }
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
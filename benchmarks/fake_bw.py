@@ -0,0 +1,119 @@
+"""
+A fake `bw` CLI that serves a synthetic vault written by `benchmarks.synthetic_vault`.
+
+It supports the commands the exporter runs: `status`, `list <object>`, `get attachment` and `serve`
+(a minimal Vault Management API). Every call sleeps for `FAKE_BW_LATENCY` seconds first, to model the
+startup cost of the real Node.js CLI. The vault directory is read from `FAKE_BW_VAULT`.
+
+This file only uses the standard library, it is executed directly by the `bw` wrapper that
+`install_fake_bw` writes.
+
+Functions:
+    install_fake_bw(bin_dir: str, vault_dir: str, latency: float) -> str:
+        Writes a `bw` executable that runs this fake into `bin_dir`.
+"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List
+
+
+def install_fake_bw(bin_dir: str, vault_dir: str, latency: float) -> str:
+    """
+    Writes a `bw` executable into `bin_dir` that serves `vault_dir`, returns its path.
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, "bw")
+    with open(path, "w", encoding="utf-8") as wrapper:
+        wrapper.write(
+            "#!/bin/sh\n"
+            f"FAKE_BW_VAULT='{os.path.abspath(vault_dir)}' FAKE_BW_LATENCY='{latency}'"
+            f" exec '{sys.executable}' '{os.path.abspath(__file__)}' \"$@\"\n"
+        )
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def _vault_path(*parts: str) -> str:
+    return os.path.join(os.environ["FAKE_BW_VAULT"], *parts)
+
+
+class _VaultManagementApi(BaseHTTPRequestHandler):
+    """
+    The subset of the Vault Management API used by the exporter
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        return
+
+    def __send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Answers status, list and attachment requests
+        """
+        time.sleep(float(os.environ.get("FAKE_BW_LATENCY", "0")) / 10)
+        path = urllib.parse.urlsplit(self.path).path.strip("/").split("/")
+        if path == ["status"]:
+            with open(_vault_path("status.json"), "rb") as status_file:
+                template = status_file.read()
+            self.__send(200, b'{"success":true,"data":{"object":"template","template":' + template + b"}}")
+        elif len(path) == 3 and path[:2] == ["list", "object"] and os.path.exists(_vault_path(f"{path[2]}.json")):
+            with open(_vault_path(f"{path[2]}.json"), "rb") as list_file:
+                data = list_file.read()
+            self.__send(200, b'{"success":true,"data":{"object":"list","data":' + data + b"}}")
+        elif (
+            len(path) == 3
+            and path[:2] == ["object", "attachment"]
+            and os.path.exists(_vault_path("attachments", path[2]))
+        ):
+            with open(_vault_path("attachments", path[2]), "rb") as attachment_file:
+                self.__send(200, attachment_file.read(), "application/octet-stream")
+        else:
+            self.__send(404, json.dumps({"success": False, "message": "Not found."}).encode())
+
+
+def main(argv: List[str]) -> int:
+    """
+    Run one fake `bw` command.
+    """
+    args = [arg for arg in argv if arg != "--raw"]
+    if args[:1] == ["serve"]:
+        port = int(args[args.index("--port") + 1]) if "--port" in args else 8087
+        ThreadingHTTPServer(("127.0.0.1", port), _VaultManagementApi).serve_forever()
+        return 0
+
+    time.sleep(float(os.environ.get("FAKE_BW_LATENCY", "0")))
+    if args == ["status"]:
+        source = _vault_path("status.json")
+    elif len(args) == 2 and args[0] == "list" and os.path.exists(_vault_path(f"{args[1]}.json")):
+        source = _vault_path(f"{args[1]}.json")
+    elif len(args) >= 3 and args[:2] == ["get", "attachment"] and "--output" in args:
+        output = args[args.index("--output") + 1]
+        shutil.copyfile(_vault_path("attachments", args[2]), output)
+        print(f"Saved {output}")
+        return 0
+    else:
+        sys.stderr.write(f"Invalid command: {' '.join(args)}\n")
+        return 1
+
+    with open(source, "rb") as source_file:
+        shutil.copyfileobj(source_file, sys.stdout.buffer)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
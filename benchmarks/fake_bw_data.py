@@ -0,0 +1,195 @@
+"""
+Encrypts a synthetic vault written by `benchmarks.synthetic_vault` into a data file of the Bitwarden CLI.
+
+The data file has the layout the CLI writes since its state providers (2024), which `--bw-transport offline` reads:
+the user key protected with the session key, an RSA key pair whose private key is encrypted with the user key, the
+organization keys encrypted with its public key, and the folders, collections and items encrypted with the key they
+belong to. Every third item has its own item key, like the items of current clients, and one more item is in the
+trash. The session is returned the way `bw unlock --raw` prints it. Keys and IVs come from a seeded generator, so a
+fixture is reproducible, it is a test fixture and not a safe way to encrypt anything.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.fake_bw_data --vault vault --out data.json
+
+Functions:
+    write_data_file(vault_dir: str, data_file: str, seed: int = 42) -> str:
+        Encrypts the vault in `vault_dir` into `data_file` and returns the session.
+"""
+
+import argparse
+import base64
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+from typing import AbstractSet, Any, Dict, List
+
+from Cryptodome.Cipher import AES, PKCS1_OAEP
+from Cryptodome.PublicKey import RSA
+from Cryptodome.Util.Padding import pad
+
+from . import prepare_exporter_import
+
+
+class _Encryptor:
+    """
+    Encrypts with AES-256-CBC and HMAC-SHA256 like the Bitwarden clients, with IVs from a seeded generator, the
+    values named in `plain_fields` are left in plain text
+    """
+
+    def __init__(self, rng: random.Random, plain_fields: AbstractSet[str]) -> None:
+        self.rng = rng
+        self.plain_fields = plain_fields
+
+    def key(self) -> bytes:
+        """
+        Returns a new symmetric key, 32 bytes encryption key and 32 bytes MAC key
+        """
+        return self.rng.randbytes(64)
+
+    def __encrypt(self, data: bytes, key: bytes) -> List[bytes]:
+        iv = self.rng.randbytes(16)
+        encrypted = AES.new(key[:32], AES.MODE_CBC, iv).encrypt(pad(data, AES.block_size))
+        return [iv, encrypted, hmac.new(key[32:], iv + encrypted, hashlib.sha256).digest()]
+
+    def enc_string(self, data: bytes, key: bytes) -> str:
+        """
+        Returns an encrypted string of type 2, `2.iv|data|mac`
+        """
+        return "2." + "|".join(base64.b64encode(part).decode() for part in self.__encrypt(data, key))
+
+    def enc_buffer(self, data: bytes, key: bytes) -> bytes:
+        """
+        Returns an encrypted buffer, the type byte 2 followed by IV, MAC and data
+        """
+        iv, encrypted, mac = self.__encrypt(data, key)
+        return bytes([2]) + iv + mac + encrypted
+
+    def tree(self, value: Any, key: bytes, name: str = "") -> Any:
+        """
+        Encrypts the strings of an item the data file keeps encrypted, `object` is not stored
+        """
+        if isinstance(value, dict):
+            return {child_name: self.tree(child, key, child_name) for child_name, child in value.items()}
+        if isinstance(value, list):
+            return [self.tree(child, key, name) for child in value]
+        if isinstance(value, str) and name not in self.plain_fields:
+            return self.enc_string(value.encode(), key)
+        return value
+
+
+def _read(vault_dir: str, name: str) -> Any:
+    with open(os.path.join(vault_dir, name), "r", encoding="utf-8") as vault_file:
+        return json.load(vault_file)
+
+
+def _cipher(encryptor: _Encryptor, item: Dict[str, Any], key: bytes, own_key: bool) -> Dict[str, Any]:
+    """
+    Returns an item as the data file stores it, encrypted with its own key if `own_key`
+    """
+    item = {name: value for name, value in item.items() if name != "object"}
+    cipher: Dict[str, Any]
+    if own_key:
+        item_key = encryptor.key()
+        cipher = encryptor.tree(item, item_key)
+        cipher["key"] = encryptor.enc_string(item_key, key)
+        key = item_key
+    else:
+        cipher = encryptor.tree(item, key)
+    cipher.update({"edit": True, "viewPassword": True})
+    for attachment in cipher.get("attachments") or []:
+        attachment["key"] = encryptor.enc_string(encryptor.key(), key)
+    for uri in (cipher.get("login") or {}).get("uris") or []:
+        uri["uriChecksum"] = encryptor.enc_string(hashlib.sha256(b"uri").digest(), key)
+    return cipher
+
+
+def write_data_file(vault_dir: str, data_file: str, seed: int = 42) -> str:  # pylint: disable=too-many-locals
+    """
+    Encrypts the vault in `vault_dir` into a data file of the Bitwarden CLI at `data_file` and returns the session
+    that unlocks it.
+    """
+    prepare_exporter_import()
+    # pylint: disable=import-outside-toplevel
+    from bitwarden_exporter.offline import PLAIN_ITEM_FIELDS
+
+    rng = random.Random(seed)
+    encryptor = _Encryptor(rng, PLAIN_ITEM_FIELDS)
+    status = _read(vault_dir, "status.json")
+    user_id = status["userId"]
+    session_key = encryptor.key()
+    user_key = encryptor.key()
+    rsa_key = RSA.generate(2048, randfunc=rng.randbytes)
+    organizations = _read(vault_dir, "organizations.json")
+    organization_keys = {organization["id"]: encryptor.key() for organization in organizations}
+
+    ciphers: Dict[str, Dict[str, Any]] = {}
+    for index, item in enumerate(_read(vault_dir, "items.json")):
+        key = organization_keys[item["organizationId"]] if item.get("organizationId") else user_key
+        ciphers[item["id"]] = _cipher(encryptor, item, key, own_key=index % 3 == 0)
+    if ciphers:
+        trashed = dict(next(iter(ciphers.values())), id="trashed-item", deletedDate=status["lastSync"])
+        ciphers[trashed["id"]] = trashed
+
+    oaep = PKCS1_OAEP.new(rsa_key.publickey())
+    data = {
+        "global_account_activeAccountId": user_id,
+        "global_account_accounts": {user_id: {"email": status["userEmail"], "name": "Fake User"}},
+        f"__PROTECTED__{user_id}_user_auto": base64.b64encode(encryptor.enc_buffer(user_key, session_key)).decode(),
+        f"user_{user_id}_sync_lastSync": status["lastSync"],
+        f"user_{user_id}_crypto_privateKey": encryptor.enc_string(rsa_key.export_key("DER", pkcs=8), user_key),
+        f"user_{user_id}_crypto_organizationKeys": {
+            organization_id: {"type": "organization", "key": "4." + base64.b64encode(oaep.encrypt(key)).decode()}
+            for organization_id, key in organization_keys.items()
+        },
+        f"user_{user_id}_organizations_organizations": {
+            organization["id"]: {**{k: v for k, v in organization.items() if k != "object"}, "usePolicies": True}
+            for organization in organizations
+        },
+        f"user_{user_id}_collection_collections": {
+            collection["id"]: {
+                "id": collection["id"],
+                "organizationId": collection["organizationId"],
+                "name": encryptor.enc_string(
+                    collection["name"].encode(), organization_keys[collection["organizationId"]]
+                ),
+                "externalId": collection.get("externalId"),
+                "readOnly": False,
+            }
+            for collection in _read(vault_dir, "collections.json")
+        },
+        f"user_{user_id}_folder_folders": {
+            folder["id"]: {
+                "id": folder["id"],
+                "name": encryptor.enc_string(folder["name"].encode(), user_key),
+                "revisionDate": status["lastSync"],
+            }
+            for folder in _read(vault_dir, "folders.json")
+            if folder["id"]
+        },
+        f"user_{user_id}_ciphers_ciphers": ciphers,
+    }
+    with open(data_file, "w", encoding="utf-8") as data_out:
+        json.dump(data, data_out, indent=2)
+    return base64.b64encode(session_key).decode()
+
+
+def main(argv: List[str]) -> None:
+    """
+    Write the data file and print the session.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vault", required=True, help="Directory of a vault written by benchmarks.synthetic_vault")
+    parser.add_argument("--out", required=True, help="Data file to write")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the keys and IVs, Default: 42")
+    args = parser.parse_args(argv)
+    with contextlib.redirect_stdout(sys.stderr):
+        session = write_data_file(args.vault, args.out, args.seed)
+    print(session)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
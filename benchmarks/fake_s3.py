@@ -0,0 +1,337 @@
+"""
+A fake S3 compatible storage that keeps its buckets in memory, for checking uploads with `--s3-url`.
+
+It supports the requests the exporter sends: PUT, GET and DELETE of an object, multipart uploads, and
+`ListObjectsV2` with a prefix, a delimiter and continuation tokens. Lists are cut into pages of `page_size` keys, so
+a client has to follow the continuation tokens. Every request must be signed with AWS Signature Version 4 for the
+access key of the storage and carry the SHA-256 of its payload, and a Content-MD5 is checked when it is sent. Errors
+are answered with the codes S3 uses. With `fail_every`, every n-th request is answered with 503 SlowDown, to exercise
+the retries of the client.
+
+This file only uses the standard library.
+
+Usage:
+    python -m benchmarks.fake_s3 --port 9000 --access-key benchmark --secret-key benchmark
+
+Classes:
+    FakeS3: The fake storage, an HTTP server that runs in a background thread.
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import re
+import sys
+import threading
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Tuple, Type
+from xml.sax.saxutils import escape
+
+_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+_AUTHORIZATION = re.compile(
+    r"AWS4-HMAC-SHA256 Credential=(?P<access_key>[^/]+)/(?P<scope>[^,]+), ?"
+    r"SignedHeaders=(?P<signed_headers>[^,]+), ?Signature=(?P<signature>[0-9a-f]{64})"
+)
+
+
+class _S3Error(Exception):
+    """
+    An error answered to the client
+    """
+
+    def __init__(self, status: int, code: str) -> None:
+        super().__init__(code)
+        self.status = status
+        self.code = code
+
+
+class FakeS3(ThreadingHTTPServer):  # pylint: disable=too-many-instance-attributes
+    """
+    An in memory S3 compatible storage on `127.0.0.1:port`, a port of 0 picks a free one
+
+    Use it as a context manager to serve requests in a background thread. `objects` maps `bucket/key` to the content
+    of every stored object, `uploads` holds the parts of the multipart uploads that are neither completed nor aborted.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, access_key: str, secret_key: str, port: int = 0, page_size: int = 1000, fail_every: int = 0
+    ) -> None:
+        super().__init__(("127.0.0.1", port), _S3Api)
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.page_size = page_size
+        self.fail_every = fail_every
+        self.objects: Dict[str, bytes] = {}
+        self.uploads: Dict[str, Dict[int, bytes]] = {}
+        self.counts: Dict[str, int] = {"requests": 0, "failed": 0, "parts": 0, "list_pages": 0}
+        self.lock = threading.Lock()
+        self.__thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """
+        The endpoint of the storage
+        """
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self) -> "FakeS3":
+        self.__thread = threading.Thread(target=self.serve_forever, name="fake-s3", daemon=True)
+        self.__thread.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.shutdown()
+        self.server_close()
+        if self.__thread is not None:
+            self.__thread.join()
+
+
+class _S3Api(BaseHTTPRequestHandler):
+    """
+    The subset of the S3 API used by the exporter
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: FakeS3
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        return
+
+    def __send(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body:
+            self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __verify(self, path: str, query: List[Tuple[str, str]], body: bytes) -> None:
+        """
+        Checks the signature, the payload hash and the Content-MD5 of a request
+        """
+        authorization = _AUTHORIZATION.fullmatch(self.headers.get("authorization", ""))
+        if authorization is None or "x-amz-date" not in self.headers:
+            raise _S3Error(403, "AccessDenied")
+        if authorization["access_key"] != self.server.access_key:
+            raise _S3Error(403, "InvalidAccessKeyId")
+        payload_hash = self.headers.get("x-amz-content-sha256", "")
+        if payload_hash != hashlib.sha256(body).hexdigest():
+            raise _S3Error(400, "XAmzContentSHA256Mismatch")
+        signed_headers = authorization["signed_headers"].split(";")
+        if "host" not in signed_headers or any(name not in self.headers for name in signed_headers):
+            raise _S3Error(403, "SignatureDoesNotMatch")
+        canonical_request = "\n".join(
+            [
+                self.command,
+                path,
+                "&".join(f"{_quote(name)}={_quote(value)}" for name, value in sorted(query)),
+                "".join(f"{name}:{self.headers[name].strip()}\n" for name in signed_headers),
+                authorization["signed_headers"],
+                payload_hash,
+            ]
+        )
+        string_to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                self.headers["x-amz-date"],
+                authorization["scope"],
+                hashlib.sha256(canonical_request.encode()).hexdigest(),
+            ]
+        )
+        signing_key = f"AWS4{self.server.secret_key}".encode()
+        for scope_part in authorization["scope"].split("/"):
+            signing_key = hmac.new(signing_key, scope_part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(signature, authorization["signature"]):
+            raise _S3Error(403, "SignatureDoesNotMatch")
+        content_md5 = self.headers.get("content-md5")
+        if content_md5 is not None and content_md5 != _content_md5(body):
+            raise _S3Error(400, "BadDigest")
+
+    def __handle(self) -> None:
+        body = self.rfile.read(int(self.headers.get("content-length", "0")))
+        with self.server.lock:
+            self.server.counts["requests"] += 1
+            fail = self.server.fail_every > 0 and self.server.counts["requests"] % self.server.fail_every == 0
+            if fail:
+                self.server.counts["failed"] += 1
+        try:
+            if fail:
+                raise _S3Error(503, "SlowDown")
+            url = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qsl(url.query, keep_blank_values=True)
+            self.__verify(url.path, query, body)
+            bucket, _, key = urllib.parse.unquote(url.path).lstrip("/").partition("/")
+            self.__dispatch(bucket, key, dict(query), body)
+        except _S3Error as e:
+            self.__send(
+                e.status,
+                f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{e.code}</Code></Error>'.encode(),
+            )
+
+    def __dispatch(self, bucket: str, key: str, query: Dict[str, str], body: bytes) -> None:
+        # pylint: disable=too-many-branches
+        if not key:
+            if self.command == "GET" and query.get("list-type") == "2":
+                self.__send(200, self.__list(bucket, query))
+                return
+            raise _S3Error(405, "MethodNotAllowed")
+        name = f"{bucket}/{key}"
+        with self.server.lock:
+            if self.command == "PUT" and "uploadId" in query:
+                if query["uploadId"] not in self.server.uploads:
+                    raise _S3Error(404, "NoSuchUpload")
+                self.server.uploads[query["uploadId"]][int(query["partNumber"])] = body
+                self.server.counts["parts"] += 1
+                self.__send(200, headers={"ETag": f'"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'})
+            elif self.command == "PUT":
+                self.server.objects[name] = body
+                self.__send(200, headers={"ETag": f'"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'})
+            elif self.command == "POST" and "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                self.server.uploads[upload_id] = {}
+                self.__send(200, _xml("InitiateMultipartUploadResult", f"<UploadId>{upload_id}</UploadId>"))
+            elif self.command == "POST" and "uploadId" in query:
+                self.__send(200, self.__complete(name, query["uploadId"], body))
+            elif self.command == "DELETE" and "uploadId" in query:
+                if self.server.uploads.pop(query["uploadId"], None) is None:
+                    raise _S3Error(404, "NoSuchUpload")
+                self.__send(204)
+            elif self.command == "DELETE":
+                self.server.objects.pop(name, None)
+                self.__send(204)
+            elif self.command == "GET" and name in self.server.objects:
+                self.__send(200, self.server.objects[name])
+            elif self.command == "GET":
+                raise _S3Error(404, "NoSuchKey")
+            else:
+                raise _S3Error(405, "MethodNotAllowed")
+
+    def __complete(self, name: str, upload_id: str, body: bytes) -> bytes:
+        """
+        Joins the parts of a multipart upload in the order of the request, after checking their ETags
+        """
+        parts = self.server.uploads.get(upload_id)
+        if parts is None:
+            raise _S3Error(404, "NoSuchUpload")
+        listed = re.findall(r"<PartNumber>(\d+)</PartNumber><ETag>\"?([0-9a-f]{32})\"?</ETag>", body.decode())
+        numbers = [int(number) for number, _ in listed]
+        if not listed or numbers != sorted(set(numbers)):
+            raise _S3Error(400, "InvalidPartOrder")
+        digests = []
+        for number, etag in listed:
+            part = parts.get(int(number))
+            if part is None or hashlib.md5(part, usedforsecurity=False).hexdigest() != etag:
+                raise _S3Error(400, "InvalidPart")
+            digests.append(bytes.fromhex(etag))
+        self.server.objects[name] = b"".join(parts[number] for number in numbers)
+        del self.server.uploads[upload_id]
+        etag = f"{hashlib.md5(b''.join(digests), usedforsecurity=False).hexdigest()}-{len(numbers)}"
+        return _xml("CompleteMultipartUploadResult", f"<ETag>&quot;{etag}&quot;</ETag>")
+
+    def __list(self, bucket: str, query: Dict[str, str]) -> bytes:  # pylint: disable=too-many-locals
+        """
+        Lists one page of the keys and common prefixes under a prefix, in key order
+        """
+        prefix = query.get("prefix", "")
+        delimiter = query.get("delimiter", "")
+        with self.server.lock:
+            self.server.counts["list_pages"] += 1
+            sizes = {name: len(data) for name, data in self.server.objects.items()}
+        entries: Dict[str, Optional[int]] = {}
+        for name in sorted(sizes):
+            name_bucket, _, key = name.partition("/")
+            if name_bucket != bucket or not key.startswith(prefix):
+                continue
+            rest = key[len(prefix) :]
+            if delimiter and delimiter in rest:
+                entries[prefix + rest[: rest.index(delimiter) + len(delimiter)]] = None
+            else:
+                entries[key] = sizes[name]
+        start_after = ""
+        if "continuation-token" in query:
+            start_after = base64.urlsafe_b64decode(query["continuation-token"]).decode()
+        remaining = [(entry, size) for entry, size in entries.items() if entry > start_after]
+        page = remaining[: min(self.server.page_size, int(query.get("max-keys", "1000")))]
+        truncated = len(page) < len(remaining)
+        content = f"<Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+        content += f"<IsTruncated>{str(truncated).lower()}</IsTruncated>"
+        if truncated:
+            token = base64.urlsafe_b64encode(page[-1][0].encode()).decode()
+            content += f"<NextContinuationToken>{token}</NextContinuationToken>"
+        for entry, size in page:
+            if size is None:
+                content += f"<CommonPrefixes><Prefix>{escape(entry)}</Prefix></CommonPrefixes>"
+            else:
+                content += f"<Contents><Key>{escape(entry)}</Key><Size>{size}</Size></Contents>"
+        return _xml("ListBucketResult", content)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """
+        Answers object downloads and lists
+        """
+        self.__handle()
+
+    def do_PUT(self) -> None:  # pylint: disable=invalid-name
+        """
+        Answers object and part uploads
+        """
+        self.__handle()
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """
+        Answers the start and the completion of multipart uploads
+        """
+        self.__handle()
+
+    def do_DELETE(self) -> None:  # pylint: disable=invalid-name
+        """
+        Answers object deletes and aborted multipart uploads
+        """
+        self.__handle()
+
+
+def _quote(value: str) -> str:
+    return urllib.parse.quote(value, safe="-_.~")
+
+
+def _content_md5(data: bytes) -> str:
+    return base64.b64encode(hashlib.md5(data, usedforsecurity=False).digest()).decode()
+
+
+def _xml(root: str, content: str) -> bytes:
+    return f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{_NAMESPACE}">{content}</{root}>'.encode()
+
+
+def main(argv: List[str]) -> None:
+    """
+    Serve a fake storage until interrupted.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9000, help="Default: 9000")
+    parser.add_argument("--access-key", default="benchmark", help="Default: benchmark")
+    parser.add_argument("--secret-key", default="benchmark", help="Default: benchmark")
+    parser.add_argument("--page-size", type=int, default=1000, help="Keys per list page, Default: 1000")
+    parser.add_argument("--fail-every", type=int, default=0, help="Answer every n-th request with 503, Default: 0")
+    args = parser.parse_args(argv)
+    with FakeS3(args.access_key, args.secret_key, args.port, args.page_size, args.fail_every) as storage:
+        print(f"Serving {storage.url}", file=sys.stderr)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
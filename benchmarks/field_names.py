@@ -0,0 +1,82 @@
+"""
+Benchmark for renaming duplicate custom field and attachment names in KeePassStorage.
+
+Builds items with hundreds of custom fields that share a few names, as vaults imported from other managers often do,
+and times KeePassStorage.process_no_folder_items, which gives every duplicate a stable `name-N` suffix.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.field_names --items 200 --fields 500 --distinct 5
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from . import prepare_exporter_import
+
+
+def main() -> None:
+    """
+    Run the benchmark and print the result as JSON.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=200, help="Number of items, Default: 200")
+    parser.add_argument("--fields", type=int, default=500, help="Number of custom fields per item, Default: 500")
+    parser.add_argument("--distinct", type=int, default=5, help="Number of distinct field names per item, Default: 5")
+    args = parser.parse_args()
+
+    prepare_exporter_import()
+    from bitwarden_exporter.bw_models import BwField, BwItem  # pylint: disable=import-outside-toplevel
+    from bitwarden_exporter.keepass import KeePassStorage, unique_names  # pylint: disable=import-outside-toplevel
+
+    logging.disable(logging.WARNING)
+
+    items = [
+        BwItem(
+            revisionDate="2024-01-01T00:00:00.000Z",
+            creationDate="2024-01-01T00:00:00.000Z",
+            object="item",
+            id=f"item-{index}",
+            type=2,
+            reprompt=0,
+            name=f"Item {index}",
+            favorite=False,
+            fields=[
+                BwField(name=f"field-{field % max(1, args.distinct)}", value=f"value-{field}", type=0)
+                for field in range(args.fields)
+            ],
+        )
+        for index in range(args.items)
+    ]
+
+    start = time.perf_counter()
+    for item in items:
+        unique_names([field.name for field in item.fields], set())
+    unique_names_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = KeePassStorage(os.path.join(tmp_dir, "benchmark.kdbx"), "benchmark")
+        with storage:
+            start = time.perf_counter()
+            storage.process_no_folder_items(items)
+            process_seconds = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                "benchmark": "field_names",
+                "items": args.items,
+                "fields": args.fields,
+                "distinct": args.distinct,
+                "unique_names_seconds": round(unique_names_seconds, 4),
+                "process_no_folder_items_seconds": round(process_seconds, 4),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
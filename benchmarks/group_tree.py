@@ -0,0 +1,71 @@
+"""
+Benchmark for resolving nested collection groups in KeePassStorage.
+
+Builds an organization with many nested collections (`team-N/project-N/env-N`) and times
+KeePassStorage.process_organizations, which resolves every collection path through the group index.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.group_tree --collections 20000 --depth 3
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from . import prepare_exporter_import
+
+
+def main() -> None:
+    """
+    Run the benchmark and print the result as JSON.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collections", type=int, default=20000, help="Number of collections, Default: 20000")
+    parser.add_argument("--depth", type=int, default=3, help="Number of levels per collection path, Default: 3")
+    parser.add_argument("--fanout", type=int, default=20, help="Number of siblings per level, Default: 20")
+    args = parser.parse_args()
+
+    prepare_exporter_import()
+    from bitwarden_exporter.bw_models import BwCollection, BwOrganization  # pylint: disable=import-outside-toplevel
+    from bitwarden_exporter.keepass import KeePassStorage  # pylint: disable=import-outside-toplevel
+
+    logging.disable(logging.INFO)
+
+    organization = BwOrganization(object="organization", id="org", name="Benchmark", status=2, type=0, enabled=True)
+    for index in range(args.collections):
+        names = []
+        remainder = index
+        for _ in range(args.depth):
+            names.append(f"level-{remainder % args.fanout}")
+            remainder //= args.fanout
+        names.append(f"collection-{index}")
+        collection_id = f"collection-{index}"
+        organization.collections[collection_id] = BwCollection(
+            object="collection", id=collection_id, organizationId="org", name="/".join(names)
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = KeePassStorage(os.path.join(tmp_dir, "benchmark.kdbx"), "benchmark")
+        with storage:
+            start = time.perf_counter()
+            storage.process_organizations({organization.id: organization})
+            process_seconds = time.perf_counter() - start
+
+    print(
+        json.dumps(
+            {
+                "benchmark": "group_tree",
+                "collections": args.collections,
+                "depth": args.depth,
+                "fanout": args.fanout,
+                "process_organizations_seconds": round(process_seconds, 4),
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
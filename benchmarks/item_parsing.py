@@ -0,0 +1,75 @@
+"""
+Benchmark for building BwItem models from the raw `bw list items` JSON.
+
+Generates a synthetic vault without attachments and times the ways of turning its items into models: the per-item
+constructor the exporter used to call, validating the whole list with a TypeAdapter, validating straight from the JSON
+bytes, and the deferred items the exporter routes, alone and validated afterwards, as a full export does when it writes
+their entries. Parsing the JSON is timed on its own and not included in the other numbers, except for the JSON bytes.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.item_parsing --items 100000 --repeat 3
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from . import prepare_exporter_import
+from .synthetic_vault import VaultShape, generate_vault
+
+
+def best_of(repeat: int, function: Callable[[], Any]) -> float:
+    """
+    Returns the shortest time of `repeat` runs of a function.
+    """
+    seconds: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def main() -> None:
+    """
+    Run the benchmark and print the result as JSON.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100000, help="Number of items, Default: 100000")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every method, the best is reported, Default: 3")
+    args = parser.parse_args()
+
+    prepare_exporter_import()
+    # pylint: disable=import-outside-toplevel
+    from pydantic import TypeAdapter
+
+    with contextlib.redirect_stdout(sys.stderr):
+        from bitwarden_exporter.bw_models import BwItem
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with contextlib.redirect_stdout(sys.stderr):
+            generate_vault(tmp_dir, VaultShape(items=args.items, attachment_ratio=0.0))
+        with open(os.path.join(tmp_dir, "items.json"), "rb") as items_file:
+            raw_items = items_file.read()
+    bw_item_dicts: List[Dict[str, Any]] = json.loads(raw_items)
+    items_adapter = TypeAdapter(List[BwItem])
+
+    methods: Dict[str, Callable[[], Any]] = {
+        "json_loads": lambda: json.loads(raw_items),
+        "per_item_constructor": lambda: [BwItem(**bw_item_dict) for bw_item_dict in bw_item_dicts],
+        "type_adapter_python": lambda: items_adapter.validate_python(bw_item_dicts),
+        "type_adapter_json_bytes": lambda: items_adapter.validate_json(raw_items),
+        "deferred": lambda: [BwItem.deferred(bw_item_dict) for bw_item_dict in bw_item_dicts],
+        "deferred_validated": lambda: [BwItem.deferred(bw_item_dict).validated() for bw_item_dict in bw_item_dicts],
+    }
+    results = {name: round(best_of(args.repeat, method), 4) for name, method in methods.items()}
+    print(json.dumps({"benchmark": "item_parsing", "items": args.items, "json_bytes": len(raw_items), **results}))
+
+
+if __name__ == "__main__":
+    main()
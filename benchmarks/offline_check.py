@@ -0,0 +1,136 @@
+"""
+Checks that an export with `--bw-transport offline` writes the same KeePass database as one with `--bw-transport cli`.
+
+Generates a vault with `benchmarks.synthetic_vault`, serves it with the fake `bw` of `benchmarks.fake_bw` and
+encrypts it into a data file with `benchmarks.fake_bw_data`. The vault is exported once through the fake CLI and once
+from the data file, then both databases are compared entry by entry: group path, fields, custom properties and the
+content of every attachment. JSON attachments, like the raw Bitwarden snapshot, are compared with their lists sorted
+by id, since `bw` and the data file sort the objects by name and the fake CLI returns them in file order. The
+trashed item of the data file must not be exported. Prints the differences and exits with status 1 if there are any.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.offline_check --items 500 -- --max-memory
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+from pykeepass import PyKeePass  # type: ignore
+
+from . import split_exporter_args
+from .export import run_export
+from .fake_bw import install_fake_bw
+from .fake_bw_data import write_data_file
+from .synthetic_vault import add_shape_arguments, generate_vault, shape_from_arguments
+
+
+def _sorted_by_id(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {name: _sorted_by_id(child) for name, child in value.items()}
+    if isinstance(value, list):
+        children = [_sorted_by_id(child) for child in value]
+        if all(isinstance(child, dict) and "id" in child for child in children):
+            children.sort(key=lambda child: str(child["id"]))
+        return children
+    return value
+
+
+def _attachment_digest(data: bytes) -> str:
+    """
+    Returns the sha256 of an attachment, of its JSON with the lists sorted by id if it is JSON
+    """
+    try:
+        data = json.dumps(_sorted_by_id(json.loads(data)), sort_keys=True).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_entries(kdbx_path: str, password: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """
+    Returns the entries of a database keyed by group path and title.
+    """
+    entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for entry in PyKeePass(kdbx_path, password=password).entries:
+        key = ("/".join(entry.group.path or []), entry.title or "")
+        if key in entries:
+            key = (key[0], f"{key[1]} ({entry.uuid})")
+        entries[key] = {
+            "username": entry.username,
+            "password": entry.password,
+            "url": entry.url,
+            "otp": entry.otp,
+            "notes": entry.notes,
+            "custom_properties": sorted(entry.custom_properties.items()),
+            "attachments": sorted(
+                (attachment.filename, _attachment_digest(attachment.data)) for attachment in entry.attachments
+            ),
+        }
+    return entries
+
+
+def compare(
+    expected: Dict[Tuple[str, str], Dict[str, Any]], actual: Dict[Tuple[str, str], Dict[str, Any]]
+) -> List[str]:
+    """
+    Returns a line per difference between the entries of two databases.
+    """
+    differences = [f"only in the cli export: {key}" for key in sorted(expected.keys() - actual.keys())]
+    differences += [f"only in the offline export: {key}" for key in sorted(actual.keys() - expected.keys())]
+    for key in sorted(expected.keys() & actual.keys()):
+        differences += [
+            f"{key} {name}: {value!r} != {actual[key][name]!r}"
+            for name, value in expected[key].items()
+            if value != actual[key][name]
+        ]
+    return differences
+
+
+def main(argv: List[str]) -> None:
+    """
+    Export the same vault through the fake CLI and from its data file and compare the databases.
+    """
+    argv, exporter_args = split_exporter_args(argv)
+
+    parser = argparse.ArgumentParser()
+    add_shape_arguments(parser)
+    parser.set_defaults(items=300)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bitwarden-exporter-offline-check-") as work_dir:
+        vault_dir = os.path.join(work_dir, "vault")
+        with contextlib.redirect_stdout(sys.stderr):
+            counts = generate_vault(vault_dir, shape_from_arguments(args))
+        data_file = os.path.join(work_dir, "data.json")
+        session = write_data_file(vault_dir, data_file, args.seed)
+        install_fake_bw(os.path.join(work_dir, "bin"), vault_dir, 0.0)
+        env = dict(os.environ)
+        env["PATH"] = os.path.join(work_dir, "bin") + os.pathsep + env.get("PATH", "")
+
+        cli_dir = os.path.join(work_dir, "cli")
+        run_export(cli_dir, env, ["--bw-transport", "cli"] + exporter_args)
+        offline_dir = os.path.join(work_dir, "offline")
+        run_export(
+            offline_dir,
+            dict(env, BW_SESSION=session),
+            ["--bw-transport", "offline", "--bw-data-file", data_file] + exporter_args,
+        )
+
+        cli_entries = read_entries(os.path.join(cli_dir, "export.kdbx"), "benchmark")
+        differences = compare(cli_entries, read_entries(os.path.join(offline_dir, "export.kdbx"), "benchmark"))
+
+    print(json.dumps({"vault": counts, "entries": len(cli_entries), "differences": len(differences)}))
+    for difference in differences:
+        print(difference, file=sys.stderr)
+    if differences:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
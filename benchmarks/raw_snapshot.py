@@ -0,0 +1,98 @@
+"""
+Benchmark for the encodings of the raw Bitwarden JSON snapshot stored in the export entry.
+
+Generates a synthetic vault without attachments, then for every snapshot format writes the raw lists into a fresh KDBX
+through KeePassStorage.process_bw_exports and measures the encoding time, the save time, the KDBX size and the time to
+open the KDBX again. Save and open include the key derivation, which is the same for every format.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.raw_snapshot --items 20000 --formats pretty compact gzip zstd
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from . import prepare_exporter_import
+from .synthetic_vault import VaultShape, generate_vault
+
+
+def main() -> None:  # pylint: disable=too-many-locals
+    """
+    Run the benchmark and print the result as JSON.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=20000, help="Number of items, Default: 20000")
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        default=["pretty", "compact", "gzip", "zstd"],
+        help="Snapshot formats to compare, Default: pretty compact gzip zstd",
+    )
+    parser.add_argument("--split", action="store_true", help="Split the items per organization")
+    args = parser.parse_args()
+
+    prepare_exporter_import()
+    # pylint: disable=import-outside-toplevel
+    from pykeepass import PyKeePass  # type: ignore
+
+    from bitwarden_exporter.keepass import KeePassStorage
+    from bitwarden_exporter.snapshot import SnapshotArchive, encode_snapshot, snapshot_name
+
+    logging.disable(logging.INFO)
+    results: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vault_dir = os.path.join(tmp_dir, "vault")
+        with contextlib.redirect_stdout(sys.stderr):
+            generate_vault(vault_dir, VaultShape(items=args.items, attachment_ratio=0.0))
+        raw_lists: Dict[str, Any] = {}
+        for name in ("status.json", "organizations.json", "collections.json", "folders.json", "items.json"):
+            with open(os.path.join(vault_dir, name), "r", encoding="utf-8") as raw_file:
+                raw_lists[name] = json.load(raw_file)
+
+        for snapshot_format in args.formats:
+            kdbx_file = os.path.join(tmp_dir, f"{snapshot_format}.kdbx")
+            with SnapshotArchive(tmp_dir, snapshot_format, 8 * 1024 * 1024) as snapshots:
+                start = time.perf_counter()
+                raw_snapshots: Dict[str, Any] = {
+                    snapshot_name(name, snapshot_format): encode_snapshot(value, snapshot_format)
+                    for name, value in raw_lists.items()
+                    if name != "items.json"
+                }
+                for item in raw_lists["items.json"]:
+                    organization_id = item.get("organizationId") or "my-vault"
+                    snapshots.append(f"items-{organization_id}.json" if args.split else "items.json", item)
+                raw_snapshots.update(snapshots.close())
+                encode_seconds = time.perf_counter() - start
+
+                storage = KeePassStorage(kdbx_file, "benchmark")
+                storage.__enter__()  # pylint: disable=unnecessary-dunder-call
+                storage.process_bw_exports(raw_snapshots)
+                start = time.perf_counter()
+                storage.__exit__(None, None, None)
+                save_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            PyKeePass(kdbx_file, "benchmark")
+            open_seconds = time.perf_counter() - start
+            results.append(
+                {
+                    "format": snapshot_format,
+                    "encode_seconds": round(encode_seconds, 4),
+                    "save_seconds": round(save_seconds, 4),
+                    "open_seconds": round(open_seconds, 4),
+                    "kdbx_bytes": os.path.getsize(kdbx_file),
+                }
+            )
+
+    print(json.dumps({"benchmark": "raw_snapshot", "items": args.items, "split": args.split, "results": results}))
+
+
+if __name__ == "__main__":
+    main()
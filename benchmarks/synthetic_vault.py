@@ -0,0 +1,234 @@
+"""
+Generates synthetic Bitwarden vaults for the benchmarks.
+
+The vault is written to a directory in the shape the `bw` CLI returns it, one JSON file per `bw list` command
+(`folders.json`, `organizations.json`, `collections.json`, `items.json`), `status.json`, and the attachment payloads
+in `attachments/<attachment id>`. All objects are built with the `bw_models` schemas. Attachments report the size of
+their encrypted payload, like Bitwarden does, not the size of the file `bw get attachment` writes.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.synthetic_vault --out vault --items 100000 --organizations 5
+
+Classes:
+    VaultShape: The counts and sizes of a synthetic vault.
+
+Functions:
+    generate_vault(out_dir: str, shape: VaultShape) -> Dict[str, int]:
+        Writes a synthetic vault to a directory and returns its object counts.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import uuid
+from dataclasses import dataclass, fields
+from typing import Any, Dict, List
+
+from . import prepare_exporter_import
+
+
+@dataclass
+class VaultShape:  # pylint: disable=too-many-instance-attributes
+    """
+    The counts and sizes of a synthetic vault
+    """
+
+    organizations: int = 2
+    collections: int = 10
+    folders: int = 10
+    items: int = 1000
+    fields: int = 3
+    uris: int = 2
+    fido2_ratio: float = 0.05
+    attachment_ratio: float = 0.1
+    attachment_size: int = 64 * 1024
+    nesting: int = 2
+    seed: int = 42
+
+
+def generate_vault(out_dir: str, shape: VaultShape) -> Dict[str, int]:  # pylint: disable=too-many-locals
+    """
+    Writes a synthetic vault to `out_dir` and returns the number of generated objects of each kind.
+    """
+    prepare_exporter_import()
+    # pylint: disable=import-outside-toplevel
+    from bitwarden_exporter.bw_models import (
+        BwCollection,
+        BwField,
+        BwFolder,
+        BwItem,
+        BwItemAttachment,
+        BwItemLogin,
+        BwItemLoginFido2Credentials,
+        BwItemLoginUri,
+        BwOrganization,
+    )
+
+    rng = random.Random(shape.seed)
+
+    def new_id() -> str:
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    def nested_name(prefix: str, index: int) -> str:
+        parents = [f"{prefix}-group-{(index // (4**level)) % 4}" for level in range(shape.nesting, 0, -1)]
+        return "/".join(parents + [f"{prefix}-{index}"])
+
+    os.makedirs(os.path.join(out_dir, "attachments"), exist_ok=True)
+    timestamp = "2024-01-01T00:00:00.000Z"
+
+    organizations = [
+        BwOrganization(object="organization", id=new_id(), name=f"Organization {index}", status=2, type=0, enabled=True)
+        for index in range(shape.organizations)
+    ]
+    collections = [
+        BwCollection(
+            object="collection",
+            id=new_id(),
+            organizationId=organizations[index % len(organizations)].id,
+            name=nested_name("collection", index),
+        )
+        for index in range(shape.collections if organizations else 0)
+    ]
+    folders = [
+        BwFolder(object="folder", id=new_id(), name=nested_name("folder", index)) for index in range(shape.folders)
+    ]
+    folders.append(BwFolder(object="folder", id=None, name="No Folder"))
+
+    attachment_count = 0
+    with open(os.path.join(out_dir, "items.json"), "w", encoding="utf-8") as items_file:
+        items_file.write("[")
+        for index in range(shape.items):
+            login = BwItemLogin(
+                username=f"user-{index}@example.com",
+                password=f"password-{rng.getrandbits(64):x}",
+                totp="JBSWY3DPEHPK3PXP" if index % 10 == 0 else None,
+                uris=[
+                    BwItemLoginUri(match=None, uri=f"https://site-{index}-{uri}.example.com")
+                    for uri in range(shape.uris)
+                ],
+            )
+            if rng.random() < shape.fido2_ratio:
+                login.fido2Credentials = [
+                    BwItemLoginFido2Credentials(
+                        credentialId=new_id(),
+                        keyType="public-key",
+                        keyAlgorithm="ECDSA",
+                        keyCurve="P-256",
+                        keyValue=f"{rng.getrandbits(256):x}",
+                        rpId="example.com",
+                        userHandle=f"{rng.getrandbits(64):x}",
+                        userName=f"user-{index}",
+                        counter="0",
+                        rpName="Example",
+                        userDisplayName=f"User {index}",
+                        discoverable="true",
+                        creationDate=timestamp,
+                    )
+                ]
+            item = BwItem(
+                revisionDate=timestamp,
+                creationDate=timestamp,
+                object="item",
+                id=new_id(),
+                type=1,
+                reprompt=0,
+                name=f"Item {index}",
+                notes=f"Notes of item {index}",
+                favorite=False,
+                login=login,
+                fields=[
+                    BwField(name=f"field-{field % max(1, shape.fields // 2)}", value=f"value-{field}", type=field % 2)
+                    for field in range(shape.fields)
+                ],
+            )
+            if collections and index % 2 == 0:
+                collection = collections[index % len(collections)]
+                item.organizationId = collection.organizationId
+                item.collectionIds = [collection.id]
+            elif index % 3 != 0 and len(folders) > 1:
+                item.folderId = folders[index % (len(folders) - 1)].id
+            if rng.random() < shape.attachment_ratio:
+                attachment_id = new_id()
+                with open(os.path.join(out_dir, "attachments", attachment_id), "wb") as attachment_file:
+                    attachment_file.write(rng.randbytes(shape.attachment_size))
+                # Bitwarden reports the size of the encrypted file, type byte, IV, MAC and the padded content
+                encrypted_size = 1 + 16 + 32 + 16 * (shape.attachment_size // 16 + 1)
+                item.attachments = [
+                    BwItemAttachment(
+                        id=attachment_id,
+                        fileName=f"attachment-{index}.bin",
+                        size=str(encrypted_size),
+                        sizeName=f"{encrypted_size} B",
+                        url=f"https://example.com/attachments/{attachment_id}",
+                    )
+                ]
+                attachment_count += 1
+            item_dict = item.model_dump(exclude={"attachments": {"__all__": {"local_file_path"}}})
+            items_file.write(("" if index == 0 else ",") + json.dumps(item_dict))
+        items_file.write("]")
+
+    def write(name: str, value: Any) -> None:
+        with open(os.path.join(out_dir, name), "w", encoding="utf-8") as out_file:
+            json.dump(value, out_file)
+
+    write("organizations.json", [organization.model_dump(exclude={"collections"}) for organization in organizations])
+    write("collections.json", [collection.model_dump(exclude={"items"}) for collection in collections])
+    write("folders.json", [folder.model_dump(exclude={"items"}) for folder in folders])
+    write(
+        "status.json",
+        {
+            "serverUrl": None,
+            "lastSync": timestamp,
+            "userEmail": "benchmark@example.com",
+            "userId": new_id(),
+            "status": "unlocked",
+        },
+    )
+    return {
+        "organizations": len(organizations),
+        "collections": len(collections),
+        "folders": len(folders),
+        "items": shape.items,
+        "attachments": attachment_count,
+    }
+
+
+def add_shape_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds one command line option per field of VaultShape.
+    """
+    for shape_field in fields(VaultShape):
+        parser.add_argument(
+            f"--{shape_field.name.replace('_', '-')}",
+            type=type(shape_field.default),
+            default=shape_field.default,
+            help=f"Default: {shape_field.default}",
+        )
+
+
+def shape_from_arguments(args: argparse.Namespace) -> VaultShape:
+    """
+    Builds a VaultShape from the options added by add_shape_arguments.
+    """
+    values: Dict[str, Any] = {shape_field.name: getattr(args, shape_field.name) for shape_field in fields(VaultShape)}
+    return VaultShape(**values)
+
+
+def main(argv: List[str]) -> None:
+    """
+    Generate a vault and print its object counts as JSON.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", required=True, help="Directory to write the vault to")
+    add_shape_arguments(parser)
+    args = parser.parse_args(argv)
+    with contextlib.redirect_stdout(sys.stderr):
+        counts = generate_vault(args.out, shape_from_arguments(args))
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,132 @@
+"""
+Checks an upload with `--s3-url` against the fake storage of `benchmarks.fake_s3`.
+
+Generates a vault with `benchmarks.synthetic_vault`, serves it with the fake `bw` of `benchmarks.fake_bw` and runs
+the exporter twice with `--s3-keep 1` and a sidecar file larger than a part, so the sidecar is uploaded as a multipart
+upload. The storage cuts lists into small pages and fails some requests with 503, so the exporter has to follow the
+continuation tokens and retry. Afterwards only the backup set of the second run may be left, next to an object under
+the prefix that is not in a backup set, and its `backup.json` must list the database and the sidecar with the size
+and SHA-256 of the stored objects and of the local files. Prints the problems and exits with status 1 if there are any.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.upload_check --items 200 -- --max-memory
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from . import split_exporter_args
+from .export import run_export
+from .fake_bw import install_fake_bw
+from .fake_s3 import FakeS3
+from .synthetic_vault import add_shape_arguments, generate_vault, shape_from_arguments
+
+_BUCKET = "backups"
+_PREFIX = "bitwarden/"
+_FOREIGN_KEY = f"{_BUCKET}/{_PREFIX}README.txt"
+
+
+def _sha256_file(path: str) -> str:
+    with open(path, "rb") as file_in:
+        return hashlib.file_digest(file_in, "sha256").hexdigest()
+
+
+def check_bucket(storage: FakeS3, local_files: Dict[str, str]) -> List[str]:
+    """
+    Returns a line per problem with the backup sets in the storage, `local_files` maps the file names of the last
+    backup set to the files that were uploaded.
+    """
+    problems: List[str] = []
+    if _FOREIGN_KEY not in storage.objects:
+        problems.append(f"{_FOREIGN_KEY} is not in a backup set and was deleted")
+    if storage.uploads:
+        problems.append(f"{len(storage.uploads)} multipart uploads were neither completed nor aborted")
+    backup_sets = sorted({name.split("/")[2] for name in storage.objects if name != _FOREIGN_KEY})
+    if len(backup_sets) != 1:
+        return problems + [f"expected one backup set, found {backup_sets}"]
+    set_prefix = f"{_PREFIX}{backup_sets[0]}/"
+    backup_json = storage.objects.get(f"{_BUCKET}/{set_prefix}backup.json")
+    if backup_json is None:
+        return problems + [f"{set_prefix} has no backup.json"]
+    listed = {uploaded["key"]: uploaded for uploaded in json.loads(backup_json)["files"]}
+    stored = {name[len(_BUCKET) + 1 :] for name in storage.objects if name.startswith(f"{_BUCKET}/{set_prefix}")}
+    if stored - listed.keys() != {f"{set_prefix}backup.json"}:
+        problems.append(f"backup.json lists {sorted(listed)}, the set holds {sorted(stored)}")
+    for file_name, path in local_files.items():
+        uploaded = listed.get(set_prefix + file_name)
+        data = storage.objects.get(f"{_BUCKET}/{set_prefix}{file_name}")
+        if uploaded is None or data is None:
+            problems.append(f"{file_name} is missing from the backup set")
+            continue
+        expected = {"size": os.path.getsize(path), "sha256": _sha256_file(path)}
+        for actual_from, actual in (
+            ("backup.json", {"size": uploaded["size"], "sha256": uploaded["sha256"]}),
+            ("the stored object", {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}),
+        ):
+            if actual != expected:
+                problems.append(f"{file_name} in {actual_from} is {actual}, the local file is {expected}")
+    return problems
+
+
+def main(argv: List[str]) -> None:  # pylint: disable=too-many-locals
+    """
+    Export a vault twice into the fake storage and check what is left in it.
+    """
+    argv, exporter_args = split_exporter_args(argv)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sidecar-mib", type=int, default=12, help="Size of the sidecar file, Default: 12")
+    parser.add_argument("--page-size", type=int, default=2, help="Keys per list page of the storage, Default: 2")
+    parser.add_argument("--fail-every", type=int, default=7, help="Fail every n-th request with 503, Default: 7")
+    add_shape_arguments(parser)
+    parser.set_defaults(items=200)
+    args = parser.parse_args(argv)
+
+    with contextlib.ExitStack() as stack:
+        work_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="bitwarden-exporter-upload-check-"))
+        storage = stack.enter_context(FakeS3("benchmark", "benchmark", page_size=args.page_size))
+        storage.objects[_FOREIGN_KEY] = b"Not a backup set, kept by --s3-keep"
+        vault_dir = os.path.join(work_dir, "vault")
+        with contextlib.redirect_stdout(sys.stderr):
+            counts = generate_vault(vault_dir, shape_from_arguments(args))
+        install_fake_bw(os.path.join(work_dir, "bin"), vault_dir, 0.0)
+        sidecar = os.path.join(work_dir, "sidecar.bin")
+        with open(sidecar, "wb") as sidecar_out:
+            sidecar_out.write(os.urandom(args.sidecar_mib * 1024 * 1024))
+        env = dict(os.environ, AWS_ACCESS_KEY_ID="benchmark", AWS_SECRET_ACCESS_KEY="benchmark")
+        env["PATH"] = os.path.join(work_dir, "bin") + os.pathsep + env.get("PATH", "")
+        env.pop("AWS_SESSION_TOKEN", None)
+        upload_args = ["--s3-url", f"{storage.url}/{_BUCKET}/{_PREFIX}", "--s3-keep", "1", "--s3-part-size-mib", "5"]
+        upload_args += ["--s3-sidecar", sidecar, "--bw-retries", "5"]
+
+        storage.fail_every = args.fail_every
+        runs: List[Dict[str, Any]] = []
+        for run in range(2):
+            # backup sets are named by the second they start in
+            time.sleep(1.0 - time.time() % 1.0)
+            runs.append(run_export(os.path.join(work_dir, f"run-{run}"), env, upload_args + exporter_args))
+        storage.fail_every = 0
+
+        problems = check_bucket(
+            storage, {"export.kdbx": os.path.join(work_dir, "run-1", "export.kdbx"), "sidecar.bin": sidecar}
+        )
+        if storage.counts["parts"] < 2 * -(-args.sidecar_mib // 5):
+            problems.append(f"only {storage.counts['parts']} parts were uploaded, the sidecar was not split")
+        if args.fail_every and storage.counts["failed"] == 0:
+            problems.append("no request failed, the retries were not exercised")
+
+    print(json.dumps({"vault": counts, "storage": storage.counts, "problems": len(problems)}))
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
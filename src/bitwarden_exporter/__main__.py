@@ -2,29 +2,104 @@
 This script interacts with the Bitwarden CLI to export data from a Bitwarden vault.
 
 Functions:
-    bw_exec(cmd: List[str], ret_encoding: str = "UTF-8", env_vars: Optional[Dict[str, str]] = None) -> str:
-        Executes a Bitwarden CLI command and returns the output as a string.
-    
-    main() -> None:
-        Main function that handles the export process, including fetching organizations,
+    count_entries(bw_organizations: Dict[str, BwOrganization], bw_folders: Dict[str, BwFolder],
+      no_folder_items: List[BwItem]) -> int:
+        Returns the number of entries the items make in the KeePass database.
+
+    list_objects(object_name: str, prefetched: Dict[str, Any]) -> Any:
+        Returns the objects of a `bw list` command, unless they were fetched ahead.
+
+    prefetch_lists(journal: ExportJournal, retrier: Retrier) -> Dict[str, Any]:
+        Fetches the folders, organizations and collections concurrently with the asyncio client.
+
+    fetch_folders(journal: ExportJournal, prefetched: Dict[str, Any]) -> Dict[str, BwFolder]:
+        Fetches the folders of the vault.
+
+    fetch_organizations(raw_items: Dict[str, Any], journal: ExportJournal, prefetched: Dict[str, Any])
+      -> Dict[str, BwOrganization]:
+        Fetches the organizations of the vault together with their collections.
+
+    iter_bw_items(snapshots: SnapshotArchive, storage: Optional[KeePassStorage], journal: ExportJournal,
+      downloader: AttachmentDownloader) -> Iterator[BwItem]:
+        Streams the items from Bitwarden, writing their raw JSON to the snapshots and downloading their attachments.
+
+    items_snapshots(bw_organizations: Dict[str, BwOrganization]) -> List[str]:
+        Returns the names of the raw item snapshots.
+
+    fetch_status() -> Dict[str, Any]:
+        Returns the status of the vault, which has to be unlocked.
+
+    open_journal(bw_current_status: Dict[str, Any]) -> ExportJournal:
+        Opens the journal of the export, resuming an earlier run if asked to.
+
+    open_attachment_cache(journal: Optional[ExportJournal]) -> AttachmentCache:
+        Opens the attachment cache, adopting the attachments recorded in the journal.
+
+    open_list_cache() -> ListCache:
+        Opens the encrypted cache of the `bw list` answers.
+
+    open_uploader() -> BackupUploader:
+        Opens the upload of the backup set of the run to --s3-url.
+
+    finish_upload(uploader: Optional[BackupUploader]) -> None:
+        Completes the backup set and prunes old ones.
+
+    export_shards(...) -> None:
+        Builds one KeePass database per organization and one for "My Vault" in a process pool.
+
+    export_vault(exit_stack: contextlib.ExitStack, retrier: Retrier) -> None:
+        Handles the export process, including fetching organizations,
           collections, items, and folders from the Bitwarden vault.
 
+    verify_vault(exit_stack: contextlib.ExitStack, retrier: Retrier) -> None:
+        Compares the export with the vault and reports missing, extra and differing items.
+
+    write_metrics(success: bool) -> None:
+        Writes the metrics of the run to --metrics-out.
+
+    export_batch(config_file: str) -> None:
+        Exports the accounts of a batch config in parallel processes.
+
+    main() -> None:
+        Main function that sets up the Bitwarden transport and runs the export.
+
 Raises:
     BitwardenException: If there is an error executing a Bitwarden CLI command or if the vault is not unlocked.
 """
 
+import asyncio
+import contextlib
+import functools
 import json
 import logging
-import os.path
-from typing import Any, Dict, List
+import os
+from typing import IO, Any, Awaitable, Callable, Dict, Iterator, List, Optional
 
 from . import BITWARDEN_SETTINGS, BitwardenException
+from .async_client import AsyncBwClient
+from .attachment_cache import AttachmentCache
+from .attachments import AttachmentDownloader
+from .batch import load_batch_config, run_batch
 from .bw_models import BwCollection, BwFolder, BwItem, BwOrganization
-from .cli import bw_exec, download_file
+from .cli import bw_exec, bw_list, set_transport
+from .journal import ExportJournal
+from .kdf import KdfParameters, kdf_parameters_from_settings
 from .keepass import KeePassStorage
+from .list_cache import CachingTransport, ListCache, clear_list_cache
+from .metrics import METRICS, peak_memory_bytes
+from .progress import PROGRESS, reporter_bar
+from .retry import Retrier, RetryingTransport, RetryPolicy
+from .shards import MY_VAULT_SHARD, ShardJob, build_shards, shard_location, write_manifest
+from .snapshot import SnapshotArchive, encode_snapshot, snapshot_name
+from .transport import start_transport
+from .upload import BackupUploader, S3Client, parse_s3_url
+from .verify import ExportVerifier
 
 LOGGER = logging.getLogger(__name__)
 
+RAW_ARCHIVE_SPOOL_SIZE = 8 * 1024 * 1024
+LOW_MEMORY_SPOOL_SIZE = 64 * 1024
+
 
 def add_items_to_folder(bw_folders: Dict[str, BwFolder], bw_item: BwItem) -> None:
     """
@@ -60,33 +135,132 @@ def add_items_to_organization(bw_organizations: Dict[str, BwOrganization], bw_it
         raise BitwardenException(f"Item {bw_item.name} belongs to multiple collections, but duplicates are not allowed")
 
 
-def main() -> None:  # pylint: disable=too-many-locals
+def items_snapshot(bw_item_dict: Dict[str, Any]) -> str:
     """
-    Main function that handles the export process, including fetching organizations,
+    Returns the name of the raw snapshot an item is written to.
     """
+    if not BITWARDEN_SETTINGS.raw_snapshot_split and not BITWARDEN_SETTINGS.shard_by_organization:
+        return "items.json"
+    if bw_item_dict.get("organizationId"):
+        return f"items-{bw_item_dict['organizationId']}.json"
+    return "items-my-vault.json"
 
-    raw_items: Dict[str, Any] = {}
-    bw_current_status = json.loads(bw_exec(["status"]))
-    raw_items["status.json"] = bw_current_status
 
-    if bw_current_status["status"] != "unlocked":
-        raise BitwardenException("Vault is not unlocked")
-    LOGGER.debug("Vault status: %s", json.dumps(bw_current_status))
+def items_snapshots(bw_organizations: Dict[str, BwOrganization]) -> List[str]:
+    """
+    Returns the names of all raw item snapshots, so they exist even if they get no items.
+    """
+    if not BITWARDEN_SETTINGS.raw_snapshot_split and not BITWARDEN_SETTINGS.shard_by_organization:
+        return ["items.json"]
+    return ["items-my-vault.json"] + [f"items-{organization_id}.json" for organization_id in bw_organizations]
+
+
+def iter_bw_items(
+    snapshots: SnapshotArchive,
+    storage: Optional[KeePassStorage],
+    journal: ExportJournal,
+    downloader: AttachmentDownloader,
+) -> Iterator[BwItem]:
+    """
+    Streams the items from Bitwarden one by one, their raw JSON is written to the snapshots as they pass and the
+    downloads of their attachments are started.
+
+    An item is validated here only if its attachments are downloaded or its entry is written from this very model,
+    all others are built from their routing fields and validated once their entry is written, if it is: the items the
+    previous export holds in the same revision, which mostly keep their entry, the items of --shard-by-organization,
+    validated in the shard workers, and the items of --max-memory, which keeps only their routing fields and reads
+    an item again from the journal when its entry is built. An item with attachments keeps the paths of its downloads,
+    a shard worker can not wait for them.
+    """
+    for offset, bw_item_dict in journal.iter_items(lambda: bw_list("items")):
+        snapshots.append(items_snapshot(bw_item_dict), bw_item_dict)
+        PROGRESS.advance("list_items")
+        load = functools.partial(journal.load_item, offset) if BITWARDEN_SETTINGS.max_memory else None
+        if storage is not None and storage.holds_revision(bw_item_dict["id"], bw_item_dict["revisionDate"]):
+            METRICS.increment("items_unchanged_total")
+        elif bw_item_dict.get("attachments") or (storage is not None and load is None):
+            bw_item = BwItem.model_validate(bw_item_dict)
+            downloader.submit(bw_item)
+            if load is None:
+                yield bw_item
+                continue
+        yield BwItem.deferred(bw_item_dict, load)
 
-    bw_folders_dict = json.loads((bw_exec(["list", "folders"])))
+
+def count_entries(
+    bw_organizations: Dict[str, BwOrganization], bw_folders: Dict[str, BwFolder], no_folder_items: List[BwItem]
+) -> int:
+    """
+    Returns the number of entries the items make, an item in several collections makes one in each of them.
+    """
+    return (
+        sum(
+            len(collection.items)
+            for organization in bw_organizations.values()
+            for collection in organization.collections.values()
+        )
+        + sum(len(folder.items) for folder in bw_folders.values())
+        + len(no_folder_items)
+    )
+
+
+def list_objects(object_name: str, prefetched: Dict[str, Any]) -> Any:
+    """
+    Returns the objects of `bw list <object_name>`, unless they were fetched ahead.
+    """
+    if object_name in prefetched:
+        return prefetched[object_name]
+    return json.loads(bw_exec(["list", object_name]))
+
+
+def prefetch_lists(journal: ExportJournal, retrier: Retrier) -> Dict[str, Any]:
+    """
+    Fetches the lists the journal does not hold concurrently with the asyncio client, if it is enabled.
+    """
+    if not BITWARDEN_SETTINGS.bw_async:
+        return {}
+    client = AsyncBwClient(retrier, BITWARDEN_SETTINGS.download_workers)
+    fetches: Dict[str, Callable[[], Awaitable[List[Dict[str, Any]]]]] = {
+        "folders": client.list_folders,
+        "organizations": client.list_organizations,
+        "collections": client.list_collections,
+    }
+    missing = [object_name for object_name in fetches if not journal.completed(object_name)]
+
+    async def fetch_all() -> List[List[Dict[str, Any]]]:
+        return list(await asyncio.gather(*(fetches[object_name]() for object_name in missing)))
+
+    with METRICS.phase("prefetch_lists"):
+        return dict(zip(missing, asyncio.run(fetch_all())))
+
+
+def fetch_folders(journal: ExportJournal, prefetched: Dict[str, Any]) -> Dict[str, BwFolder]:
+    """
+    Fetches the folders of the vault.
+    """
+    with METRICS.phase("list_folders"):
+        bw_folders_dict = journal.phase("folders", lambda: list_objects("folders", prefetched))
     bw_folders: Dict[str, BwFolder] = {folder["id"]: BwFolder(**folder) for folder in bw_folders_dict}
     LOGGER.info("Total Folders Fetched: %s", len(bw_folders))
+    return bw_folders
 
-    no_folder_items: List[BwItem] = []
 
-    bw_organizations_dict = json.loads((bw_exec(["list", "organizations"])))
+def fetch_organizations(
+    raw_items: Dict[str, Any], journal: ExportJournal, prefetched: Dict[str, Any]
+) -> Dict[str, BwOrganization]:
+    """
+    Fetches the organizations of the vault together with their collections.
+    """
+    with METRICS.phase("list_organizations"):
+        bw_organizations_dict = journal.phase("organizations", lambda: list_objects("organizations", prefetched))
     raw_items["organizations.json"] = bw_organizations_dict
     bw_organizations: Dict[str, BwOrganization] = {
         organization["id"]: BwOrganization(**organization) for organization in bw_organizations_dict
     }
     LOGGER.info("Total Organizations Fetched: %s", len(bw_organizations))
 
-    bw_collections_dict = json.loads((bw_exec(["list", "collections"])))
+    with METRICS.phase("list_collections"):
+        bw_collections_dict = journal.phase("collections", lambda: list_objects("collections", prefetched))
     raw_items["collections.json"] = bw_collections_dict
     LOGGER.info("Total Collections Fetched: %s", len(bw_collections_dict))
 
@@ -94,45 +268,416 @@ def main() -> None:  # pylint: disable=too-many-locals
         bw_collection = BwCollection(**bw_collection_dict)
         organization = bw_organizations[bw_collection.organizationId]
         organization.collections[bw_collection.id] = bw_collection
+    return bw_organizations
 
-    bw_items_dict: List[Dict[str, Any]] = json.loads((bw_exec(["list", "items"])))
-    raw_items["items.json"] = bw_items_dict
-
-    LOGGER.info("Total Items Fetched: %s", len(bw_items_dict))
-    for bw_item_dict in bw_items_dict:
-        bw_item = BwItem(**bw_item_dict)
-        LOGGER.debug("Processing Item %s", bw_item.name)
-        if bw_item.attachments and len(bw_item.attachments) > 0:
-            for attachment in bw_item.attachments:
-                attachment.local_file_path = os.path.join(BITWARDEN_SETTINGS.tmp_dir, bw_item.id, attachment.id)
-                LOGGER.info(
-                    "%s:: Downloading Attachment %s to %s",
-                    bw_item.name,
-                    attachment.fileName,
-                    attachment.local_file_path,
-                )
-                download_file(bw_item.id, attachment.id, attachment.local_file_path)
 
-        if bw_item.organizationId and not bw_item.folderId:
-            add_items_to_organization(bw_organizations, bw_item)
-        elif not bw_item.organizationId and bw_item.folderId:
-            add_items_to_folder(bw_folders, bw_item)
-        else:
-            no_folder_items.append(bw_item)
+def fetch_status() -> Dict[str, Any]:
+    """
+    Returns the status of the vault, it has to be unlocked.
+    """
+    with METRICS.phase("status"):
+        bw_current_status: Dict[str, Any] = json.loads(bw_exec(["status"]))
+    if bw_current_status["status"] != "unlocked":
+        raise BitwardenException("Vault is not unlocked")
+    LOGGER.debug("Vault status: %s", json.dumps(bw_current_status))
+    return bw_current_status
+
+
+def open_journal(bw_current_status: Dict[str, Any]) -> ExportJournal:
+    """
+    Opens the journal of the export in the temporary directory, it belongs to the vault user and export location and
+    is encrypted with the export password.
+    """
+    os.makedirs(BITWARDEN_SETTINGS.tmp_dir, exist_ok=True)
+    return ExportJournal(
+        os.path.join(BITWARDEN_SETTINGS.tmp_dir, "journal"),
+        {
+            "server_url": bw_current_status.get("serverUrl"),
+            "user_id": bw_current_status.get("userId"),
+            "export_location": os.path.abspath(BITWARDEN_SETTINGS.export_location),
+        },
+        BITWARDEN_SETTINGS.export_password,
+        BITWARDEN_SETTINGS.resume,
+        keep_items=BITWARDEN_SETTINGS.max_memory,
+    )
+
 
-    LOGGER.info("Total Items Fetched: %s", len(bw_items_dict))
+def open_attachment_cache(journal: Optional[ExportJournal] = None) -> AttachmentCache:
+    """
+    Opens the attachment cache, with the attachments an earlier run recorded in the journal, if there is one.
+    """
+    cache = AttachmentCache(
+        BITWARDEN_SETTINGS.attachment_cache_dir,
+        max_bytes=(
+            BITWARDEN_SETTINGS.attachment_cache_max_mib * 1024 * 1024
+            if BITWARDEN_SETTINGS.attachment_cache_max_mib is not None
+            else None
+        ),
+        max_age_days=BITWARDEN_SETTINGS.attachment_cache_max_age_days,
+        on_store=journal.record_attachment if journal is not None else None,
+    )
+    if journal is not None:
+        cache.adopt(journal.attachments())
+    return cache
+
+
+def open_list_cache() -> ListCache:
+    """
+    Opens the cache of `bw list` answers, encrypted with the export password.
+    """
+    return ListCache(
+        BITWARDEN_SETTINGS.list_cache_dir,
+        BITWARDEN_SETTINGS.export_password,
+        max_bytes=(
+            BITWARDEN_SETTINGS.list_cache_max_mib * 1024 * 1024
+            if BITWARDEN_SETTINGS.list_cache_max_mib is not None
+            else None
+        ),
+    )
+
+
+def open_uploader() -> BackupUploader:
+    """
+    Opens the upload of this run's backup set to the bucket of --s3-url, with the shard manifest as a sidecar.
+    """
+    endpoint, bucket, prefix = parse_s3_url(str(BITWARDEN_SETTINGS.s3_url))
+    retrier = Retrier(
+        RetryPolicy(
+            timeout=BITWARDEN_SETTINGS.bw_timeout,
+            min_bytes_per_second=BITWARDEN_SETTINGS.bw_min_throughput_kib * 1024,
+            retries=BITWARDEN_SETTINGS.bw_retries,
+        )
+    )
+    sidecars = list(BITWARDEN_SETTINGS.s3_sidecars)
+    if BITWARDEN_SETTINGS.shard_manifest:
+        sidecars.insert(0, BITWARDEN_SETTINGS.shard_manifest)
+    return BackupUploader(
+        S3Client(endpoint, bucket, BITWARDEN_SETTINGS.s3_region, retrier),
+        prefix,
+        part_size=BITWARDEN_SETTINGS.s3_part_size_mib * 1024 * 1024,
+        parallelism=BITWARDEN_SETTINGS.s3_parallelism,
+        keep=BITWARDEN_SETTINGS.s3_keep,
+        sidecars=sidecars,
+    )
+
+
+def finish_upload(uploader: Optional[BackupUploader]) -> None:
+    """
+    Waits for the files of the backup set, uploads the sidecars and prunes old sets.
+    """
+    if uploader is not None:
+        with METRICS.phase("upload"):
+            uploader.finish()
+
+
+def export_shards(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    bw_organizations: Dict[str, BwOrganization],
+    bw_folders: Dict[str, BwFolder],
+    no_folder_items: List[BwItem],
+    raw_items: Dict[str, Any],
+    item_snapshots: Dict[str, IO[bytes]],
+    kdf: KdfParameters,
+    on_saved: Optional[Callable[[str], None]] = None,
+) -> None:
+    """
+    Builds one KeePass database per organization and one for "My Vault" in a process pool, each with the raw JSON
+    of its own items only. `on_saved` is called with every shard file as soon as it is saved.
+    """
+    snapshot_format = BITWARDEN_SETTINGS.raw_snapshot_format
+
+    def raw_snapshots(items_snapshot_name: str, raw_lists: Dict[str, Any]) -> Dict[str, bytes]:
+        encoded = {
+            snapshot_name(name, snapshot_format): encode_snapshot(value, snapshot_format)
+            for name, value in {"status.json": raw_items["status.json"], **raw_lists}.items()
+        }
+        encoded[snapshot_name("items.json", snapshot_format)] = item_snapshots[
+            snapshot_name(items_snapshot_name, snapshot_format)
+        ].read()
+        return encoded
+
+    jobs: List[ShardJob] = [
+        ShardJob(
+            name=organization.id,
+            organization_id=organization.id,
+            organization_name=organization.name,
+            kdbx_file=shard_location(BITWARDEN_SETTINGS.export_location, organization.id),
+            kdbx_password=BITWARDEN_SETTINGS.export_password,
+            incremental=BITWARDEN_SETTINGS.incremental,
+            kdf=kdf,
+            organizations={organization.id: organization},
+            raw_snapshots=raw_snapshots(
+                f"items-{organization.id}.json",
+                {
+                    "organizations.json": [
+                        raw for raw in raw_items["organizations.json"] if raw["id"] == organization.id
+                    ],
+                    "collections.json": [
+                        raw for raw in raw_items["collections.json"] if raw["organizationId"] == organization.id
+                    ],
+                },
+            ),
+            items=sum(len(collection.items) for collection in organization.collections.values()),
+        )
+        for organization in bw_organizations.values()
+    ]
+    jobs.append(
+        ShardJob(
+            name=MY_VAULT_SHARD,
+            organization_name="My Vault",
+            kdbx_file=shard_location(BITWARDEN_SETTINGS.export_location, MY_VAULT_SHARD),
+            kdbx_password=BITWARDEN_SETTINGS.export_password,
+            incremental=BITWARDEN_SETTINGS.incremental,
+            kdf=kdf,
+            folders=list(bw_folders.values()),
+            no_folder_items=no_folder_items,
+            raw_snapshots=raw_snapshots("items-my-vault.json", {}),
+            items=sum(len(folder.items) for folder in bw_folders.values()) + len(no_folder_items),
+        )
+    )
+
+    results = build_shards(jobs, BITWARDEN_SETTINGS.shard_workers, on_saved)
+    if BITWARDEN_SETTINGS.shard_manifest:
+        write_manifest(BITWARDEN_SETTINGS.shard_manifest, results)
+
+
+def export_vault(exit_stack: contextlib.ExitStack, retrier: Retrier) -> None:  # pylint: disable=too-many-locals
+    """
+    Handles the export process, including fetching organizations,
+      collections, items, and folders from the Bitwarden vault.
+
+    The stages overlap: attachment downloads start while items are still streamed from Bitwarden, and entries are
+    built in a fixed order as soon as the attachments of their item are on disk.
+    """
+
+    raw_items: Dict[str, Any] = {}
+    bw_current_status = fetch_status()
+    raw_items["status.json"] = bw_current_status
+
+    journal = exit_stack.enter_context(open_journal(bw_current_status))
 
-    with KeePassStorage(BITWARDEN_SETTINGS.export_location, BITWARDEN_SETTINGS.export_password) as storage:
-        storage.process_organizations(bw_organizations)
-        storage.process_folders(bw_folders)
-        storage.process_no_folder_items(no_folder_items)
-        storage.process_bw_exports(raw_items)
+    prefetched = prefetch_lists(journal, retrier)
+    bw_folders = fetch_folders(journal, prefetched)
+    bw_organizations = fetch_organizations(raw_items, journal, prefetched)
+    no_folder_items: List[BwItem] = []
+
+    snapshots = exit_stack.enter_context(
+        SnapshotArchive(
+            BITWARDEN_SETTINGS.tmp_dir,
+            BITWARDEN_SETTINGS.raw_snapshot_format,
+            LOW_MEMORY_SPOOL_SIZE if BITWARDEN_SETTINGS.max_memory else RAW_ARCHIVE_SPOOL_SIZE,
+        )
+    )
+    for items_snapshot_name in items_snapshots(bw_organizations):
+        snapshots.add_array(items_snapshot_name)
+    downloader = exit_stack.enter_context(
+        AttachmentDownloader(
+            open_attachment_cache(journal),
+            BITWARDEN_SETTINGS.download_workers,
+            AsyncBwClient(retrier, BITWARDEN_SETTINGS.download_workers) if BITWARDEN_SETTINGS.bw_async else None,
+        )
+    )
+
+    with METRICS.phase("calibrate_kdf"):
+        kdf = kdf_parameters_from_settings(BITWARDEN_SETTINGS)
+
+    storage: Optional[KeePassStorage] = None
+    if not BITWARDEN_SETTINGS.shard_by_organization:
+        with METRICS.phase("open_previous_export"):
+            storage = KeePassStorage(
+                BITWARDEN_SETTINGS.export_location,
+                BITWARDEN_SETTINGS.export_password,
+                incremental=BITWARDEN_SETTINGS.incremental,
+                wait_for_attachments=downloader.wait,
+                kdf=kdf,
+            )
+
+    total_items = 0
+    with METRICS.phase("list_items"), PROGRESS.phase("list_items"):
+        for bw_item in iter_bw_items(snapshots, storage, journal, downloader):
+            LOGGER.debug("Processing Item %s", bw_item.name)
+            total_items += 1
+            if bw_item.organizationId and not bw_item.folderId:
+                add_items_to_organization(bw_organizations, bw_item)
+            elif not bw_item.organizationId and bw_item.folderId:
+                add_items_to_folder(bw_folders, bw_item)
+            else:
+                no_folder_items.append(bw_item)
+
+    LOGGER.info("Total Items Fetched: %s", total_items)
+    METRICS.set_gauge("items_fetched", total_items)
+
+    uploader = exit_stack.enter_context(open_uploader()) if BITWARDEN_SETTINGS.s3_url is not None else None
+    if storage is None:
+        downloader.wait_all()
+        with METRICS.phase("build_shards"):
+            export_shards(
+                bw_organizations,
+                bw_folders,
+                no_folder_items,
+                raw_items,
+                snapshots.close(),
+                kdf,
+                uploader.submit if uploader is not None else None,
+            )
+        journal.finish()
+        finish_upload(uploader)
+        return
+
+    with storage:
+        with METRICS.phase("build_entries"), PROGRESS.phase(
+            "build_entries", total=count_entries(bw_organizations, bw_folders, no_folder_items)
+        ):
+            storage.process_organizations(bw_organizations)
+            storage.process_folders(bw_folders)
+            storage.process_no_folder_items(no_folder_items)
+            raw_snapshots: Dict[str, Any] = {
+                snapshot_name(name, BITWARDEN_SETTINGS.raw_snapshot_format): encode_snapshot(
+                    value, BITWARDEN_SETTINGS.raw_snapshot_format
+                )
+                for name, value in raw_items.items()
+            }
+            raw_snapshots.update(snapshots.close())
+            storage.process_bw_exports(raw_snapshots)
+    if uploader is not None:
+        uploader.submit(BITWARDEN_SETTINGS.export_location)
+    journal.finish()
+    finish_upload(uploader)
 
     # if not is_debug():
     #     LOGGER.info("Removing Temporary Directory %s", args.tmp_dir)
     #     shutil.rmtree(args.tmp_dir)
-    #     LOGGER.info("Clearing Bitwarden Cache")
-    #     bw_exec.clear_cache()
+
+
+def verify_vault(exit_stack: contextlib.ExitStack, retrier: Retrier) -> None:
+    """
+    Compares the export with the items of the vault and raises if it does not match.
+
+    Items whose attachments can only be compared by downloading them are checked once the downloads are done, all
+    others as they are streamed.
+    """
+    fetch_status()
+    cache = open_attachment_cache()
+    downloader = exit_stack.enter_context(
+        AttachmentDownloader(
+            cache,
+            BITWARDEN_SETTINGS.download_workers,
+            AsyncBwClient(retrier, BITWARDEN_SETTINGS.download_workers) if BITWARDEN_SETTINGS.bw_async else None,
+        )
+    )
+    with METRICS.phase("index_export"):
+        verifier = ExportVerifier(
+            BITWARDEN_SETTINGS.export_location, BITWARDEN_SETTINGS.export_password, cache.recorded_content
+        )
+
+    pending: List[BwItem] = []
+    with METRICS.phase("verify_items"), PROGRESS.phase("verify_items"):
+        for bw_item_dict in bw_list("items"):
+            bw_item = BwItem.model_validate(bw_item_dict)
+            if verifier.needs_download(bw_item):
+                downloader.submit(bw_item)
+                pending.append(bw_item)
+            else:
+                verifier.check(bw_item)
+            PROGRESS.advance("verify_items")
+        downloader.wait_all()
+        for bw_item in pending:
+            verifier.check(bw_item)
+
+    report = verifier.report()
+    METRICS.set_gauge("verify_items", report.items)
+    METRICS.set_gauge("verify_missing_items", len(report.missing))
+    METRICS.set_gauge("verify_extra_items", len(report.extra))
+    METRICS.set_gauge("verify_differing_items", len(report.differing))
+    LOGGER.info(
+        "Verified %s items against %s: %s missing, %s no longer in Bitwarden, %s differing",
+        report.items,
+        BITWARDEN_SETTINGS.export_location,
+        len(report.missing),
+        len(report.extra),
+        len(report.differing),
+    )
+    if not report.matches:
+        raise BitwardenException(f"The export {BITWARDEN_SETTINGS.export_location} does not match the vault")
+
+
+def write_metrics(success: bool) -> None:
+    """
+    Writes the metrics of the run, if asked to.
+    """
+    if not BITWARDEN_SETTINGS.metrics_out:
+        return
+    METRICS.set_gauge("success", 1 if success else 0)
+    peak_memory = peak_memory_bytes()
+    if peak_memory is not None:
+        METRICS.set_gauge("peak_memory_bytes", peak_memory)
+    METRICS.write(BITWARDEN_SETTINGS.metrics_out, BITWARDEN_SETTINGS.metrics_format)
+    LOGGER.info("Metrics written to %s", BITWARDEN_SETTINGS.metrics_out)
+
+
+def export_batch(config_file: str) -> None:
+    """
+    Exports the accounts of a batch config, each in its own process, and raises if any of them failed.
+    """
+    success = False
+    try:
+        with METRICS.phase("total"):
+            results = run_batch(
+                load_batch_config(config_file), BITWARDEN_SETTINGS.batch_workers, BITWARDEN_SETTINGS.tmp_dir
+            )
+        for result in results:
+            METRICS.increment("batch_accounts_succeeded_total" if result.success else "batch_accounts_failed_total")
+            METRICS.increment("batch_account_seconds_total", result.seconds)
+        failed = [result.name for result in results if not result.success]
+        if len(failed) > 0:
+            raise BitwardenException(f"Failed to export {len(failed)} accounts: {', '.join(failed)}")
+        success = True
+    finally:
+        write_metrics(success)
+
+
+def main() -> None:
+    """
+    Main function that sets up the Bitwarden transport and runs the export.
+    """
+    PROGRESS.configure(
+        BITWARDEN_SETTINGS.progress_interval,
+        bar_stream=reporter_bar(BITWARDEN_SETTINGS.progress),
+        enabled=BITWARDEN_SETTINGS.progress != "none",
+    )
+    if BITWARDEN_SETTINGS.batch_config is not None:
+        export_batch(BITWARDEN_SETTINGS.batch_config)
+        return
+    transport = start_transport(
+        BITWARDEN_SETTINGS.bw_transport,
+        BITWARDEN_SETTINGS.bw_serve_url,
+        BITWARDEN_SETTINGS.bw_serve_port,
+        BITWARDEN_SETTINGS.bw_data_file,
+    )
+    retrier = Retrier(
+        RetryPolicy(
+            timeout=BITWARDEN_SETTINGS.bw_timeout,
+            min_bytes_per_second=BITWARDEN_SETTINGS.bw_min_throughput_kib * 1024,
+            retries=BITWARDEN_SETTINGS.bw_retries,
+            time_budget=BITWARDEN_SETTINGS.bw_time_budget,
+        )
+    )
+    transport = RetryingTransport(transport, retrier)
+    if BITWARDEN_SETTINGS.clear_list_cache:
+        clear_list_cache(BITWARDEN_SETTINGS.list_cache_dir)
+    if BITWARDEN_SETTINGS.list_cache:
+        transport = CachingTransport(transport, open_list_cache())
+    set_transport(transport)
+    success = False
+    try:
+        with contextlib.ExitStack() as exit_stack, METRICS.phase("total"):
+            if BITWARDEN_SETTINGS.verify:
+                verify_vault(exit_stack, retrier)
+            else:
+                export_vault(exit_stack, retrier)
+        success = True
+    finally:
+        transport.close()
+        write_metrics(success)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+"""
+This module talks to the Bitwarden CLI from an asyncio event loop.
+
+Every call is a `bw` process started with `asyncio.create_subprocess_exec`, a semaphore limits how many run at the
+same time. Independent calls, like the lists at the start of an export or many attachment downloads, run concurrently
+on a single thread instead of one thread per call. Calls get the timeouts and retries of the shared retrier, like the
+calls of the synchronous transports.
+
+Classes:
+    AsyncBwClient: Coroutines for the Bitwarden calls of an export behind a concurrency limit.
+
+Exceptions:
+    BitwardenException:
+        Raised when a call failed on every attempt or the time budget of the run is spent.
+"""
+
+import asyncio
+import json
+import logging
+import subprocess  # nosec B404
+import time
+from typing import Any, Dict, List, Optional
+
+from . import BitwardenException
+from .metrics import METRICS
+from .retry import RETRYABLE_ERRORS, Retrier
+
+LOGGER = logging.getLogger(__name__)
+
+_READ_SIZE = 64 * 1024
+
+
+class AsyncBwClient:
+    """
+    Runs at most `concurrency` `bw` processes at a time, a client belongs to the event loop it is first used in
+
+    The output of a call may take the timeout of the retrier plus the time for the bytes received at the minimum
+    throughput, so large lists are not cut off while they keep arriving.
+    """
+
+    def __init__(self, retrier: Retrier, concurrency: int) -> None:
+        self.__retrier = retrier
+        self.__semaphore = asyncio.Semaphore(concurrency)
+
+    async def __read(self, stream: asyncio.StreamReader, timeout: float, cmd: List[str]) -> bytes:
+        """
+        Reads a stream to its end, the deadline grows with every byte received
+        """
+        start = time.monotonic()
+        chunks: List[bytes] = []
+        received = 0
+        while True:
+            allowed = timeout + received / self.__retrier.policy.min_bytes_per_second - (time.monotonic() - start)
+            if allowed <= 0:
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            try:
+                chunk = await asyncio.wait_for(stream.read(_READ_SIZE), allowed)
+            except asyncio.TimeoutError as e:
+                raise subprocess.TimeoutExpired(cmd, timeout) from e
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+            received += len(chunk)
+
+    async def __run(self, cmd: List[str], timeout: float) -> bytes:
+        """
+        Runs one `bw` process and returns its output, it is killed when it is too slow
+        """
+        LOGGER.debug("Executing CLI :: %s", " ".join(cmd))
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        if process.stdout is None or process.stderr is None:
+            raise BitwardenException(f"No output from {' '.join(cmd)}")
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+        try:
+            stdout = await self.__read(process.stdout, timeout, cmd)
+            return_code = await process.wait()
+            stderr = (await stderr_task).decode(errors="replace")
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            stderr_task.cancel()
+            raise
+        finally:
+            METRICS.increment("bw_subprocess_calls_total")
+            METRICS.increment("bw_subprocess_seconds_total", time.perf_counter() - start)
+        if len(stderr) > 0:
+            LOGGER.warning("Error executing command %s", stderr)
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, cmd, output=stdout, stderr=stderr)
+        return stdout
+
+    async def exec(self, cmd: List[str], expected_bytes: Optional[int] = None) -> bytes:
+        """
+        Runs `bw <cmd>` with retries and returns its output.
+        """
+        cmd = ["bw"] + cmd
+        what = " ".join(cmd)
+        attempt = 0
+        while True:
+            async with self.__semaphore:
+                try:
+                    return await self.__run(cmd, self.__retrier.timeout(what, expected_bytes))
+                except RETRYABLE_ERRORS as e:
+                    delay = self.__retrier.backoff(what, attempt, e)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def __list(self, object_name: str) -> List[Dict[str, Any]]:
+        """
+        Returns the objects of `bw list <object_name>`
+        """
+        objects: List[Dict[str, Any]] = json.loads(await self.exec(["list", object_name, "--raw"]))
+        return objects
+
+    async def list_folders(self) -> List[Dict[str, Any]]:
+        """
+        Returns the folders of the vault.
+        """
+        return await self.__list("folders")
+
+    async def list_organizations(self) -> List[Dict[str, Any]]:
+        """
+        Returns the organizations of the vault.
+        """
+        return await self.__list("organizations")
+
+    async def list_collections(self) -> List[Dict[str, Any]]:
+        """
+        Returns the collections of all organizations.
+        """
+        return await self.__list("collections")
+
+    async def list_items(self) -> List[Dict[str, Any]]:
+        """
+        Returns the items of the vault, as a whole, the export streams them through the transport instead.
+        """
+        return await self.__list("items")
+
+    async def get_attachment(
+        self, item_id: str, attachment_id: str, download_location: str, expected_bytes: Optional[int] = None
+    ) -> None:
+        """
+        Downloads an attachment of an item to the given location, the timeout grows with `expected_bytes`.
+        """
+        await self.exec(
+            ["get", "attachment", attachment_id, "--itemid", item_id, "--output", download_location], expected_bytes
+        )
@@ -0,0 +1,238 @@
+"""
+This module keeps downloaded Bitwarden attachments across runs.
+
+Attachments are stored by attachment id, Bitwarden gives a new id to every uploaded file, so the content of an id
+never changes. The size and SHA-256 of every stored attachment are recorded in an index, a file is only reused if it
+still matches both. Bitwarden reports the size of the encrypted attachment, not of the file `bw` writes, so the
+reported size is recorded on its own and only tells whether the attachment changed since it was stored. Downloads go
+to a temporary file that is renamed into place once it is complete, so a crashed run leaves nothing that a later run
+trusts.
+
+Classes:
+    AttachmentCache: Validated store of attachments with age and total size eviction.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+from .bw_models import BwItemAttachment
+from .metrics import METRICS
+
+LOGGER = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+OBJECTS_DIR = "objects"
+
+
+class CachedAttachment(BaseModel):
+    """
+    Index record of a stored attachment, `size` and `sha256` are those of the decrypted file, `reported_size` is the
+    size Bitwarden reported for it
+    """
+
+    size: int
+    sha256: str
+    reported_size: Optional[str] = None
+    stored_at: float
+    last_used: float
+
+
+def _file_sha256(path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as cached_file:
+        while chunk := cached_file.read(1024 * 1024):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class AttachmentCache:
+    """
+    Stores attachments by id under `cache_dir`, safe to use from several download threads, `on_store` is called
+    with every attachment stored
+
+    `close` evicts attachments not used for `max_age_days`, then the least recently used ones until the cache is not
+    larger than `max_bytes`, and saves the index. Files that are not in the index are removed.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: Optional[int] = None,
+        max_age_days: Optional[float] = None,
+        on_store: Optional[Callable[[str, CachedAttachment], None]] = None,
+    ) -> None:
+        self.__cache_dir = os.path.abspath(cache_dir)
+        self.__on_store = on_store
+        self.__objects_dir = os.path.join(self.__cache_dir, OBJECTS_DIR)
+        self.__max_bytes = max_bytes
+        self.__max_age_days = max_age_days
+        self.__lock = threading.Lock()
+        self.__index: Dict[str, CachedAttachment] = {}
+        os.makedirs(self.__objects_dir, exist_ok=True)
+        index_file = os.path.join(self.__cache_dir, INDEX_FILE)
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, "r", encoding="utf-8") as index_in:
+                    self.__index = {
+                        attachment_id: CachedAttachment(**record)
+                        for attachment_id, record in json.load(index_in).items()
+                    }
+            except (ValueError, TypeError) as e:
+                LOGGER.warning("Attachment cache index %s is unreadable, starting empty: %s", index_file, e)
+        LOGGER.info("Attachment cache %s holds %s attachments", self.__cache_dir, len(self.__index))
+
+    def adopt(self, records: Dict[str, CachedAttachment]) -> None:
+        """
+        Adds attachments stored by a run that ended before it saved the index, they are validated before use like
+        all others.
+        """
+        with self.__lock:
+            for attachment_id, record in records.items():
+                if os.path.isfile(os.path.join(self.__objects_dir, attachment_id)):
+                    self.__index.setdefault(attachment_id, record)
+
+    def path(self, attachment: BwItemAttachment) -> str:
+        """
+        Returns the location of an attachment in the cache.
+        """
+        return os.path.join(self.__objects_dir, attachment.id)
+
+    def __is_valid(self, attachment: BwItemAttachment) -> bool:
+        """
+        Checks a stored attachment against its index record, and that Bitwarden still reports the size it was stored
+        with
+        """
+        with self.__lock:
+            record = self.__index.get(attachment.id)
+        if record is None:
+            return False
+        path = self.path(attachment)
+        if (
+            record.reported_size != attachment.size
+            or not os.path.isfile(path)
+            or os.path.getsize(path) != record.size
+            or _file_sha256(path) != record.sha256
+        ):
+            LOGGER.warning("Cached attachment %s is stale or corrupt, downloading it again", attachment.fileName)
+            METRICS.increment("attachment_cache_invalid_total")
+            with self.__lock:
+                self.__index.pop(attachment.id, None)
+            return False
+        return True
+
+    def lookup(self, attachment: BwItemAttachment) -> bool:
+        """
+        Returns whether the cache holds a valid copy of the attachment, and marks it as used.
+        """
+        if not self.__is_valid(attachment):
+            return False
+        METRICS.increment("attachments_reused_total")
+        with self.__lock:
+            self.__index[attachment.id].last_used = time.time()
+        return True
+
+    def recorded_content(self, attachment: BwItemAttachment) -> Optional[Tuple[int, str]]:
+        """
+        Returns the size and SHA-256 of the decrypted attachment as the index records them, without reading the file,
+        None if the cache never stored it or stored it when Bitwarden reported another size.
+        """
+        with self.__lock:
+            record = self.__index.get(attachment.id)
+        if record is None or record.reported_size != attachment.size:
+            return None
+        return record.size, record.sha256
+
+    def part_path(self, attachment: BwItemAttachment) -> str:
+        """
+        Returns a new temporary location to download an attachment to before it is stored.
+        """
+        return f"{self.path(attachment)}.{uuid.uuid4().hex}.part"
+
+    def store(self, attachment: BwItemAttachment, part_path: str) -> str:
+        """
+        Moves a downloaded attachment into the cache and returns its location, the temporary file is removed in any
+        case.
+        """
+        path = self.path(attachment)
+        try:
+            record = CachedAttachment(
+                size=os.path.getsize(part_path),
+                sha256=_file_sha256(part_path),
+                reported_size=attachment.size,
+                stored_at=time.time(),
+                last_used=time.time(),
+            )
+            os.replace(part_path, path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        with self.__lock:
+            self.__index[attachment.id] = record
+        if self.__on_store is not None:
+            self.__on_store(attachment.id, record)
+        return path
+
+    def fetch(self, attachment: BwItemAttachment, download: Callable[[str], None]) -> str:
+        """
+        Returns the location of a valid copy of the attachment, calling `download` with a temporary location first
+        if the cache does not hold one.
+        """
+        if self.lookup(attachment):
+            return self.path(attachment)
+        part_path = self.part_path(attachment)
+        try:
+            download(part_path)
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return self.store(attachment, part_path)
+
+    def __remove(self, attachment_id: str, reason: str) -> None:
+        """
+        Removes an attachment from the index and the disk, the lock must be held
+        """
+        LOGGER.debug("Evicting attachment %s from the cache, %s", attachment_id, reason)
+        self.__index.pop(attachment_id, None)
+        path = os.path.join(self.__objects_dir, attachment_id)
+        if os.path.exists(path):
+            os.remove(path)
+        METRICS.increment("attachment_cache_evicted_total")
+
+    def close(self) -> None:
+        """
+        Evicts by age and total size, removes files not in the index and saves the index.
+        """
+        with self.__lock:
+            if self.__max_age_days is not None:
+                oldest = time.time() - self.__max_age_days * 24 * 3600
+                for attachment_id in [key for key, record in self.__index.items() if record.last_used < oldest]:
+                    self.__remove(attachment_id, "not used recently")
+
+            total_bytes = sum(record.size for record in self.__index.values())
+            if self.__max_bytes is not None and total_bytes > self.__max_bytes:
+                for attachment_id, record in sorted(self.__index.items(), key=lambda entry: entry[1].last_used):
+                    if total_bytes <= self.__max_bytes:
+                        break
+                    total_bytes -= record.size
+                    self.__remove(attachment_id, "cache is full")
+
+            for file_name in os.listdir(self.__objects_dir):
+                if file_name not in self.__index:
+                    LOGGER.debug("Removing %s from the attachment cache, it is not in the index", file_name)
+                    os.remove(os.path.join(self.__objects_dir, file_name))
+
+            index_file = os.path.join(self.__cache_dir, INDEX_FILE)
+            with open(f"{index_file}.tmp", "w", encoding="utf-8") as index_out:
+                json.dump({key: record.model_dump() for key, record in self.__index.items()}, index_out)
+            os.replace(f"{index_file}.tmp", index_file)
+            METRICS.set_gauge("attachment_cache_bytes", total_bytes)
+        LOGGER.info("Attachment cache saved, %s attachments, %s bytes", len(self.__index), total_bytes)
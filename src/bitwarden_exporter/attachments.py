@@ -0,0 +1,205 @@
+"""
+This module downloads Bitwarden attachments concurrently into the attachment cache.
+
+Downloads run in a pool of threads through the transport, or with an asyncio client as coroutines on one event loop
+thread, where the pool only validates and stores the downloaded files.
+
+Classes:
+    AttachmentDownloader: Downloads attachments in the background while the rest of the export goes on.
+
+Exceptions:
+    BitwardenException:
+        Raised when one or more attachments could not be downloaded.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from types import TracebackType
+from typing import Dict, List, Optional, Tuple, Type
+
+from . import BitwardenException
+from .async_client import AsyncBwClient
+from .attachment_cache import AttachmentCache
+from .bw_models import BwItem, BwItemAttachment
+from .cli import download_file
+from .metrics import METRICS
+from .progress import PROGRESS
+
+LOGGER = logging.getLogger(__name__)
+
+DOWNLOAD_PHASE = "download_attachments"
+
+
+def _expected_size(attachment: BwItemAttachment) -> Optional[int]:
+    return int(attachment.size) if attachment.size.isdigit() else None
+
+
+class AttachmentDownloader:
+    """
+    Downloads attachments with a bounded pool of workers
+
+    Items are submitted as soon as they are known, and `wait` blocks only until the attachments of one item are on
+    disk, so entries can be built while other downloads are still running. A failed download does not cancel the
+    others, the first `wait` that sees a failure lets every in-flight download finish and reports all failures.
+    Attachments the cache already holds are not downloaded again, the cache is closed on exit.
+
+    With an asyncio `client` the downloads run on an event loop in a background thread, the client limits how many
+    run at a time. The downloads are reported as the progress phase "download_attachments" until the exit.
+    """
+
+    def __init__(self, cache: AttachmentCache, workers: int, client: Optional[AsyncBwClient] = None) -> None:
+        self.__cache = cache
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bw-download")
+        self.__jobs: Dict[str, List[Tuple[BwItemAttachment, "Future[None]"]]] = {}
+        self.__names: Dict[str, str] = {}
+        self.__client = client
+        PROGRESS.start(DOWNLOAD_PHASE, unit="attachments")
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__loop_thread: Optional[threading.Thread] = None
+        if client is not None:
+            self.__loop = asyncio.new_event_loop()
+            self.__loop_thread = threading.Thread(target=self.__loop.run_forever, name="bw-download-loop", daemon=True)
+            self.__loop_thread.start()
+
+    def __enter__(self) -> "AttachmentDownloader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if self.__loop is not None and self.__loop_thread is not None:
+            asyncio.run_coroutine_threadsafe(self.__finish_tasks(cancel=exc_type is not None), self.__loop).result()
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            self.__loop_thread.join()
+            self.__loop.close()
+        self.__executor.shutdown(wait=True, cancel_futures=exc_type is not None)
+        PROGRESS.finish(DOWNLOAD_PHASE, summary=exc_type is None)
+        self.__cache.close()
+
+    @staticmethod
+    async def __finish_tasks(cancel: bool) -> None:
+        """
+        Waits for the downloads on the event loop, cancelling them first if the export failed
+        """
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if cancel:
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, bw_item: BwItem) -> None:
+        """
+        Sets the `local_file_path` of every attachment of the item and queues their downloads.
+        """
+        if len(bw_item.attachments) == 0 or bw_item.id in self.__jobs:
+            return
+        jobs: List[Tuple[BwItemAttachment, "Future[None]"]] = []
+        for attachment in bw_item.attachments:
+            attachment.local_file_path = self.__cache.path(attachment)
+            future: "Future[None]"
+            if self.__loop is not None:
+                future = asyncio.run_coroutine_threadsafe(self.__download_async(bw_item, attachment), self.__loop)
+            else:
+                future = self.__executor.submit(self.__download, bw_item, attachment)
+            jobs.append((attachment, future))
+        self.__jobs[bw_item.id] = jobs
+        PROGRESS.add_total(DOWNLOAD_PHASE, len(jobs), sum(_expected_size(attachment) or 0 for attachment, _ in jobs))
+        self.__names[bw_item.id] = bw_item.name
+
+    def __download(self, bw_item: BwItem, attachment: BwItemAttachment) -> None:
+        """
+        Downloads one attachment into the cache, unless it holds a valid copy, and records it in the metrics
+        """
+
+        def download(download_location: str) -> None:
+            start = time.perf_counter()
+            download_file(
+                bw_item.id,
+                attachment.id,
+                download_location,
+                expected_bytes=_expected_size(attachment),
+            )
+            METRICS.increment("attachments_downloaded_total")
+            METRICS.increment("attachment_download_seconds_total", time.perf_counter() - start)
+            METRICS.increment("downloaded_bytes_total", os.path.getsize(download_location))
+
+        self.__cache.fetch(attachment, download)
+        PROGRESS.advance(DOWNLOAD_PHASE, nbytes=_expected_size(attachment) or 0)
+
+    async def __download_async(self, bw_item: BwItem, attachment: BwItemAttachment) -> None:
+        """
+        Downloads one attachment into the cache with the asyncio client, the cache is checked and written in the pool
+        """
+        if self.__client is None:
+            raise BitwardenException("No asyncio client to download with")
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(self.__executor, self.__cache.lookup, attachment):
+            PROGRESS.advance(DOWNLOAD_PHASE, nbytes=_expected_size(attachment) or 0)
+            return
+        part_path = self.__cache.part_path(attachment)
+        start = time.perf_counter()
+        try:
+            await self.__client.get_attachment(
+                bw_item.id,
+                attachment.id,
+                part_path,
+                expected_bytes=_expected_size(attachment),
+            )
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        METRICS.increment("attachments_downloaded_total")
+        METRICS.increment("attachment_download_seconds_total", time.perf_counter() - start)
+        METRICS.increment("downloaded_bytes_total", os.path.getsize(part_path))
+        await loop.run_in_executor(self.__executor, self.__cache.store, attachment, part_path)
+        PROGRESS.advance(DOWNLOAD_PHASE, nbytes=_expected_size(attachment) or 0)
+
+    def wait(self, bw_item: BwItem) -> None:
+        """
+        Blocks until all attachments of the item are downloaded, an item that was read again after it was submitted
+        gets the `local_file_path` of its attachments.
+        """
+        jobs = self.__jobs.get(bw_item.id, [])
+        paths = {attachment.id: attachment.local_file_path for attachment, _ in jobs}
+        for attachment in bw_item.attachments:
+            attachment.local_file_path = paths.get(attachment.id, attachment.local_file_path)
+        with METRICS.phase("wait_for_attachments"):
+            wait([future for _, future in jobs])
+        for attachment, future in jobs:
+            if future.exception() is not None or not os.path.isfile(attachment.local_file_path):
+                self.wait_all()
+        if len(jobs) > 0:
+            LOGGER.debug("%s:: Downloaded %s Attachments", bw_item.name, len(jobs))
+
+    def wait_all(self) -> None:
+        """
+        Blocks until every submitted download has finished, and reports all failures.
+        """
+        LOGGER.info("Waiting for %s Attachment downloads", sum(len(jobs) for jobs in self.__jobs.values()))
+        wait([future for jobs in self.__jobs.values() for _, future in jobs])
+        failures: List[str] = []
+        for item_id, jobs in self.__jobs.items():
+            for attachment, future in jobs:
+                error = future.exception()
+                if error is not None:
+                    LOGGER.error(
+                        "%s:: Error downloading attachment %s: %s", self.__names[item_id], attachment.fileName, error
+                    )
+                elif not os.path.isfile(attachment.local_file_path):
+                    LOGGER.error(
+                        "%s:: Attachment %s is missing after download", self.__names[item_id], attachment.fileName
+                    )
+                else:
+                    continue
+                failures.append(f"{self.__names[item_id]}/{attachment.fileName}")
+
+        if len(failures) > 0:
+            raise BitwardenException(f"Failed to download {len(failures)} attachments: {', '.join(failures)}")
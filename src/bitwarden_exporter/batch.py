@@ -0,0 +1,246 @@
+"""
+This module exports several Bitwarden accounts in parallel, as described by a batch config file.
+
+The settings and the Bitwarden session of an export are global to its process, so every account is exported by its
+own `bitwarden-exporter` process. It gets its own `BITWARDENCLI_APPDATA_DIR`, the `bw` data of the account, its own
+session and environment, and its own temporary directory, log file and metrics file in the work directory of the
+batch. At most `workers` accounts are exported at the same time.
+
+The config file is JSON:
+
+    {
+        "args": ["--incremental"],
+        "accounts": [
+            {
+                "name": "alice",
+                "export_location": "/backups/alice.kdbx",
+                "export_password_file": "/secrets/alice-kdbx",
+                "appdata_dir": "/var/lib/bw/alice",
+                "session_file": "/secrets/alice-session",
+                "env": {"NODE_EXTRA_CA_CERTS": "/etc/ssl/ca.pem"},
+                "args": ["--download-workers", "8"]
+            }
+        ]
+    }
+
+`args` are passed to every export, the `args` of an account after them. The metrics of every export are written to
+its directory in the work directory, the batch reads the item count from there. The session is read from
+`session_file` or from the environment variable named by `session_env`, the export runs without `BW_SESSION` if
+neither is given.
+
+Classes:
+    BatchAccount: An account of a batch and where its session and export go.
+    BatchConfig: The accounts of a batch and the arguments of all exports.
+    AccountResult: Outcome and timing of the export of one account.
+
+Functions:
+    load_batch_config(config_file: str) -> BatchConfig:
+        Reads and checks a batch config file.
+
+    run_batch(config: BatchConfig, workers: int, work_dir: str) -> List[AccountResult]:
+        Exports the accounts of a batch in parallel and logs a summary.
+
+Exceptions:
+    BitwardenException:
+        Raised when the config file is invalid.
+"""
+
+import json
+import logging
+import os
+import re
+import subprocess  # nosec B404
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from . import BitwardenException
+from .progress import PROGRESS
+
+LOGGER = logging.getLogger(__name__)
+
+BATCH_PHASE = "batch_accounts"
+
+
+class BatchAccount(BaseModel):
+    """
+    An account of a batch, `appdata_dir` defaults to a directory of the account in the work directory
+    """
+
+    name: str
+    export_location: str
+    export_password_file: str
+    appdata_dir: Optional[str] = None
+    session_file: Optional[str] = None
+    session_env: Optional[str] = None
+    env: Dict[str, str] = {}
+    args: List[str] = []
+
+
+class BatchConfig(BaseModel):
+    """
+    Accounts of a batch, `args` are passed to the export of every account
+    """
+
+    accounts: List[BatchAccount]
+    args: List[str] = []
+
+
+class AccountResult(BaseModel):
+    """
+    Outcome of the export of one account, `items` is taken from its metrics if it wrote them
+    """
+
+    name: str
+    export_location: str
+    success: bool
+    return_code: int
+    seconds: float
+    items: Optional[int] = None
+    log_file: str
+
+
+def load_batch_config(config_file: str) -> BatchConfig:
+    """
+    Reads a batch config file, account names must be unique and usable as directory names.
+    """
+    try:
+        with open(config_file, "r", encoding="utf-8") as config_in:
+            config = BatchConfig.model_validate(json.load(config_in))
+    except (OSError, ValueError, ValidationError) as e:
+        raise BitwardenException(f"Invalid batch config {config_file}: {e}") from e
+    names = [account.name for account in config.accounts]
+    for name in names:
+        if not re.fullmatch(r"[A-Za-z0-9._-]+", name) or name in (".", ".."):
+            raise BitwardenException(f"Invalid batch config {config_file}: account name {name!r} is not a plain name")
+        if names.count(name) > 1:
+            raise BitwardenException(f"Invalid batch config {config_file}: account {name} is listed twice")
+    return config
+
+
+def _account_command(
+    account: BatchAccount, config: BatchConfig, account_dir: str
+) -> Tuple[List[str], Dict[str, str], str]:
+    """
+    Returns the command and environment of the export of an account, and the file its metrics are written to
+    """
+    metrics_file = os.path.join(account_dir, "metrics.json")
+    cmd = [
+        sys.executable,
+        "-m",
+        "bitwarden_exporter",
+        "--export-location",
+        account.export_location,
+        "--export-password-file",
+        account.export_password_file,
+        "--tmp-dir",
+        os.path.join(account_dir, "tmp"),
+        "--progress",
+        "log",
+        *config.args,
+        *account.args,
+        "--metrics-out",
+        metrics_file,
+    ]
+
+    env = dict(os.environ)
+    env.pop("BW_SESSION", None)
+    env["BITWARDENCLI_APPDATA_DIR"] = account.appdata_dir or os.path.join(account_dir, "bw-appdata")
+    if account.session_file is not None:
+        with open(account.session_file, "r", encoding="utf-8") as session_in:
+            env["BW_SESSION"] = session_in.read().strip()
+    elif account.session_env is not None:
+        if account.session_env not in os.environ:
+            raise BitwardenException(f"{account.name}:: Environment variable {account.session_env} is not set")
+        env["BW_SESSION"] = os.environ[account.session_env]
+    env.update(account.env)
+    return cmd, env, metrics_file
+
+
+def _items_fetched(metrics_file: str) -> Optional[int]:
+    """
+    Returns the number of items an export fetched from its metrics, None if it wrote none
+    """
+    if not os.path.exists(metrics_file):
+        return None
+    with open(metrics_file, "r", encoding="utf-8") as metrics_in:
+        items_fetched = json.load(metrics_in)["gauges"].get("items_fetched")
+    return int(items_fetched) if items_fetched is not None else None
+
+
+def _run_account(account: BatchAccount, config: BatchConfig, work_dir: str) -> AccountResult:
+    """
+    Exports one account in its own process, its output goes to a log file in the work directory
+    """
+    account_dir = os.path.abspath(os.path.join(work_dir, account.name))
+    os.makedirs(account_dir, exist_ok=True)
+    log_file = os.path.join(account_dir, "export.log")
+    start = time.perf_counter()
+    return_code = -1
+    items: Optional[int] = None
+    with open(log_file, "w", encoding="utf-8") as log_out:
+        try:
+            cmd, env, metrics_file = _account_command(account, config, account_dir)
+            if os.path.exists(metrics_file):
+                os.remove(metrics_file)
+            LOGGER.info("%s:: Exporting to %s", account.name, account.export_location)
+            return_code = subprocess.run(  # nosec B603
+                cmd, env=env, stdout=log_out, stderr=subprocess.STDOUT, check=False
+            ).returncode
+            items = _items_fetched(metrics_file)
+        except (OSError, ValueError, KeyError, BitwardenException) as e:
+            LOGGER.error("%s:: Error starting the export: %s", account.name, e)
+            log_out.write(f"Error starting the export: {e}\n")
+    result = AccountResult(
+        name=account.name,
+        export_location=account.export_location,
+        success=return_code == 0,
+        return_code=return_code,
+        seconds=round(time.perf_counter() - start, 3),
+        items=items,
+        log_file=log_file,
+    )
+    if result.success:
+        LOGGER.info("%s:: Exported %s items in %.1f seconds", account.name, result.items, result.seconds)
+    else:
+        LOGGER.error("%s:: Export failed with exit code %s, see %s", account.name, return_code, log_file)
+    return result
+
+
+def run_batch(config: BatchConfig, workers: int, work_dir: str) -> List[AccountResult]:
+    """
+    Exports every account of the batch, at most `workers` at a time, and logs a summary. A failed export does not
+    stop the others.
+    """
+    LOGGER.info("Exporting %s accounts with %s workers", len(config.accounts), min(workers, len(config.accounts)))
+    results: Dict[str, AccountResult] = {}
+    with PROGRESS.phase(BATCH_PHASE, unit="accounts", total=len(config.accounts)):
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bw-batch") as executor:
+            futures = [executor.submit(_run_account, account, config, work_dir) for account in config.accounts]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result.name] = result
+                PROGRESS.advance(BATCH_PHASE)
+
+    ordered = [results[account.name] for account in config.accounts]
+    for result in ordered:
+        LOGGER.info(
+            "%-20s %-7s %8.1fs %8s items  %s",
+            result.name,
+            "ok" if result.success else "FAILED",
+            result.seconds,
+            result.items if result.items is not None else "-",
+            result.export_location,
+        )
+    failed = [result for result in ordered if not result.success]
+    LOGGER.info(
+        "Batch finished: %s of %s accounts exported, %s failed, %.1f seconds of exports",
+        len(ordered) - len(failed),
+        len(ordered),
+        len(failed),
+        sum(result.seconds for result in ordered),
+    )
+    return ordered
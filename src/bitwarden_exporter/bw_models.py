@@ -13,11 +13,16 @@ Classes:
     BwOrganization: Represents a Bitwarden organization.
     BwFolder: Represents a folder in Bitwarden.
 
+Variables:
+    BW_ITEM_ROUTING_FIELDS: The item fields a deferred item is built from.
 """
 
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
+
+# Everything needed to route an item to its groups and to recognize it in a previous export
+BW_ITEM_ROUTING_FIELDS = ("id", "revisionDate", "organizationId", "folderId", "collectionIds", "name")
 
 
 class BwItemLoginFido2Credentials(BaseModel):
@@ -117,6 +122,37 @@ class BwItem(BaseModel):
     collectionIds: List[str] = []
     attachments: List[BwItemAttachment] = []
     fields: List[BwField] = []
+    _raw: Optional[Dict[str, Any]] = PrivateAttr(default=None)
+    _load: Optional[Callable[[], Dict[str, Any]]] = PrivateAttr(default=None)
+    _validated: Optional["BwItem"] = PrivateAttr(default=None)
+
+    @classmethod
+    def deferred(cls, bw_item_dict: Dict[str, Any], load: Optional[Callable[[], Dict[str, Any]]] = None) -> "BwItem":
+        """
+        Builds an item from its routing fields only, without validation, the items are routed to their groups like
+        this and only validated once their entry is written, if it is. `validated` returns the complete item. With
+        `load` the raw item is not kept, `validated` reads it again with `load`.
+        """
+        bw_item = cls.model_construct(
+            **{field: bw_item_dict[field] for field in BW_ITEM_ROUTING_FIELDS if field in bw_item_dict}
+        )
+        if load is None:
+            bw_item._raw = bw_item_dict
+        else:
+            bw_item._load = load
+        return bw_item
+
+    def validated(self) -> "BwItem":
+        """
+        Returns the complete, validated item, which is the item itself unless it was deferred. An item that keeps
+        its raw item is validated once, for all the entries it is written to.
+        """
+        if self._load is not None:
+            return BwItem.model_validate(self._load())
+        if self._raw is not None:
+            self._validated = BwItem.model_validate(self._raw)
+            self._raw = None
+        return self._validated if self._validated is not None else self
 
 
 class BwCollection(BaseModel):
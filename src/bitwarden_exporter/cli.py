@@ -3,6 +3,13 @@ This module provides a command-line interface (CLI) for interacting with Bitward
 
 Functions:
     bw_exec(cmd: List[str], ret_encoding: str = "UTF-8", env_vars: Optional[Dict[str, str]] = None) -> str:
+        Executes a Bitwarden CLI command through the active transport.
+    bw_list(object_name: str) -> Iterator[Dict[str, Any]]:
+        Yields the objects of a `bw list` command one by one through the active transport.
+    download_file(item_id: str, attachment_id: str, download_location: str, expected_bytes: Optional[int]) -> None:
+        Downloads an attachment through the active transport.
+    set_transport(transport: BwTransport) -> None:
+        Replaces the transport used by bw_exec and download_file.
 
 Exceptions:
     BitwardenException:
@@ -12,25 +19,41 @@ Exceptions:
 import logging
 import os
 import os.path
-import subprocess  # nosec B404
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
+
+from .transport import BwTransport, SubprocessTransport
 
 LOGGER = logging.getLogger(__name__)
 
+_TRANSPORT: BwTransport = SubprocessTransport()
+
 
-def download_file(item_id: str, attachment_id: str, download_location: str) -> None:
+def set_transport(transport: BwTransport) -> None:
     """
-    Downloads a file from bitwarden.
+    Replaces the transport used to talk to Bitwarden.
     """
-    parent_dir = os.path.dirname(download_location)
-    if not os.path.exists(parent_dir):
-        os.makedirs(parent_dir)
+    global _TRANSPORT  # pylint: disable=global-statement
+    _TRANSPORT = transport
+
+
+def get_transport() -> BwTransport:
+    """
+    Returns the transport used to talk to Bitwarden.
+    """
+    return _TRANSPORT
 
-    if os.path.exists(download_location):
-        LOGGER.info("File already exists, skipping download")
-        return
 
-    bw_exec(["get", "attachment", attachment_id, "--itemid", item_id, "--output", download_location], is_raw=False)
+def download_file(
+    item_id: str, attachment_id: str, download_location: str, expected_bytes: Optional[int] = None
+) -> None:
+    """
+    Downloads a file from bitwarden, an existing file at the location is overwritten. `expected_bytes` is the size
+    Bitwarden reports for it, the timeout of the download grows with it.
+    """
+    parent_dir = os.path.dirname(download_location)
+    os.makedirs(parent_dir, exist_ok=True)
+
+    _TRANSPORT.download_attachment(item_id, attachment_id, download_location, expected_bytes=expected_bytes)
 
 
 def bw_exec(
@@ -39,20 +62,11 @@ def bw_exec(
     """
     Executes a Bitwarden CLI command and returns the output as a string.
     """
-    cmd = ["bw"] + cmd
+    return _TRANSPORT.exec(cmd, ret_encoding=ret_encoding, env_vars=env_vars, is_raw=is_raw)
 
-    if is_raw:
-        cmd.append("--raw")
 
-    cli_env_vars = os.environ
-
-    if env_vars is not None:
-        cli_env_vars.update(env_vars)
-    LOGGER.debug("Executing CLI :: %s", {" ".join(cmd)})
-    command_out = subprocess.run(
-        cmd, capture_output=True, check=False, encoding=ret_encoding, env=cli_env_vars, timeout=10
-    )  # nosec B603
-    if len(command_out.stderr) > 0:
-        LOGGER.warning("Error executing command %s", command_out.stderr)
-    command_out.check_returncode()
-    return command_out.stdout
+def bw_list(object_name: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the objects of `bw list <object_name>` one by one, without holding the whole output in memory.
+    """
+    return _TRANSPORT.iter_list(object_name)
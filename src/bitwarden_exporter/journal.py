@@ -0,0 +1,294 @@
+"""
+This module keeps a journal of an export in the temporary directory, so an export that died can be resumed.
+
+The journal records the answers of the `bw list` calls once they are complete and every attachment downloaded into
+the attachment cache. A resumed export takes the lists from the journal instead of asking Bitwarden again and adopts
+the downloaded attachments into the cache, so only the work that was not finished is done again. Items are written to
+the journal as they are streamed, a list of items that was cut off is fetched again as a whole. With `--max-memory` the
+items are read back from the journal when their entries are built, instead of being kept in memory.
+
+The journal is only written with `--resume`. Every record, list and item is encrypted with AES-256-GCM under a key
+derived from the export password with scrypt and a random salt of the journal, like the list cache, so a journal
+left behind by a crash does not hold the vault in plain text, and a journal that does not decrypt is started over.
+The journal is removed once the export is saved. Without `--resume` nothing is written to the journal directory, the
+items `--max-memory` reads back are kept in an unlinked temporary file, encrypted with a random key that only the
+running export knows.
+
+Classes:
+    ExportJournal: Records and replays the completed steps of an export.
+"""
+
+import base64
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from types import TracebackType
+from typing import IO, Any, Callable, Dict, Iterator, Optional, Tuple, Type
+
+from Cryptodome.Cipher import AES
+
+from .attachment_cache import CachedAttachment
+from .list_cache import derive_key
+from .metrics import METRICS
+
+LOGGER = logging.getLogger(__name__)
+
+JOURNAL_FILE = "journal.records"
+ITEMS_FILE = "items.records"
+SALT_FILE = "salt"
+NONCE_SIZE = 12
+TAG_SIZE = 16
+LENGTH_SIZE = 4
+
+
+def _seal(key: bytes, data: bytes, label: bytes) -> bytes:
+    """
+    Encrypts and authenticates `data` for `label`, returns the nonce, the ciphertext and the tag
+    """
+    nonce = os.urandom(NONCE_SIZE)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(label)
+    encrypted, tag = cipher.encrypt_and_digest(data)
+    return nonce + encrypted + tag
+
+
+def _unseal(key: bytes, sealed: bytes, label: bytes) -> bytes:
+    """
+    Decrypts what `_seal` returned for `label`, raises ValueError if it does not verify
+    """
+    if len(sealed) < NONCE_SIZE + TAG_SIZE:
+        raise ValueError("the record is truncated")
+    cipher = AES.new(key, AES.MODE_GCM, nonce=sealed[:NONCE_SIZE])
+    cipher.update(label)
+    return bytes(cipher.decrypt_and_verify(sealed[NONCE_SIZE:-TAG_SIZE], sealed[-TAG_SIZE:]))
+
+
+class ExportJournal:  # pylint: disable=too-many-instance-attributes
+    """
+    Append only journal of an export in `journal_dir`, every record is flushed to disk before the step it records
+    is used
+
+    `identity` names the export, the vault user and the export location, a journal of another export is never
+    resumed. The journal is encrypted with `password`. Without `resume` nothing is written to `journal_dir` and an
+    existing journal is discarded, only the items are kept if `keep_items`, so `load_item` can read them again.
+    Leaving the context keeps the journal, `finish` removes it.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, journal_dir: str, identity: Dict[str, Any], password: str, resume: bool, keep_items: bool = False
+    ) -> None:
+        self.__journal_dir = os.path.abspath(journal_dir)
+        self.__persistent = resume
+        self.__keep_items = resume or keep_items
+        self.__lock = threading.Lock()
+        self.__phases: Dict[str, str] = {}
+        self.__attachments: Dict[str, CachedAttachment] = {}
+        self.__items_in: Optional[IO[bytes]] = None
+        self.__journal: Optional[IO[str]] = None
+        if not resume:
+            shutil.rmtree(self.__journal_dir, ignore_errors=True)
+            self.__key = os.urandom(32)
+            return
+        resumed = self.__load(identity, password)
+        if not resumed:
+            shutil.rmtree(self.__journal_dir, ignore_errors=True)
+            os.makedirs(self.__journal_dir, mode=0o700)
+            with open(os.path.join(self.__journal_dir, SALT_FILE), "wb") as salt_out:
+                salt_out.write(os.urandom(16))
+            self.__key = self.__derive_key(password)
+        self.__journal = open(  # pylint: disable=consider-using-with
+            os.path.join(self.__journal_dir, JOURNAL_FILE), "a", encoding="ascii"
+        )
+        if not resumed:
+            self.__append({"type": "header", "identity": identity, "started_at": time.time()})
+
+    def __enter__(self) -> "ExportJournal":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def __derive_key(self, password: str) -> bytes:
+        with open(os.path.join(self.__journal_dir, SALT_FILE), "rb") as salt_in:
+            return derive_key(password, salt_in.read())
+
+    def __load(self, identity: Dict[str, Any], password: str) -> bool:
+        """
+        Reads the journal of an earlier run, returns whether it belongs to this export. A record that was cut off by
+        the crash ends the journal.
+        """
+        journal_file = os.path.join(self.__journal_dir, JOURNAL_FILE)
+        if not os.path.exists(journal_file) or not os.path.exists(os.path.join(self.__journal_dir, SALT_FILE)):
+            LOGGER.warning("No journal to resume in %s, starting over", self.__journal_dir)
+            return False
+        self.__key = self.__derive_key(password)
+        with open(journal_file, "r", encoding="ascii") as journal_in:
+            lines = journal_in.read().split("\n")
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(_unseal(self.__key, base64.b64decode(line, validate=True), b"record")))
+            except ValueError:
+                break
+        if len(records) == 0 or records[0].get("type") != "header" or records[0].get("identity") != identity:
+            LOGGER.warning(
+                "The journal in %s belongs to another export or another export password, starting over",
+                self.__journal_dir,
+            )
+            return False
+        for record in records[1:]:
+            if record["type"] == "phase":
+                self.__phases[record["name"]] = record["file"]
+            elif record["type"] == "attachment":
+                self.__attachments[record["id"]] = CachedAttachment(**record["record"])
+        with open(journal_file, "w", encoding="ascii") as journal_out:
+            journal_out.writelines(line + "\n" for line in lines[: len(records)])
+        LOGGER.info(
+            "Resuming the export started at %s, %s lists and %s attachments are done",
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(records[0]["started_at"])),
+            len(self.__phases),
+            len(self.__attachments),
+        )
+        return True
+
+    def __append(self, record: Dict[str, Any]) -> None:
+        """
+        Appends a record and waits until it is on disk
+        """
+        if self.__journal is None:
+            return
+        line = base64.b64encode(_seal(self.__key, json.dumps(record).encode("utf-8"), b"record")).decode("ascii")
+        with self.__lock:
+            self.__journal.write(line + "\n")
+            self.__journal.flush()
+            os.fsync(self.__journal.fileno())
+
+    def __complete(self, name: str, file_name: str) -> None:
+        """
+        Records a completed phase whose result is in `file_name`
+        """
+        self.__append({"type": "phase", "name": name, "file": file_name})
+        self.__phases[name] = file_name
+
+    def completed(self, name: str) -> bool:
+        """
+        Returns whether the journal holds the result of a phase.
+        """
+        return name in self.__phases
+
+    def phase(self, name: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Returns the JSON result of a phase from the journal, or runs `fetch` and records its result.
+        """
+        if name in self.__phases:
+            LOGGER.info("Taking %s from the journal", name)
+            METRICS.increment("journal_phases_resumed_total")
+            with open(os.path.join(self.__journal_dir, self.__phases[name]), "rb") as phase_in:
+                return json.loads(_unseal(self.__key, phase_in.read(), name.encode("utf-8")))
+        value = fetch()
+        if not self.__persistent:
+            return value
+        file_name = f"{name}.records"
+        with open(os.path.join(self.__journal_dir, file_name), "wb") as phase_out:
+            phase_out.write(_seal(self.__key, json.dumps(value).encode("utf-8"), name.encode("utf-8")))
+            phase_out.flush()
+            os.fsync(phase_out.fileno())
+        self.__complete(name, file_name)
+        return value
+
+    def iter_items(self, fetch: Callable[[], Iterator[Dict[str, Any]]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Yields the items with their offset in the journal, from the journal, or streamed from `fetch` while they are
+        written to the journal.
+        """
+        if "items" in self.__phases:
+            LOGGER.info("Taking items from the journal")
+            METRICS.increment("journal_phases_resumed_total")
+            with open(os.path.join(self.__journal_dir, self.__phases["items"]), "rb") as items_in:
+                offset = 0
+                while length := int.from_bytes(items_in.read(LENGTH_SIZE), "big"):
+                    yield offset, json.loads(_unseal(self.__key, items_in.read(length), b"item"))
+                    offset += LENGTH_SIZE + length
+            return
+        if not self.__keep_items:
+            for bw_item_dict in fetch():
+                yield -1, bw_item_dict
+            return
+        items_out: IO[bytes]
+        if self.__persistent:
+            items_out = open(os.path.join(self.__journal_dir, ITEMS_FILE), "wb")  # pylint: disable=consider-using-with
+        else:
+            # unlinked at once, it is gone with the process however the export ends
+            items_out = tempfile.TemporaryFile(
+                dir=os.path.dirname(self.__journal_dir)
+            )  # pylint: disable=consider-using-with
+        offset = 0
+        try:
+            for bw_item_dict in fetch():
+                record = _seal(self.__key, json.dumps(bw_item_dict).encode("utf-8"), b"item")
+                items_out.write(len(record).to_bytes(LENGTH_SIZE, "big") + record)
+                yield offset, bw_item_dict
+                offset += LENGTH_SIZE + len(record)
+            items_out.flush()
+        except BaseException:
+            items_out.close()
+            raise
+        if self.__persistent:
+            os.fsync(items_out.fileno())
+            items_out.close()
+            self.__complete("items", ITEMS_FILE)
+        else:
+            self.__items_in = items_out
+
+    def load_item(self, offset: int) -> Dict[str, Any]:
+        """
+        Reads the item at an offset `iter_items` yielded again, once all items are listed.
+        """
+        if self.__items_in is None:
+            self.__items_in = open(  # pylint: disable=consider-using-with
+                os.path.join(self.__journal_dir, self.__phases["items"]), "rb"
+            )
+        self.__items_in.seek(offset)
+        length = int.from_bytes(self.__items_in.read(LENGTH_SIZE), "big")
+        bw_item_dict: Dict[str, Any] = json.loads(_unseal(self.__key, self.__items_in.read(length), b"item"))
+        return bw_item_dict
+
+    def attachments(self) -> Dict[str, CachedAttachment]:
+        """
+        Returns the attachments the earlier runs downloaded into the cache.
+        """
+        return dict(self.__attachments)
+
+    def record_attachment(self, attachment_id: str, record: CachedAttachment) -> None:
+        """
+        Records an attachment stored in the cache, safe to call from several download threads.
+        """
+        self.__append({"type": "attachment", "id": attachment_id, "record": record.model_dump()})
+
+    def finish(self) -> None:
+        """
+        Removes the journal, once the export is saved there is nothing left to resume.
+        """
+        self.close()
+        if self.__persistent:
+            shutil.rmtree(self.__journal_dir, ignore_errors=True)
+            LOGGER.info("Export journal %s removed", self.__journal_dir)
+
+    def close(self) -> None:
+        """
+        Closes the journal and keeps it for a later `--resume`.
+        """
+        if self.__journal is not None and not self.__journal.closed:
+            self.__journal.close()
+        if self.__items_in is not None:
+            self.__items_in.close()
+            self.__items_in = None
@@ -0,0 +1,155 @@
+"""
+This module reads and writes large JSON arrays one element at a time.
+
+Classes:
+    JsonArrayWriter: Writes the elements of a JSON array to a binary stream.
+
+Functions:
+    iter_json_array(stream: IO[bytes], path: Tuple[str, ...] = ()) -> Iterator[Any]:
+        Yields the elements of a JSON array read from a binary stream.
+
+Exceptions:
+    BitwardenException:
+        Raised when the stream does not hold the expected JSON.
+"""
+
+import codecs
+import json
+import textwrap
+from typing import IO, Any, Iterator, Tuple
+
+from . import BitwardenException
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _JsonStreamReader:
+    """
+    Buffered reader that decodes one JSON value at a time from a binary stream
+    """
+
+    def __init__(self, stream: IO[bytes], chunk_size: int) -> None:
+        self.__stream = stream
+        self.__chunk_size = chunk_size
+        self.__decoder = codecs.getincrementaldecoder("utf-8")()
+        self.__buffer = ""
+        self.__pos = 0
+        self.__eof = False
+
+    def __fill(self, size: int) -> bool:
+        """
+        Reads more data into the buffer, returns False at the end of the stream
+        """
+        if self.__eof:
+            return False
+        chunk = self.__stream.read(size)
+        self.__buffer = self.__buffer[self.__pos :] + self.__decoder.decode(chunk, final=not chunk)
+        self.__pos = 0
+        if not chunk:
+            self.__eof = True
+        return True
+
+    def peek(self) -> str:
+        """
+        Returns the next non whitespace character without consuming it, an empty string at the end of the stream
+        """
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos] in _WHITESPACE:
+                self.__pos += 1
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not self.__fill(self.__chunk_size):
+                return ""
+
+    def expect(self, char: str) -> None:
+        """
+        Consumes the next non whitespace character, which has to be `char`
+        """
+        found = self.peek()
+        if found != char:
+            raise BitwardenException(f"Invalid JSON stream, expected {char!r} but found {found!r}")
+        self.__pos += 1
+
+    def value(self) -> Any:
+        """
+        Decodes the next JSON value
+        """
+        self.peek()
+        read_size = self.__chunk_size
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.__buffer, self.__pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.__buffer) or self.__eof:
+                    self.__pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.__eof:
+                    raise BitwardenException(f"Invalid JSON stream: {e}") from e
+            self.__fill(read_size)
+            read_size *= 2
+
+
+def iter_json_array(stream: IO[bytes], path: Tuple[str, ...] = (), chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """
+    Yields the elements of a JSON array from a binary stream without reading the whole stream.
+
+    `path` is the chain of object keys leading to the array, an empty path means the stream is the array itself.
+    """
+    reader = _JsonStreamReader(stream, chunk_size)
+    for key in path:
+        reader.expect("{")
+        while True:
+            found_key = reader.value()
+            reader.expect(":")
+            if found_key == key:
+                break
+            reader.value()
+            if reader.peek() != ",":
+                raise BitwardenException(f"Invalid JSON stream, key {key} not found")
+            reader.expect(",")
+
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == "]":
+            return
+        reader.expect(",")
+
+
+class JsonArrayWriter:
+    """
+    Writes the elements of a JSON array to a binary stream as they arrive
+
+    The output is the same as `json.dumps(elements, indent=4)`, or `json.dumps(elements, separators=(",", ":"))` if
+    compact.
+    """
+
+    def __init__(self, stream: IO[bytes], compact: bool = False) -> None:
+        self.__stream = stream
+        self.__compact = compact
+        self.__count = 0
+
+    def write(self, value: Any) -> None:
+        """
+        Appends an element to the array
+        """
+        if self.__compact:
+            self.__stream.write(b"[" if self.__count == 0 else b",")
+            self.__stream.write(json.dumps(value, separators=(",", ":")).encode())
+        else:
+            self.__stream.write(b"[\n" if self.__count == 0 else b",\n")
+            self.__stream.write(textwrap.indent(json.dumps(value, indent=4), "    ").encode())
+        self.__count += 1
+
+    def close(self) -> None:
+        """
+        Closes the array
+        """
+        if self.__count == 0:
+            self.__stream.write(b"[]")
+        else:
+            self.__stream.write(b"]" if self.__compact else b"\n]")
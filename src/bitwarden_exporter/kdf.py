@@ -0,0 +1,196 @@
+"""
+This module chooses and applies the key derivation function (KDF) of the KeePass database.
+
+The KDF runs every time the database is saved or unlocked, its parameters trade the CPU time of a backup and of a
+restore against the cost of guessing the password. Parameters are either given explicitly or calibrated on the local
+machine to take a target time.
+
+Classes:
+    KdfParameters: The KDF algorithm and its parameters.
+
+Functions:
+    calibrate_iterations(algorithm: str, target_ms: int, memory_mib: int, parallelism: int) -> int:
+        Measures the KDF on this machine and returns the iterations that take the target time.
+
+    kdf_parameters_from_settings(settings: BitwardenExportSettings) -> KdfParameters:
+        Resolves the KDF options of the command line, calibrating if asked to.
+
+    apply_kdf(py_kee_pass: PyKeePass, parameters: KdfParameters) -> None:
+        Sets the KDF of a KDBX 4 database, with a fresh salt and master seed.
+
+Exceptions:
+    BitwardenException:
+        Raised when the database is not KDBX 4.
+"""
+
+import logging
+import os
+import time
+from typing import Dict, List, Tuple
+
+import argon2
+from construct import Container  # type: ignore
+from pydantic import BaseModel
+from pykeepass import PyKeePass  # type: ignore
+from pykeepass.kdbx_parsing.common import aes_kdf  # type: ignore
+from pykeepass.kdbx_parsing.kdbx4 import kdf_uuids  # type: ignore
+
+from . import BitwardenException
+from .settings import BitwardenExportSettings
+
+LOGGER = logging.getLogger(__name__)
+
+KDF_ALGORITHMS = ("argon2d", "argon2id", "aes-kdf")
+
+# Same as the blank database pykeepass creates new databases from
+DEFAULT_ARGON2_ITERATIONS = 14
+DEFAULT_ARGON2_MEMORY_MIB = 64
+DEFAULT_ARGON2_PARALLELISM = 2
+DEFAULT_AES_KDF_ROUNDS = 300000
+
+_ARGON2_VERSION = 0x13
+_ARGON2_TYPES = {"argon2d": argon2.low_level.Type.D, "argon2id": argon2.low_level.Type.ID}
+_KDF_UUIDS = {"argon2d": kdf_uuids["argon2"], "argon2id": kdf_uuids["argon2id"], "aes-kdf": kdf_uuids["aeskdf"]}
+
+# VariantDictionary value types of the KDBX 4 header
+_UINT32 = 0x04
+_UINT64 = 0x05
+_BYTES = 0x42
+
+
+class KdfParameters(BaseModel):
+    """
+    KDF algorithm and parameters, iterations are the rounds of AES-KDF, an existing database keeps its own KDF if
+    `keep_existing` is set
+    """
+
+    algorithm: str
+    iterations: int
+    memory_mib: int = DEFAULT_ARGON2_MEMORY_MIB
+    parallelism: int = DEFAULT_ARGON2_PARALLELISM
+    keep_existing: bool = False
+
+
+def _run_kdf(algorithm: str, iterations: int, memory_mib: int, parallelism: int) -> float:
+    """
+    Runs the KDF once on a random key and returns the seconds it took
+    """
+    start = time.perf_counter()
+    if algorithm == "aes-kdf":
+        aes_kdf(os.urandom(32), iterations, os.urandom(32))
+    else:
+        argon2.low_level.hash_secret_raw(
+            secret=os.urandom(32),
+            salt=os.urandom(32),
+            hash_len=32,
+            type=_ARGON2_TYPES[algorithm],
+            time_cost=iterations,
+            memory_cost=memory_mib * 1024,
+            parallelism=parallelism,
+            version=_ARGON2_VERSION,
+        )
+    return time.perf_counter() - start
+
+
+def calibrate_iterations(algorithm: str, target_ms: int, memory_mib: int, parallelism: int) -> int:
+    """
+    Measures the KDF on this machine and returns the iterations that make one run take about `target_ms`.
+
+    Memory and parallelism stay fixed, only the iterations are scaled. The probe is grown until it takes at least a
+    quarter of the target, so the fixed cost of a run, like allocating the Argon2 memory, does not skew the result.
+    """
+    iterations = 1 if algorithm != "aes-kdf" else 10000
+    while True:
+        seconds = _run_kdf(algorithm, iterations, memory_mib, parallelism)
+        if seconds * 1000 >= target_ms / 4 or seconds >= 1:
+            break
+        iterations *= 2
+    calibrated = max(1, int(iterations * target_ms / (seconds * 1000)))
+    LOGGER.info(
+        "KDF %s calibrated to %s iterations for %s ms, probe: %s iterations in %.0f ms",
+        algorithm,
+        calibrated,
+        target_ms,
+        iterations,
+        seconds * 1000,
+    )
+    return calibrated
+
+
+def kdf_parameters_from_settings(settings: BitwardenExportSettings) -> KdfParameters:
+    """
+    Resolves the KDF options, without any an incremental export keeps the KDF of the existing database.
+    """
+    explicit = any(
+        option is not None
+        for option in (
+            settings.kdf,
+            settings.kdf_iterations,
+            settings.kdf_memory_mib,
+            settings.kdf_parallelism,
+            settings.kdf_target_ms,
+        )
+    )
+    algorithm = settings.kdf or "argon2d"
+    memory_mib = settings.kdf_memory_mib or DEFAULT_ARGON2_MEMORY_MIB
+    parallelism = settings.kdf_parallelism or DEFAULT_ARGON2_PARALLELISM
+    if settings.kdf_iterations is not None:
+        iterations = settings.kdf_iterations
+    elif settings.kdf_target_ms is not None:
+        iterations = calibrate_iterations(algorithm, settings.kdf_target_ms, memory_mib, parallelism)
+    else:
+        iterations = DEFAULT_AES_KDF_ROUNDS if algorithm == "aes-kdf" else DEFAULT_ARGON2_ITERATIONS
+    return KdfParameters(
+        algorithm=algorithm,
+        iterations=iterations,
+        memory_mib=memory_mib,
+        parallelism=parallelism,
+        keep_existing=not explicit,
+    )
+
+
+def _variant_dictionary(items: List[Tuple[str, int, object]]) -> Container:
+    """
+    Builds the KDF parameters dictionary, `next_byte` is the type of the next item and ends the list when 0
+    """
+    variants: Dict[str, Container] = {}
+    for index, (key, value_type, value) in enumerate(items):
+        next_byte = items[index + 1][1] if index + 1 < len(items) else 0
+        variants[key] = Container(type=value_type, key=key, value=value, next_byte=next_byte)
+    return Container(variants)
+
+
+def apply_kdf(py_kee_pass: PyKeePass, parameters: KdfParameters) -> None:
+    """
+    Sets the KDF of a KDBX 4 database, it takes effect on the next save.
+
+    The KDF salt, the master seed and the encryption IV are regenerated as well, databases created by pykeepass
+    otherwise all share the ones of its blank template.
+    """
+    if py_kee_pass.version != (4, 0):
+        raise BitwardenException(f"KDF settings need a KDBX 4 database, found version {py_kee_pass.version}")
+    header = py_kee_pass.kdbx.header
+    dynamic_header = header.value.dynamic_header
+    items: List[Tuple[str, int, object]] = [("$UUID", _BYTES, _KDF_UUIDS[parameters.algorithm])]
+    if parameters.algorithm == "aes-kdf":
+        items += [("R", _UINT64, parameters.iterations), ("S", _BYTES, os.urandom(32))]
+    else:
+        items += [
+            ("I", _UINT64, parameters.iterations),
+            ("M", _UINT64, parameters.memory_mib * 1024 * 1024),
+            ("P", _UINT32, parameters.parallelism),
+            ("S", _BYTES, os.urandom(32)),
+            ("V", _UINT32, _ARGON2_VERSION),
+        ]
+    dynamic_header.kdf_parameters.data.dict = _variant_dictionary(items)
+    dynamic_header.master_seed.data = os.urandom(len(dynamic_header.master_seed.data))
+    dynamic_header.encryption_iv.data = os.urandom(len(dynamic_header.encryption_iv.data))
+    # The header is written from its raw bytes as long as they are present
+    del header["data"]
+    LOGGER.info(
+        "KDF set to %s, iterations: %s, memory: %s MiB, parallelism: %s",
+        parameters.algorithm,
+        parameters.iterations,
+        parameters.memory_mib,
+        parameters.parallelism,
+    )
@@ -1,49 +1,249 @@
 """
 Writes the given data to a file at the specified path.
+
+The entry an item is written as is described by `entry_url`, `entry_otp`, `entry_fields` and
+`entry_attachment_names`, the verification of an export uses them to know what to expect.
 """
 
+import hashlib
 import json
 import logging
 import os
 import urllib.parse
+import uuid
 from types import TracebackType
-from typing import Any, Dict, List, Optional, Type
+from typing import IO, Any, Callable, Dict, List, Optional, Set, Tuple, Type
 
+from pydantic import BaseModel
 from pykeepass import PyKeePass, create_database  # type: ignore
-from pykeepass.entry import Entry  # type: ignore
+from pykeepass.entry import Entry, reserved_keys  # type: ignore
 from pykeepass.group import Group  # type: ignore
 
 from . import BitwardenException
 from .bw_models import BwField, BwFolder, BwItem, BwOrganization
+from .kdf import KdfParameters, apply_kdf
+from .metrics import METRICS
+from .progress import PROGRESS
+from .pykeepass_internals import (
+    BINARY_BUFFER_SIZE,
+    append_binary,
+    append_custom_property,
+    append_stream_binary,
+    remove_unreferenced_binaries,
+)
 
 LOGGER = logging.getLogger(__name__)
 
+BW_ITEM_ID_PROPERTY = "bw_item_id"
+BW_REVISION_DATE_PROPERTY = "bw_revision_date"
+BW_EXPORT_ENTRY_TITLE = "Bitwarden Export"
+
+
+def unique_names(names: List[str], taken: Set[str]) -> List[str]:
+    """
+    Returns the names in the same order, renamed where needed so that no two are equal and none is in `taken`.
+
+    The first occurrence of a name keeps it, later ones get the next free suffix: x, x-2, x-3.
+    """
+    next_suffix: Dict[str, int] = {}
+    unique: List[str] = []
+    for name in names:
+        candidate = name
+        if candidate in taken:
+            suffix = next_suffix.get(name, 2)
+            candidate = f"{name}-{suffix}"
+            while candidate in taken:
+                suffix += 1
+                candidate = f"{name}-{suffix}"
+            next_suffix[name] = suffix + 1
+        taken.add(candidate)
+        unique.append(candidate)
+    return unique
+
+
+class EntryField(BaseModel):
+    """
+    A custom property of the entry of an item, `renamed_from` is the name of the Bitwarden field if it was taken
+    """
+
+    name: str
+    value: str
+    protect: bool
+    renamed_from: Optional[str] = None
+
+
+def entry_url(bw_item: BwItem) -> Optional[str]:
+    """
+    Returns the URL of the entry of an item, the first URI of its login.
+    """
+    if (not bw_item.login) or len(bw_item.login.uris) == 0:
+        return None
+    return bw_item.login.uris[0].uri
+
+
+def entry_otp(bw_item: BwItem) -> Optional[str]:
+    """
+    Returns the OTP of the entry of an item, a bare TOTP secret is turned into an otpauth:// URL.
+    """
+    if (not bw_item.login) or (not bw_item.login.totp):
+        return None
+    if bw_item.login.totp.startswith("otpauth://"):
+        return bw_item.login.totp
+    url_safe_totp = bw_item.login.totp.replace(" ", "").lower()
+    url_safe_name = urllib.parse.quote_plus(bw_item.name)
+    return (
+        f"otpauth://totp/{url_safe_name}?secret={url_safe_totp}"
+        f"&issuer={url_safe_name}&algorithm=SHA1&digits=6&period=30"
+    )
+
+
+def entry_fields(bw_item: BwItem) -> List[EntryField]:
+    """
+    Returns the custom properties of the entry of an item: its fields, its Fido2 credentials, which KeePass does not
+    support, and all its URIs, as KeePass holds only one URL.
+
+    Field names are made unique, the names reserved by KeePass and the properties of the exporter count as taken.
+    """
+    fields = list(bw_item.fields)
+    if bw_item.login and bw_item.login.fido2Credentials:
+        fido2credentials_dict: List[Dict[str, Any]] = [
+            fido2Credentials.model_dump() for fido2Credentials in bw_item.login.fido2Credentials
+        ]
+        fields.append(BwField(name="Fido2Credentials", value=json.dumps(fido2credentials_dict, indent=4), type=1))
+    if bw_item.login:
+        for uri in bw_item.login.uris:
+            fields.append(BwField(name=f"URI-type-{uri.match}" if uri.match else "URI", value=uri.uri, type=0))
+
+    names = unique_names(
+        [field.name for field in fields], {BW_ITEM_ID_PROPERTY, BW_REVISION_DATE_PROPERTY} | set(reserved_keys)
+    )
+    properties: List[EntryField] = []
+    for field, name in zip(fields, names):
+        if field.type in (0, 1, 2):
+            value = field.value or ""
+        elif field.type == 3 and field.linkedId == 100:
+            value = "Linked to Username"
+        elif field.type == 3 and field.linkedId == 101:
+            value = "Linked to Password"
+        elif field.type == 3 and field.linkedId:
+            raise BitwardenException(f"{bw_item.name}:: {field.name}:: Unknown linkedId {field.linkedId}")
+        else:
+            raise BitwardenException(f"{bw_item.name}:: {field.name}:: Unknown Field Type {field.type}")
+        properties.append(
+            EntryField(
+                name=name,
+                value=value,
+                protect=field.type == 1,
+                renamed_from=field.name if field.name != name else None,
+            )
+        )
+    return properties
+
+
+def entry_attachment_names(bw_item: BwItem) -> List[str]:
+    """
+    Returns the names of the attachments of the entry of an item, in the order of the item.
+    """
+    return unique_names([attachment.fileName for attachment in bw_item.attachments], set())
+
 
-class KeePassStorage:
+class KeePassStorage:  # pylint: disable=too-many-instance-attributes
     """
     Class to interact with Keepass
+
+    In incremental mode an existing database is opened instead of created. Its entries are indexed by Bitwarden item
+    id and group, unchanged items are kept as they are, changed items are replaced and items that no longer exist are
+    removed when the database is saved.
+
+    The database is only saved if everything was processed. It is written to a temporary file next to it and moved
+    into place, so a failed or interrupted export leaves the previous one intact.
     """
 
     __py_kee_pass: PyKeePass
-    __my_vault_group: Group
 
-    def __init__(self, kdbx_file: str, kdbx_password: str) -> None:
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        kdbx_file: str,
+        kdbx_password: str,
+        *,
+        incremental: bool = False,
+        wait_for_attachments: Optional[Callable[[BwItem], None]] = None,
+        kdf: Optional[KdfParameters] = None,
+    ) -> None:
         self.__kdbx_file = os.path.abspath(kdbx_file)
+        self.__kdf = kdf
         self.__kdbx_password = kdbx_password
+        self.__wait_for_attachments = wait_for_attachments
+        self.__incremental = False
+        self.__existing_entries: Dict[Tuple[str, uuid.UUID], Entry] = {}
+        self.__existing_items: Dict[str, List[Entry]] = {}
+        self.__touched_groups: Set[uuid.UUID] = set()
+        self.__binary_ids: Dict[str, int] = {}
+        self.__groups: Dict[Tuple[str, ...], Group] = {}
+        self.__group_paths: Dict[uuid.UUID, Tuple[str, ...]] = {}
         if os.path.exists(self.__kdbx_file):
-            raise BitwardenException(f"KeePass Database already exists at f{self.__kdbx_file}")
+            if not incremental:
+                raise BitwardenException(f"KeePass Database already exists at {self.__kdbx_file}")
+            LOGGER.info("Opening previous Keepass Database: %s", self.__kdbx_file)
+            self.__py_kee_pass = PyKeePass(self.__kdbx_file, password=self.__kdbx_password)
+            self.__incremental = True
+            self.__index_entries()
+
+    def __index_entries(self) -> None:
+        """
+        Index the entries of the previous export by Bitwarden item id
+        """
+        for entry in self.__py_kee_pass.entries:
+            item_id = entry.get_custom_property(BW_ITEM_ID_PROPERTY)
+            if not item_id:
+                continue
+            self.__existing_entries[(item_id, entry.group.uuid)] = entry
+            self.__existing_items.setdefault(item_id, []).append(entry)
+        LOGGER.info("Indexed %s entries of the previous export", len(self.__existing_entries))
 
-    def __enter__(self) -> "KeePassStorage":
-        LOGGER.info("Creating Keepass Database: %s", self.__kdbx_file)
-        self.__py_kee_pass = create_database(self.__kdbx_file, password=self.__kdbx_password)
+    def __previous_entry(self, item_id: str, revision_date: str) -> Optional[Entry]:
+        """
+        Returns an entry of the previous export that holds the same revision of the item
+        """
+        for entry in self.__existing_items.get(item_id, []):
+            if entry.get_custom_property(BW_REVISION_DATE_PROPERTY) == revision_date:
+                return entry
+        return None
+
+    def holds_revision(self, item_id: str, revision_date: str) -> bool:
+        """
+        Returns whether the previous export holds an entry of this revision of the item.
+        """
+        return self.__previous_entry(item_id, revision_date) is not None
+
+    def needs_attachments(self, bw_item: BwItem) -> bool:
+        """
+        Returns whether the attachments of the item have to be downloaded, which is not the case if the previous
+        export already holds this revision of the item
+        """
+        if len(bw_item.attachments) == 0:
+            return False
+        return not self.holds_revision(bw_item.id, bw_item.revisionDate)
 
+    def __enter__(self) -> "KeePassStorage":
         __kdbx_dir = os.path.dirname(self.__kdbx_file)
         if not os.path.exists(__kdbx_dir):
             LOGGER.info("Creating Directory %s", __kdbx_dir)
             os.makedirs(__kdbx_dir)
 
-        LOGGER.info("Creating Keepass group My Vault")
-        self.__my_vault_group = self.__add_group_recursive(group_path="My Vault")
+        if not self.__incremental:
+            LOGGER.info("Creating Keepass Database: %s", self.__kdbx_file)
+            with METRICS.phase("create_database"):
+                self.__py_kee_pass = create_database(f"{self.__kdbx_file}.tmp", password=self.__kdbx_password)
+
+        if self.__kdf is not None and not (self.__incremental and self.__kdf.keep_existing):
+            apply_kdf(self.__py_kee_pass, self.__kdf)
+
+        self.__binary_ids = {
+            hashlib.sha256(data).hexdigest(): binary_id for binary_id, data in enumerate(self.__py_kee_pass.binaries)
+        }
+
+        self.__index_groups()
         return self
 
     def __exit__(
@@ -52,73 +252,126 @@ class KeePassStorage:
         exc_value: Optional[BaseException],
         traceback: Optional[TracebackType],
     ) -> Optional[bool]:
+        tmp_file = f"{self.__kdbx_file}.tmp"
+        if exc_type is not None:
+            LOGGER.error("Error in processing %s, the Keepass Database is not saved", exc_value)
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise BitwardenException("Error in processing") from exc_value
+
+        if self.__incremental:
+            self.__remove_stale()
+
         try:
-            self.__py_kee_pass.save()
+            with METRICS.phase("save"):
+                self.__py_kee_pass.save(filename=tmp_file)
+                os.replace(tmp_file, self.__kdbx_file)
+            METRICS.set_gauge("kdbx_bytes", os.path.getsize(self.__kdbx_file))
             LOGGER.info("Keepass Database Saved")
         except Exception as e:  # pylint: disable=broad-except
             LOGGER.error("Error in saving Keepass Database %s", e)
             raise BitwardenException("Error in saving Keepass Database") from e
-
-        if exc_type is not None:
-            LOGGER.error("Error in processing %s", exc_value)
-            raise BitwardenException("Error in processing") from exc_value
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
 
         return True
 
+    def __remove_stale(self) -> None:
+        """
+        Remove entries, groups and binaries of the previous export that are no longer in Bitwarden
+        """
+        for entry in self.__existing_entries.values():
+            LOGGER.info("Removing Entry %s, it is no longer in Bitwarden", entry.title)
+            self.__py_kee_pass.delete_entry(entry)
+        self.__existing_entries = {}
+
+        stale_groups = [
+            group
+            for group in self.__py_kee_pass.groups
+            if not group.is_root_group and group.uuid not in self.__touched_groups
+        ]
+        for group in sorted(stale_groups, key=lambda stale_group: len(stale_group.path), reverse=True):
+            if len(group.entries) == 0 and len(group.subgroups) == 0:
+                LOGGER.info("Removing Group %s, it is no longer in Bitwarden", group.name)
+                self.__py_kee_pass.delete_group(group)
+
+        removed_binaries = remove_unreferenced_binaries(self.__py_kee_pass)
+        if removed_binaries > 0:
+            LOGGER.info("Removed %s Attachments no entry refers to anymore", removed_binaries)
+
+    def __index_groups(self) -> None:
+        """
+        Index all groups of the database by their path of names
+        """
+        self.__groups = {}
+        self.__group_paths = {}
+        pending: List[Tuple[Tuple[str, ...], Group]] = [((), self.__py_kee_pass.root_group)]
+        while pending:
+            group_path, group = pending.pop()
+            if group_path in self.__groups:
+                continue
+            self.__groups[group_path] = group
+            self.__group_paths[group.uuid] = group_path
+            pending.extend((group_path + (subgroup.name,), subgroup) for subgroup in reversed(group.subgroups))
+
     def __add_group_recursive(self, group_path: str, parent_group: Optional[Group] = None) -> Group:
         """
-        Recursively add group to Keepass
+        Add the group and all its missing parents to Keepass, existing groups are looked up in the group index
         """
         if not parent_group:
             parent_group = self.__py_kee_pass.root_group
 
-        if group_path.startswith("/"):
-            group_path = group_path[1:]
-
-        if group_path.endswith("/"):
-            group_path = group_path[:-1]
-
-        if group_path == "":
+        group_names = [group_name for group_name in group_path.split("/") if group_name != ""]
+        if len(group_names) == 0:
             raise BitwardenException("Group Path is empty")
 
-        existing_subgroups: List[Group] = parent_group.subgroups
-        if "/" in group_path:
-            group_name = group_path.split("/")[0]
-            for subgroup in existing_subgroups:
-                if subgroup.name == group_name:
-                    return self.__add_group_recursive(
-                        group_path="/".join(group_path.split("/")[1:]), parent_group=subgroup
-                    )
-            new_group = self.__py_kee_pass.add_group(parent_group, group_name=group_name)
-            return self.__add_group_recursive(group_path="/".join(group_path.split("/")[1:]), parent_group=new_group)
-        for subgroup in existing_subgroups:
-            if subgroup.name == group_path:
-                return subgroup
-        return self.__py_kee_pass.add_group(parent_group, group_name=group_path)
+        self.__touched_groups.add(parent_group.uuid)
+        current_path = self.__group_paths[parent_group.uuid]
+        current_group = parent_group
+        for group_name in group_names:
+            current_path = current_path + (group_name,)
+            group: Optional[Group] = self.__groups.get(current_path)
+            if group is None:
+                group = self.__py_kee_pass.add_group(current_group, group_name=group_name)
+                self.__groups[current_path] = group
+                self.__group_paths[group.uuid] = current_path
+            self.__touched_groups.add(group.uuid)
+            current_group = group
+        return current_group
 
     def __add_entry(self, group: Group, bw_item: BwItem) -> Entry:
         """
         Add an entry to Keepass
         """
+        existing_entry = self.__existing_entries.pop((bw_item.id, group.uuid), None)
+        if existing_entry is not None:
+            if existing_entry.get_custom_property(BW_REVISION_DATE_PROPERTY) == bw_item.revisionDate:
+                LOGGER.debug("Entry %s is unchanged", bw_item.name)
+                return existing_entry
+            LOGGER.debug("Entry %s has changed, replacing it", bw_item.name)
+            self.__py_kee_pass.delete_entry(existing_entry)
+        bw_item = bw_item.validated()
+
         entry: Entry = self.__py_kee_pass.add_entry(
             destination_group=group,
             title=bw_item.name,
             username="" if (not bw_item.login) or (not bw_item.login.username) else bw_item.login.username,
             password="" if (not bw_item.login) or (not bw_item.login.password) else bw_item.login.password,
         )
-        LOGGER.info("Adding Entry %s", bw_item.name)
+        LOGGER.debug("Adding Entry %s", bw_item.name)
+        entry.set_custom_property(BW_ITEM_ID_PROPERTY, bw_item.id, protect=False)
+        entry.set_custom_property(BW_REVISION_DATE_PROPERTY, bw_item.revisionDate, protect=False)
 
-        if bw_item.login and bw_item.login.fido2Credentials and len(bw_item.login.fido2Credentials) > 0:
+        if bw_item.login and bw_item.login.fido2Credentials:
             LOGGER.warning("Fido2Credentials are not supported in Keepass for %s", bw_item.name)
-            fido2credentials_dict: List[Dict[str, Any]] = [
-                fido2Credentials.model_dump() for fido2Credentials in bw_item.login.fido2Credentials
-            ]
-            fido2field = BwField(name="Fido2Credentials", value=json.dumps(fido2credentials_dict, indent=4), type=1)
-            bw_item.fields.append(fido2field)
-        bw_item.fields += self.__add_uri(entry, bw_item)
+        self.__add_uri(entry, bw_item)
         self.__add_fields(entry, bw_item)
         self.__add_attachment(entry, bw_item)
-        self.__add_otp(entry, bw_item)
+        otp = entry_otp(bw_item)
+        if otp is not None:
+            LOGGER.debug("Adding OTP for %s", bw_item.name)
+            entry.otp = otp
 
         if bw_item.notes:
             entry.notes = bw_item.notes
@@ -126,116 +379,118 @@ class KeePassStorage:
         return entry
 
     @staticmethod
-    def __add_uri(entry: Entry, bw_item: BwItem) -> List[BwField]:
+    def __add_uri(entry: Entry, bw_item: BwItem) -> None:
         """
-        Add URI to Keepass
+        Add URI to Keepass, all URIs are added as fields too
         """
-        if (not bw_item.login) or (not bw_item.login.uris) or len(bw_item.login.uris) == 0:
-            return []
+        url = entry_url(bw_item)
+        if url is None or not bw_item.login:
+            return
 
-        LOGGER.info("Adding URI for %s", bw_item.name)
-        entry.url = bw_item.login.uris[0].uri
+        LOGGER.debug("Adding URI for %s", bw_item.name)
+        entry.url = url
         if len(bw_item.login.uris) > 1:
             LOGGER.warning("Multiple URIs are not supported in Keepass for %s", bw_item.name)
             LOGGER.warning("Only the first URI will be added")
             LOGGER.warning("Rest of the URIs will be added as fields")
-        uri_list: List[BwField] = []
-        for uri in bw_item.login.uris:
-            field_name = "URI"
-            if uri.match:
-                field_name = f"URI-type-{uri.match}"
-            uri_item = BwField(name=field_name, value=uri.uri, type=0)
-            uri_list.append(uri_item)
-        return uri_list
 
-    @staticmethod
-    def __add_otp(entry: Entry, bw_item: BwItem) -> None:
+    def __add_fields(self, entry: Entry, item: BwItem) -> None:
         """
-        Add OTP to Keepass
+        Add fields to Keepass
         """
-        if (not bw_item.login) or (not bw_item.login.totp):
-            return None
-
-        LOGGER.info("Adding OTP for %s", bw_item.name)
-        if not bw_item.login.totp.startswith("otpauth://"):
-            url_safe_totp = bw_item.login.totp.replace(" ", "").lower()
-            url_safe_name = urllib.parse.quote_plus(bw_item.name)
-            bw_item.login.totp = (
-                f"otpauth://totp/{url_safe_name}?secret={url_safe_totp}"
-                f"&issuer={url_safe_name}&algorithm=SHA1&digits=6&period=30"
-            )
-            bw_item.login.totp = bw_item.login.totp
-        entry.otp = bw_item.login.totp
-        return None
+        LOGGER.debug("%s:: Adding Custom Fields to custom_properties", item.name)
+        for field in entry_fields(item):
+            if field.renamed_from is not None:
+                LOGGER.warning(
+                    "%s:: Field with name %s already exists, Renaming to %s", item.name, field.renamed_from, field.name
+                )
+            append_custom_property(entry, field.name, field.value, protect=field.protect)
 
-    def __fix_duplicate_field_names(self, entry: Entry, item: BwItem) -> None:
+    @staticmethod
+    def __fix_duplicate_attachment_names(entry: Entry, item: BwItem) -> None:
         """
-        Fix duplicate field names
+        Fix duplicate attachment names
         """
-        all_field_names = [] + list(entry.custom_properties.keys())
-        for field in item.fields:
-            if field.name in all_field_names:
-                LOGGER.warning("%s:: Field with name %s already exists, Adding -1", item.name, field.name)
-                field.name = f"{field.name}-1"
-                self.__fix_duplicate_field_names(entry, item)
-            if field.name == "otp":
-                LOGGER.warning("%s:: Field with name otp is reserved in keepass, Changing to otp-1", item.name)
-                field.name = "otp-1"
-                self.__fix_duplicate_field_names(entry, item)
-            all_field_names.append(field.name)
+        new_names = unique_names(
+            [attachment.fileName for attachment in item.attachments],
+            {attachment.filename for attachment in entry.attachments},
+        )
+        for attachment, new_name in zip(item.attachments, new_names):
+            if attachment.fileName != new_name:
+                LOGGER.warning(
+                    "%s:: Attachment with name %s already exists, Renaming to %s",
+                    item.name,
+                    attachment.fileName,
+                    new_name,
+                )
+                attachment.fileName = new_name
 
-    def __add_fields(self, entry: Entry, item: BwItem) -> None:  # pylint: disable=too-many-branches
+    def __add_binary(self, data: bytes) -> int:
         """
-        Add fields to Keepass
+        Add a binary to Keepass, payloads that are already stored are not added again
         """
-        LOGGER.info("%s:: Adding Custom Fields to custom_properties", item.name)
-        self.__fix_duplicate_field_names(entry, item)
-        for field in item.fields:
-            if field.type == 0:
-                if field.value:
-                    entry.set_custom_property(field.name, field.value, protect=False)
-                else:
-                    entry.set_custom_property(field.name, "", protect=False)
-            elif field.type == 1:
-                if field.value:
-                    entry.set_custom_property(field.name, field.value, protect=True)
-                else:
-                    entry.set_custom_property(field.name, "", protect=True)
-            elif field.type == 2:
-                entry.set_custom_property(field.name, field.value, protect=False)
-            elif field.type == 3 and field.linkedId:
-                if field.linkedId == 100:
-                    entry.set_custom_property(field.name, "Linked to Username", protect=False)
-                elif field.linkedId == 101:
-                    entry.set_custom_property(field.name, "Linked to Password", protect=False)
-                else:
-                    raise BitwardenException(f"{item.name}:: {field.name}:: Unknown linkedId {field.linkedId}")
-            else:
-                raise BitwardenException(f"{item.name}:: {field.name}:: Unknown Field Type {field.type}")
-
-    def __fix_duplicate_attachment_names(self, entry: Entry, item: BwItem) -> None:
+        digest = hashlib.sha256(data).hexdigest()
+        binary_id = self.__binary_ids.get(digest)
+        if binary_id is None:
+            binary_id = append_binary(self.__py_kee_pass, data)
+            self.__binary_ids[digest] = binary_id
+        return binary_id
+
+    def __add_stream_binary(self, stream: IO[bytes]) -> int:
         """
-        Fix duplicate attachment names
+        Add the content of a seekable stream as binary to Keepass, it is hashed first and only copied into the
+        binary if it is not stored yet, so a large attachment is held in memory only once
         """
-        all_attachment_names = [] + [attachment.fileName for attachment in entry.attachments]
-        for attachment in item.attachments:
-            if attachment.fileName in all_attachment_names:
-                LOGGER.warning("%s:: Attachment with name %s already exists, Adding -1", item.name, attachment.fileName)
-                attachment.fileName = f"{attachment.fileName}-1"
-                self.__fix_duplicate_attachment_names(entry, item)
-            all_attachment_names.append(attachment.fileName)
+        stream.seek(0)
+        stream_hash = hashlib.sha256()
+        size = 0
+        while chunk := stream.read(BINARY_BUFFER_SIZE):
+            stream_hash.update(chunk)
+            size += len(chunk)
+        digest = stream_hash.hexdigest()
+        binary_id = self.__binary_ids.get(digest)
+        if binary_id is None:
+            stream.seek(0)
+            binary_id = append_stream_binary(self.__py_kee_pass, stream, size)
+            self.__binary_ids[digest] = binary_id
+        return binary_id
+
+    def __add_file_binary(self, file_path: str) -> int:
+        """
+        Add the content of a file as binary to Keepass, the file is only read if its content is not stored yet
+        """
+        with open(file_path, "rb") as file_attach:
+            return self.__add_stream_binary(file_attach)
 
     def __add_attachment(self, entry: Entry, item: BwItem) -> None:
         """
         Add an attachment to Keepass
         """
-        LOGGER.info("%s:: Adding Attachments", item.name)
+        LOGGER.debug("%s:: Adding Attachments", item.name)
+        if self.__wait_for_attachments is not None and self.needs_attachments(item):
+            self.__wait_for_attachments(item)
+        if any(not attachment.local_file_path for attachment in item.attachments):
+            previous_entry = self.__previous_entry(item.id, item.revisionDate)
+            if previous_entry is None:
+                raise BitwardenException(f"{item.name}:: Attachments were not downloaded")
+            LOGGER.debug("%s:: Reusing Attachments of the previous export", item.name)
+            for previous_attachment in previous_entry.attachments:
+                entry.add_attachment(previous_attachment.id, previous_attachment.filename)
+            return
         self.__fix_duplicate_attachment_names(entry, item)
         for attachment in item.attachments:
-            LOGGER.info("%s:: Adding Attachment to keepass %s", item.name, attachment.fileName)
-            with open(attachment.local_file_path, "rb") as file_attach:
-                binary_id = self.__py_kee_pass.add_binary(data=file_attach.read(), protected=False, compressed=False)
-                entry.add_attachment(binary_id, attachment.fileName)
+            LOGGER.debug("%s:: Adding Attachment to keepass %s", item.name, attachment.fileName)
+            binary_id = self.__add_file_binary(attachment.local_file_path)
+            entry.add_attachment(binary_id, attachment.fileName)
+
+    def __add_my_vault_group(self) -> Group:
+        """
+        Returns the group of the items that belong to no organization, it is created on first use so the shard of an
+        organization does not get an empty one
+        """
+        if ("My Vault",) not in self.__groups:
+            LOGGER.info("Creating Keepass group My Vault")
+        return self.__add_group_recursive(group_path="My Vault")
 
     def process_organizations(self, bw_organizations: Dict[str, BwOrganization]) -> None:
         """
@@ -256,61 +511,80 @@ class KeePassStorage:
                 items = collection.items
                 collection.items = {}
                 collection_group.notes = json.dumps(collection.model_dump(), indent=4)
-                for item in items.values():
-                    LOGGER.info("%s::%s:: Processing Item %s", organization.name, collection.name, item.name)
+                METRICS.count_items(organization.name, collection.name, len(items))
+                for item_id in list(items):
+                    item = items.pop(item_id)
+                    LOGGER.debug("%s::%s:: Processing Item %s", organization.name, collection.name, item.name)
                     try:
                         self.__add_entry(collection_group, item)
                     except Exception as e:  # pylint: disable=broad-except
                         LOGGER.error("Error adding entry %s", e)
                         raise BitwardenException("Error adding entry") from e
+                    PROGRESS.advance("build_entries")
 
     def process_folders(self, bw_folders: Dict[str, BwFolder]) -> None:
         """
         Function to write to Keepass
         """
 
+        my_vault_group = self.__add_my_vault_group()
         for folder in bw_folders.values():
             if folder.name == "No Folder":
                 continue
             LOGGER.info("Processing Folder %s", folder.name)
-            folder_group: Group = self.__add_group_recursive(group_path=folder.name, parent_group=self.__my_vault_group)
+            folder_group: Group = self.__add_group_recursive(group_path=folder.name, parent_group=my_vault_group)
             items = folder.items
             folder.items = {}
             folder_group.notes = json.dumps(folder.model_dump(), indent=4)
-            for item in items.values():
-                LOGGER.info("%s:: Processing Item %s", folder.name, item.name)
+            METRICS.count_items("My Vault", folder.name, len(items))
+            for item_id in list(items):
+                item = items.pop(item_id)
+                LOGGER.debug("%s:: Processing Item %s", folder.name, item.name)
                 try:
                     self.__add_entry(folder_group, item)
                 except Exception as e:  # pylint: disable=broad-except
                     LOGGER.error("Error adding entry %s", e)
                     raise BitwardenException("Error adding entry") from e
+                PROGRESS.advance("build_entries")
 
     def process_no_folder_items(self, no_folder_items: List[BwItem]) -> None:
         """
-        Function to write to Keepass
+        Function to write to Keepass, the items are removed from the list as their entries are written
         """
 
         LOGGER.info("Processing Items with no Folder")
-        for item in no_folder_items:
-            LOGGER.info("Processing Item %s", item.name)
+        my_vault_group = self.__add_my_vault_group()
+        METRICS.count_items("My Vault", "", len(no_folder_items))
+        no_folder_items.reverse()
+        while no_folder_items:
+            item = no_folder_items.pop()
+            LOGGER.debug("Processing Item %s", item.name)
             try:
-                self.__add_entry(self.__my_vault_group, item)
+                self.__add_entry(my_vault_group, item)
             except Exception as e:
                 LOGGER.error("Error adding entry %s", e)
                 raise BitwardenException("Error adding entry") from e
+            PROGRESS.advance("build_entries")
 
     def process_bw_exports(self, raw_items: Dict[str, Any]) -> None:
         """
         Function to write to Keepass
         """
+        for previous_entry in self.__py_kee_pass.find_entries(
+            title=BW_EXPORT_ENTRY_TITLE, group=self.__py_kee_pass.root_group, recursive=False
+        ):
+            self.__py_kee_pass.delete_entry(previous_entry)
         entry: Entry = self.__py_kee_pass.add_entry(
             destination_group=self.__py_kee_pass.root_group,
-            title="Bitwarden Export",
+            title=BW_EXPORT_ENTRY_TITLE,
             username="",
             password="",  # nosec CWE-259
         )
         for key, value in raw_items.items():
-            binary_id = self.__py_kee_pass.add_binary(
-                data=json.dumps(value, indent=4).encode(), protected=False, compressed=False
-            )
+            if hasattr(value, "read"):
+                binary_id = self.__add_stream_binary(value)
+            elif isinstance(value, bytes):
+                binary_id = self.__add_binary(value)
+            else:
+                binary_id = self.__add_binary(json.dumps(value, indent=4).encode())
             entry.add_attachment(binary_id, key)
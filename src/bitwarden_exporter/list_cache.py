@@ -0,0 +1,351 @@
+"""
+This module keeps the answers of `bw list` across runs, encrypted, for as long as the vault has not synced since.
+
+`bw list` answers from the data the `bw` CLI synced last, so its answer does not change until the next `bw sync`. A
+list is stored per account with the `lastSync` that `bw status` reported when it was fetched, and it is reused only
+while `bw status` still reports that `lastSync`. A list of another `lastSync` is removed when it is found.
+
+Every list is a file of its own, encrypted with AES-256-GCM under a key derived from the export password with scrypt
+and a random salt of the cache. The account, the list and the `lastSync` are authenticated with it. A list is
+verified completely before its first object is used, a file that does not verify, for example after the export
+password changed, is removed like a stale one. Lists are written to a temporary file that is renamed into place once
+the list is complete. There is no shared index, so exports of several accounts can share the cache directory.
+
+Classes:
+    ListCache: Encrypted store of `bw list` answers with total size eviction.
+    CachingTransport: Wraps a transport and answers `bw list` from the cache while the vault has not synced.
+
+Functions:
+    clear_list_cache(cache_dir: str) -> None:
+        Removes every list stored in a cache directory.
+
+    derive_key(password: str, salt: bytes) -> bytes:
+        Derives an AES-256 key from the export password with scrypt.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from types import TracebackType
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple, Type
+
+from Cryptodome.Cipher import AES
+
+from . import BitwardenException
+from .metrics import METRICS
+from .transport import BwTransport
+
+LOGGER = logging.getLogger(__name__)
+
+LISTS = ("folders", "organizations", "collections", "items")
+SALT_FILE = "salt"
+LIST_SUFFIX = ".list"
+PART_SUFFIX = ".part"
+MAGIC = b"BWLISTS1"
+TAG_SIZE = 16
+CHUNK_SIZE = 1024 * 1024
+# a part file this old belongs to a run that died
+STALE_PART_SECONDS = 24 * 3600
+
+
+def derive_key(password: str, salt: bytes) -> bytes:
+    """
+    Derives the AES-256 key of files encrypted with the export password.
+    """
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=2**14, r=8, p=1, dklen=32)
+
+
+def clear_list_cache(cache_dir: str) -> None:
+    """
+    Removes every list stored in the cache directory, the explicit invalidation of the cache.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+    removed = 0
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith((LIST_SUFFIX, PART_SUFFIX)):
+            os.remove(os.path.join(cache_dir, file_name))
+            removed += 1
+    LOGGER.info("Removed %s lists from the list cache %s", removed, cache_dir)
+
+
+class _ListWriter:
+    """
+    Encrypts the objects of a list into a temporary file, `commit` moves it into place, leaving the context without
+    it removes the file
+    """
+
+    def __init__(self, path: str, key: bytes, header: Dict[str, Any]) -> None:
+        self.__path = path
+        self.__part_path = f"{path}.{uuid.uuid4().hex}{PART_SUFFIX}"
+        self.__committed = False
+        header_bytes = json.dumps(header).encode("utf-8")
+        self.__cipher = AES.new(key, AES.MODE_GCM, nonce=base64.b64decode(header["nonce"]))
+        self.__cipher.update(header_bytes)
+        self.__out: IO[bytes] = open(self.__part_path, "wb")  # pylint: disable=consider-using-with
+        self.__out.write(MAGIC + len(header_bytes).to_bytes(4, "big") + header_bytes)
+
+    def __enter__(self) -> "_ListWriter":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if not self.__out.closed:
+            self.__out.close()
+        if not self.__committed and os.path.exists(self.__part_path):
+            os.remove(self.__part_path)
+
+    def append(self, obj: Dict[str, Any]) -> None:
+        """
+        Encrypts one object of the list.
+        """
+        self.__out.write(self.__cipher.encrypt(json.dumps(obj).encode("utf-8") + b"\n"))
+
+    def commit(self) -> None:
+        """
+        Writes the authentication tag and moves the complete list into place.
+        """
+        self.__out.write(self.__cipher.digest())
+        self.__out.close()
+        os.replace(self.__part_path, self.__path)
+        self.__committed = True
+
+
+class ListCache:
+    """
+    Stores the answers of `bw list` by account and list under `cache_dir`, valid for the `lastSync` they were
+    fetched at, encrypted with a key derived from `password`
+
+    `close` removes the least recently used lists until the cache is not larger than `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, password: str, max_bytes: Optional[int] = None) -> None:
+        if not password:
+            raise BitwardenException("The list cache is encrypted with the export password, which is empty")
+        self.__cache_dir = os.path.abspath(cache_dir)
+        self.__max_bytes = max_bytes
+        os.makedirs(self.__cache_dir, mode=0o700, exist_ok=True)
+        self.__key = derive_key(password, self.__salt())
+
+    def __salt(self) -> bytes:
+        """
+        Returns the salt of the cache, it is created by the first run
+        """
+        salt_file = os.path.join(self.__cache_dir, SALT_FILE)
+        try:
+            with open(salt_file, "xb") as salt_out:
+                salt_out.write(os.urandom(16))
+        except FileExistsError:
+            pass
+        with open(salt_file, "rb") as salt_in:
+            return salt_in.read()
+
+    def __path(self, account: str, object_name: str) -> str:
+        """
+        Returns the file of a list of an account
+        """
+        name = hashlib.sha256(f"{account}\0{object_name}".encode("utf-8")).hexdigest()[:40]
+        return os.path.join(self.__cache_dir, name + LIST_SUFFIX)
+
+    def __discard(self, path: str, reason: str) -> None:
+        """
+        Removes a stored list that can not be used
+        """
+        LOGGER.info("Removing %s from the list cache, %s", os.path.basename(path), reason)
+        METRICS.increment("list_cache_invalid_total")
+        if os.path.exists(path):
+            os.remove(path)
+
+    def __open_verified(
+        self, path: str, account: str, last_sync: str, object_name: str
+    ) -> Optional[Tuple[IO[bytes], Any, int]]:
+        """
+        Opens a stored list and verifies it completely, returns the file positioned at the start of the objects, the
+        cipher to decrypt them and their size, None if there is no valid list
+        """
+        try:
+            list_in: IO[bytes] = open(path, "rb")  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return None
+        try:
+            prefix = list_in.read(len(MAGIC) + 4)
+            if prefix[: len(MAGIC)] != MAGIC:
+                raise ValueError("it is not a list of this cache")
+            header_bytes = list_in.read(int.from_bytes(prefix[len(MAGIC) :], "big"))
+            header = json.loads(header_bytes)
+            if header.get("account") != account or header.get("list") != object_name:
+                raise ValueError("it belongs to another list")
+            if header.get("last_sync") != last_sync:
+                list_in.close()
+                self.__discard(path, f"the vault synced since {header.get('last_sync')}")
+                return None
+            start = list_in.tell()
+            size = os.fstat(list_in.fileno()).st_size - start - TAG_SIZE
+            if size < 0:
+                raise ValueError("it is truncated")
+            nonce = base64.b64decode(header["nonce"])
+            cipher = AES.new(self.__key, AES.MODE_GCM, nonce=nonce)
+            cipher.update(header_bytes)
+            remaining = size
+            while remaining > 0:
+                cipher.decrypt(list_in.read(min(CHUNK_SIZE, remaining)))
+                remaining -= min(CHUNK_SIZE, remaining)
+            cipher.verify(list_in.read(TAG_SIZE))
+        except (ValueError, KeyError, TypeError) as e:
+            list_in.close()
+            self.__discard(path, f"it does not verify: {e}")
+            return None
+        list_in.seek(start)
+        cipher = AES.new(self.__key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(header_bytes)
+        return list_in, cipher, size
+
+    def load(self, account: str, last_sync: str, object_name: str) -> Optional[Iterator[Dict[str, Any]]]:
+        """
+        Returns the objects of a list stored at `last_sync`, verified before the first is used, None if the cache
+        holds no valid list.
+        """
+        path = self.__path(account, object_name)
+        opened = self.__open_verified(path, account, last_sync, object_name)
+        if opened is None:
+            METRICS.increment("list_cache_misses_total")
+            return None
+        METRICS.increment("list_cache_hits_total")
+        LOGGER.info("Taking %s from the list cache, the vault did not sync since %s", object_name, last_sync)
+        os.utime(path)
+
+        def objects(list_in: IO[bytes], cipher: Any, size: int) -> Iterator[Dict[str, Any]]:
+            with list_in:
+                pending = b""
+                while size > 0:
+                    chunk = cipher.decrypt(list_in.read(min(CHUNK_SIZE, size)))
+                    size -= min(CHUNK_SIZE, size)
+                    lines = (pending + chunk).split(b"\n")
+                    pending = lines.pop()
+                    for line in lines:
+                        yield json.loads(line)
+
+        return objects(*opened)
+
+    def writer(self, account: str, last_sync: str, object_name: str) -> _ListWriter:
+        """
+        Returns a writer that stores a list fetched at `last_sync` once it is committed.
+        """
+        header = {
+            "account": account,
+            "list": object_name,
+            "last_sync": last_sync,
+            "nonce": base64.b64encode(os.urandom(12)).decode(),
+            "stored_at": time.time(),
+        }
+        return _ListWriter(self.__path(account, object_name), self.__key, header)
+
+    def close(self) -> None:
+        """
+        Removes the part files of runs that died and the least recently used lists until the cache fits.
+        """
+        lists: List[Tuple[float, int, str]] = []
+        for file_name in os.listdir(self.__cache_dir):
+            path = os.path.join(self.__cache_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if file_name.endswith(PART_SUFFIX) and stat.st_mtime < time.time() - STALE_PART_SECONDS:
+                os.remove(path)
+            elif file_name.endswith(LIST_SUFFIX):
+                lists.append((stat.st_mtime, stat.st_size, path))
+        total_bytes = sum(size for _, size, _ in lists)
+        if self.__max_bytes is not None:
+            for _, size, path in sorted(lists):
+                if total_bytes <= self.__max_bytes:
+                    break
+                LOGGER.debug("Evicting %s from the list cache, cache is full", os.path.basename(path))
+                os.remove(path)
+                total_bytes -= size
+                METRICS.increment("list_cache_evicted_total")
+        METRICS.set_gauge("list_cache_bytes", total_bytes)
+        LOGGER.info("List cache saved, %s bytes", total_bytes)
+
+
+class CachingTransport(BwTransport):
+    """
+    Answers `bw list` from a list cache while `bw status` reports the `lastSync` the lists were stored at, and stores
+    the lists it fetches from the wrapped transport
+
+    Nothing is cached before the status of an unlocked, synced vault was seen. A list is only stored once it was
+    read to its end.
+    """
+
+    def __init__(self, transport: BwTransport, cache: ListCache) -> None:
+        self.__transport = transport
+        self.__cache = cache
+        self.__account: Optional[str] = None
+        self.__last_sync: Optional[str] = None
+
+    def __observe(self, status: Dict[str, Any]) -> None:
+        """
+        Takes the account and `lastSync` the lists of this run are stored at from the status of the vault
+        """
+        if status.get("status") != "unlocked" or not status.get("lastSync") or not status.get("userId"):
+            self.__account = self.__last_sync = None
+            return
+        self.__account = hashlib.sha256(f"{status.get('serverUrl') or ''}\0{status['userId']}".encode()).hexdigest()
+        self.__last_sync = status["lastSync"]
+
+    def exec(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        cmd: List[str],
+        ret_encoding: str = "UTF-8",
+        env_vars: Optional[Dict[str, str]] = None,
+        is_raw: bool = True,
+        timeout: Optional[float] = None,
+    ) -> str:
+        if len(cmd) == 2 and cmd[0] == "list" and cmd[1] in LISTS and self.__account is not None:
+            return json.dumps(list(self.iter_list(cmd[1], timeout=timeout)))
+        output = self.__transport.exec(
+            cmd, ret_encoding=ret_encoding, env_vars=env_vars, is_raw=is_raw, timeout=timeout
+        )
+        if cmd == ["status"]:
+            self.__observe(json.loads(output))
+        return output
+
+    def iter_list(
+        self, object_name: str, timeout: Optional[float] = None, bytes_per_second: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        if self.__account is None or self.__last_sync is None or object_name not in LISTS:
+            yield from self.__transport.iter_list(object_name, timeout, bytes_per_second)
+            return
+        cached = self.__cache.load(self.__account, self.__last_sync, object_name)
+        if cached is not None:
+            yield from cached
+            return
+        with self.__cache.writer(self.__account, self.__last_sync, object_name) as writer:
+            for obj in self.__transport.iter_list(object_name, timeout, bytes_per_second):
+                writer.append(obj)
+                yield obj
+            writer.commit()
+
+    def download_attachment(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        item_id: str,
+        attachment_id: str,
+        download_location: str,
+        expected_bytes: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.__transport.download_attachment(
+            item_id, attachment_id, download_location, expected_bytes=expected_bytes, timeout=timeout
+        )
+
+    def close(self) -> None:
+        self.__cache.close()
+        self.__transport.close()
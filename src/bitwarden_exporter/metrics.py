@@ -0,0 +1,182 @@
+"""
+This module collects timings and counters of an export run and writes them as JSON or in the Prometheus text format.
+
+Classes:
+    ExportMetrics: Thread safe collector for the metrics of one export run.
+
+Functions:
+    peak_memory_bytes() -> Optional[int]:
+        Returns the peak resident memory of the process, if the platform reports it.
+
+Variables:
+    METRICS: The collector used by the exporter.
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore
+
+PROMETHEUS_PREFIX = "bitwarden_exporter"
+
+
+def peak_memory_bytes() -> Optional[int]:
+    """
+    Returns the peak resident memory of the process, None if the platform does not report it.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return int(peak) if sys.platform == "darwin" else int(peak) * 1024
+
+
+def _prometheus_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class ExportMetrics:
+    """
+    Collects the phase durations, counters, gauges and item counts of an export run
+    """
+
+    def __init__(self) -> None:
+        self.__lock = threading.Lock()
+        self.__started_at = time.time()
+        self.__phases: Dict[str, float] = {}
+        self.__counters: Dict[str, float] = {}
+        self.__gauges: Dict[str, float] = {}
+        self.__items: Dict[Tuple[str, str], int] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Adds the time spent in the block to the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.__lock:
+                self.__phases[name] = self.__phases.get(name, 0.0) + elapsed
+
+    def increment(self, name: str, value: float = 1.0) -> None:
+        """
+        Adds the value to a counter.
+        """
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0.0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """
+        Sets a gauge to the value.
+        """
+        with self.__lock:
+            self.__gauges[name] = value
+
+    def count_items(self, organization: str, collection: str, count: int) -> None:
+        """
+        Adds the number of items written for a collection of an organization, or a folder of "My Vault".
+        """
+        with self.__lock:
+            self.__items[(organization, collection)] = self.__items.get((organization, collection), 0) + count
+
+    def reset(self) -> None:
+        """
+        Clears all metrics, used by worker processes that inherited the metrics of their parent.
+        """
+        with self.__lock:
+            self.__started_at = time.time()
+            self.__phases = {}
+            self.__counters = {}
+            self.__gauges = {}
+            self.__items = {}
+
+    def merge(self, metrics: Dict[str, Any]) -> None:
+        """
+        Adds the phases, counters and item counts of `to_dict` output, e.g. of a worker process. Gauges are not merged.
+        """
+        with self.__lock:
+            for name, value in metrics["phases_seconds"].items():
+                self.__phases[name] = self.__phases.get(name, 0.0) + value
+            for name, value in metrics["counters"].items():
+                self.__counters[name] = self.__counters.get(name, 0.0) + value
+            for item in metrics["items"]:
+                key = (item["organization"], item["collection"])
+                self.__items[key] = self.__items.get(key, 0) + item["count"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns all metrics as a JSON serializable dictionary.
+        """
+        with self.__lock:
+            return {
+                "started_at": self.__started_at,
+                "phases_seconds": dict(self.__phases),
+                "counters": dict(self.__counters),
+                "gauges": dict(self.__gauges),
+                "items": [
+                    {"organization": organization, "collection": collection, "count": count}
+                    for (organization, collection), count in self.__items.items()
+                ],
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        metrics = self.to_dict()
+        lines: List[str] = []
+
+        def add(name: str, help_text: str, samples: List[Tuple[str, float]], metric_type: str = "gauge") -> None:
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {metric_type}")
+            lines.extend(f"{PROMETHEUS_PREFIX}_{name}{labels} {value}" for labels, value in samples)
+
+        add("started_at_seconds", "Unix time the export started", [("", metrics["started_at"])])
+        add(
+            "phase_seconds",
+            "Seconds spent in each phase of the export",
+            [(f'{{phase="{_prometheus_label(phase)}"}}', value) for phase, value in metrics["phases_seconds"].items()],
+        )
+        for name, value in metrics["counters"].items():
+            add(name, f"Counter {name} of the export", [("", value)], "counter")
+        for name, value in metrics["gauges"].items():
+            add(name, f"Gauge {name} of the export", [("", value)])
+        add(
+            "collection_items",
+            "Items written per organization and collection",
+            [
+                (
+                    f'{{organization="{_prometheus_label(item["organization"])}",'
+                    f'collection="{_prometheus_label(item["collection"])}"}}',
+                    item["count"],
+                )
+                for item in metrics["items"]
+            ],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, output_format: str) -> None:
+        """
+        Writes the metrics to a file, atomically so collectors never read a partial file.
+        """
+        content = self.to_prometheus() if output_format == "prometheus" else json.dumps(self.to_dict(), indent=4)
+        parent_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent_dir, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(content)
+        os.replace(tmp_path, path)
+
+
+METRICS = ExportMetrics()
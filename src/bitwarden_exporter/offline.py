@@ -0,0 +1,342 @@
+"""
+This module reads the vault from the local data file of the Bitwarden CLI, without running `bw`.
+
+After `bw sync` the CLI keeps the whole vault encrypted in its `data.json`, together with the user key encrypted with
+the session key `bw unlock` prints. With the session the user key is decrypted, with it the RSA private key of the
+user and with that the keys of the organizations. Folders, collections and items are decrypted with the key they
+belong to, or with their own key if they have one, and returned in the shape `bw list` prints them, so they become
+the same models as the output of the CLI.
+
+Only the layout the CLI writes since its state providers (2024) is read, the data file of an older CLI is rejected.
+The data file is as current as the last `bw sync`.
+
+Classes:
+    SymmetricKey: An AES-256-CBC key with its HMAC-SHA256 key.
+    OfflineVault: The vault in a data file of the Bitwarden CLI, decrypted with the session.
+
+Variables:
+    OFFLINE_LIST_OBJECTS: The objects `bw list` is answered for from the data file.
+
+Functions:
+    default_data_file() -> str:
+        Returns the data file the Bitwarden CLI uses.
+
+    decrypt_enc_string(enc_string: str, key: SymmetricKey) -> bytes:
+        Decrypts an encrypted string of Bitwarden with a symmetric key.
+
+Exceptions:
+    BitwardenException:
+        Raised when the data file can not be read or decrypted.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+from Cryptodome.Cipher import AES, PKCS1_OAEP
+from Cryptodome.Hash import SHA1, SHA256
+from Cryptodome.PublicKey import RSA
+from Cryptodome.Util.Padding import unpad
+from pydantic import BaseModel
+
+from . import BitwardenException
+
+LOGGER = logging.getLogger(__name__)
+
+OFFLINE_LIST_OBJECTS = ("folders", "organizations", "collections", "items")
+
+# Values of an item that are stored in plain text, every other string of an item is encrypted
+PLAIN_ITEM_FIELDS = frozenset(
+    (
+        "id",
+        "organizationId",
+        "folderId",
+        "collectionIds",
+        "revisionDate",
+        "creationDate",
+        "deletedDate",
+        "passwordRevisionDate",
+        "lastUsedDate",
+        "size",
+        "sizeName",
+        "url",
+    )
+)
+# Values of an item in the data file that `bw list items` does not print
+LOCAL_ITEM_FIELDS = frozenset(
+    ("key", "uriChecksum", "edit", "viewPassword", "organizationUseTotp", "permissions", "localData")
+)
+
+
+class SymmetricKey(BaseModel):
+    """
+    A symmetric key of Bitwarden, the encryption key and the MAC key, which keys of the oldest type do not have
+    """
+
+    enc_key: bytes
+    mac_key: Optional[bytes] = None
+
+    @classmethod
+    def from_bytes(cls, key: bytes) -> "SymmetricKey":
+        """
+        Splits the 64 bytes of a key into its encryption and MAC key, a key of 32 bytes has no MAC key.
+        """
+        if len(key) == 64:
+            return cls(enc_key=key[:32], mac_key=key[32:])
+        if len(key) == 32:
+            return cls(enc_key=key)
+        raise BitwardenException(f"Invalid symmetric key of {len(key)} bytes")
+
+
+def default_data_file() -> str:
+    """
+    Returns the data file of the Bitwarden CLI, in BITWARDENCLI_APPDATA_DIR or the application data directory of the
+    platform.
+    """
+    appdata_dir = os.environ.get("BITWARDENCLI_APPDATA_DIR")
+    if not appdata_dir:
+        if sys.platform == "darwin":
+            appdata_dir = os.path.expanduser("~/Library/Application Support/Bitwarden CLI")
+        elif sys.platform == "win32":
+            appdata_dir = os.path.join(os.environ.get("APPDATA", os.path.expanduser("~")), "Bitwarden CLI")
+        else:
+            appdata_dir = os.path.join(
+                os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"), "Bitwarden CLI"
+            )
+    return os.path.join(appdata_dir, "data.json")
+
+
+def _decrypt_aes(iv: bytes, data: bytes, mac: Optional[bytes], key: SymmetricKey) -> bytes:
+    """
+    Checks the MAC over IV and data, if the key has a MAC key, and decrypts the data
+    """
+    if key.mac_key is not None:
+        if mac is None or not hmac.compare_digest(hmac.new(key.mac_key, iv + data, hashlib.sha256).digest(), mac):
+            raise BitwardenException("Unable to decrypt, the MAC does not match the key")
+    try:
+        return bytes(unpad(AES.new(key.enc_key, AES.MODE_CBC, iv).decrypt(data), AES.block_size))
+    except ValueError as e:
+        raise BitwardenException(f"Unable to decrypt: {e}") from e
+
+
+def decrypt_enc_string(enc_string: str, key: SymmetricKey) -> bytes:
+    """
+    Decrypts an encrypted string, `2.iv|data|mac` (AES-256-CBC with HMAC-SHA256) or the older `0.iv|data`.
+    """
+    enc_type, _, value = enc_string.partition(".")
+    parts = [base64.b64decode(part) for part in value.split("|")]
+    if enc_type == "2" and len(parts) == 3:
+        return _decrypt_aes(parts[0], parts[1], parts[2], key)
+    if enc_type == "0" and len(parts) == 2 and key.mac_key is None:
+        return _decrypt_aes(parts[0], parts[1], None, key)
+    raise BitwardenException(f"Unsupported encrypted string of type {enc_type}")
+
+
+def _decrypt_rsa(enc_string: str, private_key: RSA.RsaKey) -> bytes:
+    """
+    Decrypts an encrypted string of type 3 (RSA-OAEP with SHA-256) or 4 (RSA-OAEP with SHA-1)
+    """
+    enc_type, _, value = enc_string.partition(".")
+    hash_algorithms = {"3": SHA256, "4": SHA1}
+    if enc_type not in hash_algorithms:
+        raise BitwardenException(f"Unsupported RSA encrypted string of type {enc_type}")
+    try:
+        return bytes(PKCS1_OAEP.new(private_key, hashAlgo=hash_algorithms[enc_type]).decrypt(base64.b64decode(value)))
+    except ValueError as e:
+        raise BitwardenException(f"Unable to decrypt: {e}") from e
+
+
+def _decrypt_buffer(buffer: bytes, key: SymmetricKey) -> bytes:
+    """
+    Decrypts an encrypted buffer, its type byte 2 followed by IV, MAC and data
+    """
+    if len(buffer) < 49 or buffer[0] != 2:
+        raise BitwardenException("Unsupported encrypted buffer")
+    return _decrypt_aes(buffer[1:17], buffer[49:], buffer[17:49], key)
+
+
+class OfflineVault:
+    """
+    The vault in a data file of the Bitwarden CLI, decrypted with the session key of `bw unlock`
+
+    The vault is locked if there is no session or the data file holds no user key for it, like after `bw lock`.
+    Keys are decrypted on first use, items one by one as they are listed.
+    """
+
+    def __init__(self, data_file: str, session: Optional[str]) -> None:
+        try:
+            with open(data_file, "r", encoding="utf-8") as data_in:
+                self.__data: Dict[str, Any] = json.load(data_in)
+        except (OSError, ValueError) as e:
+            raise BitwardenException(f"Unable to read the Bitwarden CLI data file {data_file}: {e}") from e
+        self.__user_id: Optional[str] = self.__data.get("global_account_activeAccountId")
+        if self.__user_id is None:
+            raise BitwardenException(f"{data_file} has no active account, log in with a current Bitwarden CLI")
+        self.__user_key: Optional[SymmetricKey] = None
+        self.__organization_keys: Dict[str, SymmetricKey] = {}
+        protected_user_key = self.__data.get(f"__PROTECTED__{self.__user_id}_user_auto")
+        if session and protected_user_key:
+            session_key = SymmetricKey.from_bytes(base64.b64decode(session))
+            try:
+                self.__user_key = SymmetricKey.from_bytes(
+                    _decrypt_buffer(base64.b64decode(protected_user_key), session_key)
+                )
+            except BitwardenException as e:
+                raise BitwardenException(f"The session can not decrypt the user key in {data_file}: {e}") from e
+        LOGGER.info("Reading the vault from %s, last synced at %s", data_file, self.__user_state("sync_lastSync"))
+
+    def __user_state(self, name: str, default: Any = None) -> Any:
+        """
+        Returns a state of the active user, like `ciphers_ciphers`
+        """
+        return self.__data.get(f"user_{self.__user_id}_{name}", default)
+
+    def __require_user_key(self) -> SymmetricKey:
+        """
+        Returns the user key, the vault has to be unlocked
+        """
+        if self.__user_key is None:
+            raise BitwardenException("Vault is not unlocked, BW_SESSION has to hold the session of bw unlock")
+        return self.__user_key
+
+    def __organization_key(self, organization_id: str) -> SymmetricKey:
+        """
+        Returns the key of an organization, decrypted with the private key of the user
+        """
+        if organization_id not in self.__organization_keys:
+            encrypted_keys: Dict[str, Dict[str, Any]] = self.__user_state("crypto_organizationKeys", {})
+            encrypted_key = encrypted_keys.get(organization_id)
+            if encrypted_key is None or encrypted_key.get("type") != "organization":
+                raise BitwardenException(f"There is no key for organization {organization_id} in the data file")
+            private_key = RSA.import_key(
+                decrypt_enc_string(self.__user_state("crypto_privateKey"), self.__require_user_key())
+            )
+            self.__organization_keys[organization_id] = SymmetricKey.from_bytes(
+                _decrypt_rsa(encrypted_key["key"], private_key)
+            )
+        return self.__organization_keys[organization_id]
+
+    def __key(self, organization_id: Optional[str]) -> SymmetricKey:
+        """
+        Returns the key of the organization, or the user key for objects of no organization
+        """
+        if organization_id:
+            return self.__organization_key(organization_id)
+        return self.__require_user_key()
+
+    def __decrypt(self, value: Any, key: SymmetricKey, name: str = "") -> Any:
+        """
+        Decrypts the encrypted strings of an item, the values that stay in the data file are left out
+        """
+        if isinstance(value, dict):
+            return {
+                child_name: self.__decrypt(child, key, child_name)
+                for child_name, child in value.items()
+                if child_name not in LOCAL_ITEM_FIELDS
+            }
+        if isinstance(value, list):
+            return [self.__decrypt(child, key, name) for child in value]
+        if isinstance(value, str) and name not in PLAIN_ITEM_FIELDS:
+            return decrypt_enc_string(value, key).decode("utf-8")
+        return value
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Returns the status of the vault like `bw status` prints it.
+        """
+        accounts: Dict[str, Dict[str, Any]] = self.__data.get("global_account_accounts", {})
+        environment: Dict[str, Any] = self.__user_state("environment_environment") or {}
+        return {
+            "serverUrl": (environment.get("urls") or {}).get("base"),
+            "lastSync": self.__user_state("sync_lastSync"),
+            "userEmail": accounts.get(str(self.__user_id), {}).get("email"),
+            "userId": self.__user_id,
+            "status": "unlocked" if self.__user_key is not None else "locked",
+        }
+
+    def folders(self) -> List[Dict[str, Any]]:
+        """
+        Returns the folders like `bw list folders`, by name and the "No Folder" folder last.
+        """
+        user_key = self.__require_user_key()
+        folders = [
+            {"object": "folder", "id": folder["id"], "name": decrypt_enc_string(folder["name"], user_key).decode()}
+            for folder in (self.__user_state("folder_folders") or {}).values()
+        ]
+        folders.sort(key=lambda folder: folder["name"].casefold())
+        return folders + [{"object": "folder", "id": None, "name": "No Folder"}]
+
+    def organizations(self) -> List[Dict[str, Any]]:
+        """
+        Returns the organizations like `bw list organizations`, by name.
+        """
+        organizations = [
+            {
+                "object": "organization",
+                "id": organization["id"],
+                "name": organization["name"],
+                "status": organization["status"],
+                "type": organization["type"],
+                "enabled": organization["enabled"],
+            }
+            for organization in (self.__user_state("organizations_organizations") or {}).values()
+        ]
+        organizations.sort(key=lambda organization: organization["name"].casefold())
+        return organizations
+
+    def collections(self) -> List[Dict[str, Any]]:
+        """
+        Returns the collections of all organizations like `bw list collections`, by name.
+        """
+        collections = [
+            {
+                "object": "collection",
+                "id": collection["id"],
+                "organizationId": collection["organizationId"],
+                "name": decrypt_enc_string(
+                    collection["name"], self.__organization_key(collection["organizationId"])
+                ).decode(),
+                "externalId": collection.get("externalId"),
+            }
+            for collection in (self.__user_state("collection_collections") or {}).values()
+        ]
+        collections.sort(key=lambda collection: collection["name"].casefold())
+        return collections
+
+    def iter_items(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the items like `bw list items`, decrypted one by one, items in the trash are left out.
+        """
+        for cipher in (self.__user_state("ciphers_ciphers") or {}).values():
+            if cipher.get("deletedDate"):
+                continue
+            key = self.__key(cipher.get("organizationId"))
+            if cipher.get("key"):
+                key = SymmetricKey.from_bytes(decrypt_enc_string(cipher["key"], key))
+            try:
+                bw_item_dict: Dict[str, Any] = {"object": "item", **self.__decrypt(cipher, key)}
+            except BitwardenException as e:
+                raise BitwardenException(f"Unable to decrypt item {cipher.get('id')}: {e}") from e
+            bw_item_dict["collectionIds"] = bw_item_dict.get("collectionIds") or []
+            bw_item_dict.setdefault("reprompt", 0)
+            yield bw_item_dict
+
+    def iter_list(self, object_name: str) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the objects of `bw list <object_name>` for folders, organizations, collections and items.
+        """
+        if object_name not in OFFLINE_LIST_OBJECTS:
+            raise BitwardenException(f"Can not list {object_name} from the data file")
+        if object_name == "items":
+            yield from self.iter_items()
+        elif object_name == "folders":
+            yield from self.folders()
+        elif object_name == "organizations":
+            yield from self.organizations()
+        else:
+            yield from self.collections()
@@ -0,0 +1,263 @@
+"""
+This module reports the progress of the phases of an export, rate limited, instead of logging every item.
+
+A phase counts the items and bytes it is done with, and its total where it is known. The progress of all running
+phases is written to the log at most once per interval, with items/s, bytes/s, done/total and the ETA, or drawn as a
+progress bar on a terminal. When a phase finishes, its summary is always logged.
+
+Classes:
+    ProgressReporter: Thread safe progress of the running phases of an export.
+
+Functions:
+    format_bytes(value: float) -> str:
+        Returns a byte count in the largest binary unit below it.
+
+    reporter_bar(mode: str, stream: IO[str]) -> Optional[IO[str]]:
+        Returns the stream to draw the progress bar on for a `--progress` mode.
+
+Variables:
+    PROGRESS: The reporter used by the exporter.
+"""
+
+import contextlib
+import logging
+import shutil
+import sys
+import threading
+import time
+from typing import IO, Dict, Iterator, List, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+BAR_REFRESH_SECONDS = 0.2
+BAR_WIDTH = 20
+
+
+def format_bytes(value: float) -> str:
+    """
+    Returns a byte count in B, KiB, MiB or GiB.
+    """
+    for unit in ("B", "KiB", "MiB"):
+        if abs(value) < 1024:
+            return f"{value:.1f} {unit}" if unit != "B" else f"{int(value)} {unit}"
+        value /= 1024
+    return f"{value:.1f} GiB"
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class _Phase:  # pylint: disable=too-few-public-methods
+    """
+    Counters of one phase, the lock of the reporter guards them
+    """
+
+    def __init__(self, unit: str, total: Optional[int], total_bytes: Optional[int]) -> None:
+        self.unit = unit
+        self.total = total
+        self.total_bytes = total_bytes
+        self.done = 0
+        self.done_bytes = 0
+        self.started_at = time.monotonic()
+        self.advanced_at = self.started_at
+
+    def describe(self, name: str, now: float, with_eta: bool = True) -> str:
+        """
+        Returns the progress of the phase as one line
+        """
+        elapsed = max(now - self.started_at, 1e-6)
+        parts = [f"{name} {self.done}" + (f"/{self.total}" if self.total is not None else "") + f" {self.unit}"]
+        parts.append(f"{self.done / elapsed:.1f} {self.unit}/s")
+        if self.done_bytes > 0 or self.total_bytes:
+            parts.append(
+                format_bytes(self.done_bytes)
+                + (f"/{format_bytes(self.total_bytes)}" if self.total_bytes else "")
+                + f" {format_bytes(self.done_bytes / elapsed)}/s"
+            )
+        eta = self.eta(elapsed) if with_eta else None
+        if eta is not None:
+            parts.append(f"ETA {_format_duration(eta)}")
+        return ", ".join(parts)
+
+    def eta(self, elapsed: float) -> Optional[float]:
+        """
+        Returns the seconds left at the rate so far, by bytes if the total bytes are known, None without a total
+        """
+        if self.total_bytes and self.done_bytes > 0:
+            return max(self.total_bytes - self.done_bytes, 0) * elapsed / self.done_bytes
+        if self.total is not None and self.done > 0:
+            return max(self.total - self.done, 0) * elapsed / self.done
+        return None
+
+    def idle(self) -> bool:
+        """
+        Returns whether all work known so far is done, like downloads waiting for more items
+        """
+        return self.done >= self.total if self.total is not None else self.done == 0
+
+    def fraction(self) -> Optional[float]:
+        """
+        Returns how much of the phase is done, None without a total
+        """
+        if self.total_bytes:
+            return min(self.done_bytes / self.total_bytes, 1.0)
+        if self.total:
+            return min(self.done / self.total, 1.0)
+        return None
+
+
+class ProgressReporter:
+    """
+    Progress of the running phases, safe to advance from several threads
+
+    Phases that were not started are not reported, so code that runs outside of a reported export, like the
+    shard worker processes, can advance them freely. With `bar_stream` the progress is drawn on that stream instead of
+    being logged, the summaries of finished phases are logged in any case.
+    """
+
+    def __init__(self, interval: float = 10.0, bar_stream: Optional[IO[str]] = None, enabled: bool = True) -> None:
+        self.__lock = threading.Lock()
+        self.__phases: Dict[str, _Phase] = {}
+        self.__interval = interval
+        self.__bar = bar_stream
+        self.__enabled = enabled
+        self.__last_report = time.monotonic()
+        self.__bar_width = 0
+
+    def configure(self, interval: float, bar_stream: Optional[IO[str]] = None, enabled: bool = True) -> None:
+        """
+        Sets how often and where the progress is reported, `enabled` False only logs the finished phases.
+        """
+        with self.__lock:
+            self.__interval = interval
+            self.__bar = bar_stream
+            self.__enabled = enabled
+
+    def start(
+        self, name: str, unit: str = "items", total: Optional[int] = None, total_bytes: Optional[int] = None
+    ) -> None:
+        """
+        Starts reporting a phase, a phase that runs again starts over.
+        """
+        with self.__lock:
+            self.__phases[name] = _Phase(unit, total, total_bytes)
+
+    @contextlib.contextmanager
+    def phase(
+        self, name: str, unit: str = "items", total: Optional[int] = None, total_bytes: Optional[int] = None
+    ) -> Iterator[None]:
+        """
+        Reports a phase while the block runs.
+        """
+        self.start(name, unit=unit, total=total, total_bytes=total_bytes)
+        success = False
+        try:
+            yield
+            success = True
+        finally:
+            self.finish(name, summary=success)
+
+    def add_total(self, name: str, count: int = 1, nbytes: int = 0) -> None:
+        """
+        Grows the total of a phase whose work becomes known while it runs.
+        """
+        with self.__lock:
+            phase = self.__phases.get(name)
+            if phase is None:
+                return
+            phase.total = (phase.total or 0) + count
+            if nbytes > 0:
+                phase.total_bytes = (phase.total_bytes or 0) + nbytes
+
+    def advance(self, name: str, count: int = 1, nbytes: int = 0) -> None:
+        """
+        Counts finished work of a phase and reports the progress if it is due.
+        """
+        with self.__lock:
+            phase = self.__phases.get(name)
+            if phase is None:
+                return
+            phase.done += count
+            phase.done_bytes += nbytes
+            phase.advanced_at = time.monotonic()
+            if not self.__enabled:
+                return
+            now = time.monotonic()
+            if self.__bar is not None:
+                if now - self.__last_report >= BAR_REFRESH_SECONDS:
+                    self.__draw(now)
+            elif now - self.__last_report >= self.__interval:
+                LOGGER.info("Progress: %s", " | ".join(self.__describe_all(now)))
+                self.__last_report = now
+
+    def finish(self, name: str, summary: bool = True) -> None:
+        """
+        Stops reporting a phase and logs its summary, unless `summary` is False because the phase failed.
+        """
+        with self.__lock:
+            phase = self.__phases.pop(name, None)
+            if phase is None:
+                return
+            self.__clear_bar()
+            now = time.monotonic()
+            if summary:
+                # the rates of a phase that waited for the end of the export after its last item are not diluted
+                LOGGER.info(
+                    "Finished %s in %s",
+                    phase.describe(name, phase.advanced_at, with_eta=False),
+                    _format_duration(now - phase.started_at),
+                )
+            if self.__phases and self.__bar is not None and self.__enabled:
+                self.__draw(now)
+
+    def __describe_all(self, now: float) -> List[str]:
+        """
+        Returns one line per running phase that has work left, the lock must be held
+        """
+        return [phase.describe(name, now) for name, phase in self.__phases.items() if not phase.idle()]
+
+    def __draw(self, now: float) -> None:
+        """
+        Redraws the progress bar of all running phases on one line, the lock must be held
+        """
+        if self.__bar is None:
+            return
+        segments = []
+        for name, phase in self.__phases.items():
+            if phase.idle():
+                continue
+            fraction = phase.fraction()
+            if fraction is not None:
+                filled = int(fraction * BAR_WIDTH)
+                segments.append(f"[{'#' * filled}{'.' * (BAR_WIDTH - filled)}] {phase.describe(name, now)}")
+            else:
+                segments.append(phase.describe(name, now))
+        line = " | ".join(segments)[: shutil.get_terminal_size().columns - 1]
+        self.__bar.write("\r" + line.ljust(self.__bar_width))
+        self.__bar.flush()
+        self.__bar_width = len(line)
+        self.__last_report = now
+
+    def __clear_bar(self) -> None:
+        """
+        Removes the progress bar from its line, so the log continues on a clean line, the lock must be held
+        """
+        if self.__bar is None or self.__bar_width == 0:
+            return
+        self.__bar.write("\r" + " " * self.__bar_width + "\r")
+        self.__bar.flush()
+        self.__bar_width = 0
+
+
+def reporter_bar(mode: str, stream: IO[str] = sys.stderr) -> Optional[IO[str]]:
+    """
+    Returns the stream to draw the progress bar on for a `--progress` mode, None to report in the log.
+    """
+    if mode == "bar" or (mode == "auto" and stream.isatty()):
+        return stream
+    return None
+
+
+PROGRESS = ProgressReporter()
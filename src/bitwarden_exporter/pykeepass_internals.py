@@ -0,0 +1,129 @@
+"""
+This module holds the few places the exporter works on pykeepass internals instead of its public API.
+
+The public API of pykeepass is too slow for large vaults in three places. `Entry.set_custom_property` looks a key up
+with an xpath query before it adds it, which is quadratic in the number of fields of an entry. `PyKeePass.add_binary`
+computes the id of the new binary from `PyKeePass.binaries`, which copies every stored binary, and it copies the
+payload to prepend the protection flag. `PyKeePass.delete_binary` searches all attachment references for every binary
+it deletes, which is quadratic when many binaries are stale. The helpers here make the same changes on the XML element
+of the entry and on the binary pool of the KDBX 4 inner header directly. They depend on the internals of the pinned
+pykeepass version and are checked against it when it is upgraded. KDBX 3 databases, whose binaries live in the XML, go
+through `PyKeePass.add_binary`.
+
+Functions:
+    append_custom_property(entry: Entry, key: str, value: str, protect: bool) -> None:
+        Appends a custom property whose key is known not to be on the entry yet.
+
+    binary_count(py_kee_pass: PyKeePass) -> int:
+        Returns the number of binaries in the pool without copying them.
+
+    append_binary(py_kee_pass: PyKeePass, data: bytes) -> int:
+        Appends an unprotected binary to the pool and returns its id.
+
+    append_stream_binary(py_kee_pass: PyKeePass, stream: IO[bytes], size: int) -> int:
+        Appends the content of a stream as an unprotected binary, copied into the pool in bounded chunks.
+
+    remove_unreferenced_binaries(py_kee_pass: PyKeePass) -> int:
+        Removes the binaries no attachment refers to and renumbers the references in one pass.
+
+Variables:
+    BINARY_BUFFER_SIZE: The chunk size streams are copied into a binary with.
+"""
+
+from typing import IO, Dict
+
+from construct import Container  # type: ignore
+from lxml.builder import E  # type: ignore # pylint: disable=no-name-in-module
+from pykeepass import PyKeePass  # type: ignore
+from pykeepass.entry import Entry  # type: ignore
+
+from . import BitwardenException
+
+BINARY_BUFFER_SIZE = 1024 * 1024
+
+# the payload of a KDBX 4 binary starts with a flag byte, 0 for an unprotected binary
+_UNPROTECTED_FLAG = b"\x00"
+
+
+def append_custom_property(entry: Entry, key: str, value: str, protect: bool) -> None:
+    """
+    Appends a custom property to an entry like `Entry.set_custom_property`, the caller makes sure the key is not used
+    by the entry yet, so it is not looked up.
+    """
+    entry._element.append(  # pylint: disable=protected-access
+        E.String(E.Key(key), E.Value(value, Protected=str(protect)))
+    )
+
+
+def binary_count(py_kee_pass: PyKeePass) -> int:
+    """
+    Returns the number of binaries in the pool, unlike `len(PyKeePass.binaries)` without copying them.
+    """
+    if py_kee_pass.version >= (4, 0):
+        return len(py_kee_pass.payload.inner_header.binary)
+    return len(py_kee_pass.binaries)
+
+
+def append_binary(py_kee_pass: PyKeePass, data: bytes) -> int:
+    """
+    Appends an unprotected binary to the pool like `PyKeePass.add_binary` and returns its id.
+    """
+    if py_kee_pass.version < (4, 0):
+        return py_kee_pass.add_binary(data=data, protected=False, compressed=False)
+    return _append_payload(py_kee_pass, _UNPROTECTED_FLAG + data)
+
+
+def append_stream_binary(py_kee_pass: PyKeePass, stream: IO[bytes], size: int) -> int:
+    """
+    Appends the `size` bytes of a stream as an unprotected binary and returns its id. The stream is copied into the
+    binary in chunks of `BINARY_BUFFER_SIZE`, so its content is held in memory only once.
+    """
+    if py_kee_pass.version < (4, 0):
+        return append_binary(py_kee_pass, stream.read())
+    data = bytearray(len(_UNPROTECTED_FLAG) + size)
+    data[: len(_UNPROTECTED_FLAG)] = _UNPROTECTED_FLAG
+    position = len(_UNPROTECTED_FLAG)
+    with memoryview(data) as view:
+        while chunk := stream.read(min(BINARY_BUFFER_SIZE, len(data) - position)):
+            view[position : position + len(chunk)] = chunk
+            position += len(chunk)
+    if position != len(data):
+        raise BitwardenException(f"{getattr(stream, 'name', 'Stream')} changed while it was read")
+    return _append_payload(py_kee_pass, data)
+
+
+def _append_payload(py_kee_pass: PyKeePass, payload: bytes) -> int:
+    binaries = py_kee_pass.payload.inner_header.binary
+    binaries.append(Container(type="binary", data=payload))
+    return len(binaries) - 1
+
+
+def remove_unreferenced_binaries(py_kee_pass: PyKeePass) -> int:
+    """
+    Removes the binaries no attachment refers to, also in the history of an entry, like `PyKeePass.delete_binary`
+    for each of them, and returns how many were removed. The pool is rebuilt and every reference is renumbered once.
+    """
+    references = py_kee_pass.tree.xpath("//Binary/Value[@Ref]")
+    referenced = {int(reference.get("Ref")) for reference in references}
+    new_ids: Dict[int, int] = {}
+    for binary_id in range(binary_count(py_kee_pass)):
+        if binary_id in referenced:
+            new_ids[binary_id] = len(new_ids)
+    removed = binary_count(py_kee_pass) - len(new_ids)
+    if removed == 0:
+        return 0
+    if py_kee_pass.version >= (4, 0):
+        binaries = py_kee_pass.payload.inner_header.binary
+        binaries[:] = [binaries[binary_id] for binary_id in new_ids]
+    else:
+        pool = py_kee_pass.tree.find("Meta/Binaries")
+        for binary_id, binary in enumerate(list(pool)):
+            if binary_id in new_ids:
+                binary.set("ID", str(new_ids[binary_id]))
+            else:
+                pool.remove(binary)
+    for reference in references:
+        binary_id = int(reference.get("Ref"))
+        if binary_id in new_ids:
+            reference.set("Ref", str(new_ids[binary_id]))
+    return removed
@@ -0,0 +1,231 @@
+"""
+This module retries Bitwarden calls that failed for a transient reason, with timeouts that fit the call.
+
+A fixed timeout is either too short for `bw list items` of a large vault and big attachments, or too long to notice a
+hung call early. Every call gets a base timeout, lists additionally get time for every byte that arrives and
+attachment downloads for every byte Bitwarden reports for the attachment. Calls that time out, lose their connection
+or get a server error are retried with jittered exponential backoff, all calls share the time budget of the run. A
+`bw` process that exits with an error is only retried if its stderr reports a network or server error, a locked
+vault, a wrong session or an unknown id fail on the first attempt, and so does a missing `bw` binary.
+
+Classes:
+    RetryPolicy: Timeouts, retries, backoff and time budget of the Bitwarden calls.
+    Retrier: Applies a retry policy, keeping the time budget of the run.
+    RetryingTransport: Wraps a transport and applies a retry policy to it.
+
+Functions:
+    is_transient(error: BaseException) -> bool:
+        Returns whether a failed call may succeed when it is retried.
+
+Variables:
+    RETRYABLE_ERRORS: The errors of a call that are retried if they are transient.
+    TRANSIENT_BW_STDERR: The stderr of a failed `bw` process that reports a transient error.
+
+Exceptions:
+    BitwardenException:
+        Raised when a call failed on every attempt or the time budget of the run is spent.
+"""
+
+import http.client
+import logging
+import random
+import re
+import subprocess  # nosec B404
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+from . import BitwardenException
+from .metrics import METRICS
+from .transport import BwTransport, ServerError
+
+LOGGER = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+RETRYABLE_ERRORS: Tuple[Type[BaseException], ...] = (
+    subprocess.TimeoutExpired,
+    subprocess.CalledProcessError,
+    TimeoutError,
+    ConnectionError,
+    http.client.IncompleteRead,
+    ServerError,
+)
+
+TRANSIENT_BW_STDERR = re.compile(
+    r"ECONNRESET|ECONNREFUSED|ECONNABORTED|ETIMEDOUT|EAI_AGAIN|ENETUNREACH|EHOSTUNREACH|socket hang up"
+    r"|Too Many Requests|Bad Gateway|Service Unavailable|Gateway Time-?out",
+    re.IGNORECASE,
+)
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Returns whether a call that failed with `error` may succeed when it is retried, a failed `bw` process only if its
+    stderr reports a network or server error.
+    """
+    if isinstance(error, subprocess.CalledProcessError):
+        return TRANSIENT_BW_STDERR.search(str(error.stderr or "")) is not None
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class RetryPolicy(BaseModel):
+    """
+    Timeout of every Bitwarden call, grown by `min_bytes_per_second` for the bytes of a list or an attachment, and
+    how often and how long to retry
+
+    `time_budget` limits the whole run, no call starts or is retried once it is spent.
+    """
+
+    timeout: float = 60.0
+    min_bytes_per_second: float = 64 * 1024
+    retries: int = 3
+    backoff_base: float = 1.0
+    backoff_max: float = 30.0
+    time_budget: Optional[float] = None
+
+
+class Retrier:
+    """
+    Computes the timeouts and backoff delays of a retry policy and keeps the time budget, one is shared by all
+    clients of a run, safe to use from several threads
+    """
+
+    def __init__(self, policy: RetryPolicy) -> None:
+        self.policy = policy
+        self.__deadline = time.monotonic() + policy.time_budget if policy.time_budget is not None else None
+        self.__random = random.Random()  # nosec B311
+        self.__random_lock = threading.Lock()
+
+    def __remaining(self, what: str) -> Optional[float]:
+        """
+        Returns the seconds left of the time budget, raises if none are left
+        """
+        if self.__deadline is None:
+            return None
+        remaining = self.__deadline - time.monotonic()
+        if remaining <= 0:
+            METRICS.increment("bw_budget_exhausted_total")
+            raise BitwardenException(f"Time budget of {self.policy.time_budget} seconds spent, not running {what}")
+        return remaining
+
+    def timeout(self, what: str, expected_bytes: Optional[int] = None) -> float:
+        """
+        Returns the timeout of a call, the base timeout plus the time for the expected bytes, capped by the budget.
+        """
+        timeout = self.policy.timeout
+        if expected_bytes is not None:
+            timeout += expected_bytes / self.policy.min_bytes_per_second
+        remaining = self.__remaining(what)
+        return timeout if remaining is None else min(timeout, remaining)
+
+    def backoff(self, what: str, attempt: int, error: BaseException) -> float:
+        """
+        Records a failed attempt and returns the seconds to wait before the next one, raises if there is none. An
+        error that is not transient is raised again as it is.
+        """
+        if not is_transient(error):
+            raise error
+        if isinstance(error, (subprocess.TimeoutExpired, TimeoutError)):
+            METRICS.increment("bw_timeouts_total")
+        if attempt >= self.policy.retries:
+            raise BitwardenException(f"{what} failed after {attempt + 1} attempts: {error}") from error
+        with self.__random_lock:
+            delay = self.__random.uniform(0, min(self.policy.backoff_max, self.policy.backoff_base * 2**attempt))
+        remaining = self.__remaining(what)
+        if remaining is not None and delay >= remaining:
+            METRICS.increment("bw_budget_exhausted_total")
+            raise BitwardenException(f"{what} failed and the time budget is spent: {error}") from error
+        LOGGER.warning(
+            "%s failed, retry %s of %s in %.1f seconds: %s", what, attempt + 1, self.policy.retries, delay, error
+        )
+        METRICS.increment("bw_retries_total")
+        return delay
+
+
+class RetryingTransport(BwTransport):
+    """
+    Applies a retry policy to another transport
+
+    A list is only retried if it failed before its first object was yielded, objects already handed out can not be
+    taken back.
+    """
+
+    def __init__(self, transport: BwTransport, retrier: Retrier) -> None:
+        self.__transport = transport
+        self.__retrier = retrier
+
+    def __call(self, what: str, call: Callable[[float], _T], expected_bytes: Optional[int] = None) -> _T:
+        """
+        Runs a call with its timeout until it succeeds or runs out of attempts
+        """
+        attempt = 0
+        while True:
+            try:
+                return call(self.__retrier.timeout(what, expected_bytes))
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self.__retrier.backoff(what, attempt, e))
+                attempt += 1
+
+    def exec(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        cmd: List[str],
+        ret_encoding: str = "UTF-8",
+        env_vars: Optional[Dict[str, str]] = None,
+        is_raw: bool = True,
+        timeout: Optional[float] = None,
+    ) -> str:
+        return self.__call(
+            f"bw {' '.join(cmd)}",
+            lambda call_timeout: self.__transport.exec(
+                cmd, ret_encoding=ret_encoding, env_vars=env_vars, is_raw=is_raw, timeout=timeout or call_timeout
+            ),
+        )
+
+    def iter_list(
+        self, object_name: str, timeout: Optional[float] = None, bytes_per_second: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        what = f"bw list {object_name}"
+        attempt = 0
+        while True:
+            objects = self.__transport.iter_list(
+                object_name,
+                timeout=timeout or self.__retrier.timeout(what),
+                bytes_per_second=bytes_per_second or self.__retrier.policy.min_bytes_per_second,
+            )
+            try:
+                first = next(objects, None)
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self.__retrier.backoff(what, attempt, e))
+                attempt += 1
+                continue
+            if first is None:
+                return
+            yield first
+            yield from objects
+            return
+
+    def download_attachment(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        item_id: str,
+        attachment_id: str,
+        download_location: str,
+        expected_bytes: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.__call(
+            f"Download of attachment {attachment_id}",
+            lambda call_timeout: self.__transport.download_attachment(
+                item_id,
+                attachment_id,
+                download_location,
+                expected_bytes=expected_bytes,
+                timeout=timeout or call_timeout,
+            ),
+            expected_bytes,
+        )
+
+    def close(self) -> None:
+        self.__transport.close()
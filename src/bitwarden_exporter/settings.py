@@ -5,6 +5,8 @@ Classes:
     BitwardenExportSettings: A Pydantic model that defines the settings for the Bitwarden Exporter.
 
 Functions:
+    validate_args: Checks the value ranges and combinations of the tuning options.
+
     get_bitwarden_settings_based_on_args: Parses command-line arguments to populate
       and return a BitwardenExportSettings instance.
 
@@ -12,13 +14,58 @@ The settings include:
     - export_location: The location where the Bitwarden export will be saved.
     - export_password: The password used for the Bitwarden export.
     - allow_duplicates: A flag to allow duplicate entries in the export.
+    - incremental: A flag to update an existing export in place instead of refusing to overwrite it.
     - tmp_dir: The temporary directory to store sensitive files during the export process.
+    - resume: A flag to keep an encrypted journal in the temporary directory and continue an export that died from it.
+    - verify: A flag to compare an existing export with the vault instead of exporting.
+    - max_memory: A flag to keep items on disk until their entries are built, trading speed for memory.
+    - download_workers: The number of attachments downloaded concurrently.
+    - attachment_cache_dir: The directory that keeps downloaded attachments across runs.
+    - attachment_cache_max_mib: The size the attachment cache is trimmed to after a run.
+    - attachment_cache_max_age_days: The age after which unused attachments are evicted from the cache.
+    - list_cache: A flag to reuse the answers of `bw list` across runs while the vault has not synced.
+    - list_cache_dir: The directory that keeps the encrypted answers of `bw list`.
+    - list_cache_max_mib: The size the list cache is trimmed to after a run.
+    - clear_list_cache: A flag to remove all cached lists before the run.
+    - bw_transport: How to talk to Bitwarden, one `bw` process per call or a single `bw serve`.
+    - bw_serve_url: The url of an already running `bw serve`.
+    - bw_data_file: The data file of the `bw` CLI the offline transport reads.
+    - bw_serve_port: The local port to start `bw serve` on, a free port if None.
+    - bw_timeout: The base timeout in seconds of every Bitwarden call.
+    - bw_min_throughput_kib: The slowest transfer in KiB/s a list or attachment download gets time for.
+    - bw_retries: The number of retries of a Bitwarden call that failed for a transient reason.
+    - bw_time_budget: The seconds all Bitwarden calls of the run may take together.
+    - bw_async: A flag to run the independent Bitwarden calls concurrently from an asyncio event loop.
+    - metrics_out: The file to write the metrics of the run to.
+    - metrics_format: The format of the metrics file, json or prometheus.
+    - progress: How to report the progress of the export, auto, bar, log or none.
+    - progress_interval: The seconds between two progress summaries in the log.
+    - raw_snapshot_format: How the raw Bitwarden JSON stored in the export is encoded, pretty, compact, gzip or zstd.
+    - raw_snapshot_split: A flag to store the raw items as one snapshot per organization.
+    - kdf: The key derivation function of the KeePass database, argon2d, argon2id or aes-kdf.
+    - kdf_iterations: The iterations of Argon2 or the rounds of AES-KDF.
+    - kdf_memory_mib: The memory of Argon2 in MiB.
+    - kdf_parallelism: The lanes of Argon2.
+    - kdf_target_ms: The time one key derivation should take on this machine, the iterations are calibrated to it.
+    - shard_by_organization: A flag to write one KeePass database per organization and one for "My Vault".
+    - shard_workers: The number of processes that build shards.
+    - shard_manifest: The file to write the list of shards and their hashes to.
+    - s3_url: The S3 compatible bucket and prefix to upload the finished export to.
+    - s3_region: The region requests to the bucket are signed for.
+    - s3_part_size_mib: The size of a part of a multipart upload.
+    - s3_parallelism: The number of parts uploaded concurrently.
+    - s3_keep: The number of complete backup sets kept in the bucket, older ones are deleted.
+    - s3_sidecars: Files uploaded with the export, like checksums or notes.
+    - batch_config: The JSON file of the accounts of a batch export.
+    - batch_workers: The number of accounts of a batch exported at the same time.
     - verbose: A flag to enable verbose logging, which may include sensitive information.
 """
 
 import argparse
+import importlib.util
 import os
 import time
+from typing import List, Optional
 
 import pyfiglet  # type: ignore
 from pydantic import BaseModel
@@ -32,11 +79,134 @@ class BitwardenExportSettings(BaseModel):
     export_location: str
     export_password: str
     allow_duplicates: bool
+    incremental: bool
     tmp_dir: str
+    resume: bool = False
+    verify: bool = False
+    max_memory: bool = False
+    download_workers: int
+    attachment_cache_dir: str
+    attachment_cache_max_mib: Optional[int] = None
+    attachment_cache_max_age_days: Optional[float] = None
+    list_cache: bool = False
+    list_cache_dir: str
+    list_cache_max_mib: Optional[int] = None
+    clear_list_cache: bool = False
+    bw_transport: str
+    bw_serve_url: Optional[str] = None
+    bw_data_file: Optional[str] = None
+    bw_serve_port: Optional[int] = None
+    bw_timeout: float = 60.0
+    bw_min_throughput_kib: float = 64.0
+    bw_retries: int = 3
+    bw_time_budget: Optional[float] = None
+    bw_async: bool = False
+    metrics_out: Optional[str] = None
+    metrics_format: str
+    progress: str = "auto"
+    progress_interval: float = 10.0
+    raw_snapshot_format: str
+    raw_snapshot_split: bool
+    kdf: Optional[str] = None
+    kdf_iterations: Optional[int] = None
+    kdf_memory_mib: Optional[int] = None
+    kdf_parallelism: Optional[int] = None
+    kdf_target_ms: Optional[int] = None
+    shard_by_organization: bool = False
+    shard_workers: int = 1
+    shard_manifest: Optional[str] = None
+    s3_url: Optional[str] = None
+    s3_region: str = "us-east-1"
+    s3_part_size_mib: int = 16
+    s3_parallelism: int = 4
+    s3_keep: Optional[int] = None
+    s3_sidecars: List[str] = []
+    batch_config: Optional[str] = None
+    batch_workers: int = 2
     verbose: bool
 
 
-def get_bitwarden_settings_based_on_args() -> BitwardenExportSettings:
+def validate_args(  # pylint: disable=too-many-branches
+    parser: argparse.ArgumentParser, args: argparse.Namespace
+) -> None:
+    """
+    Check the value ranges and combinations of the tuning options, exits through the parser on errors
+    """
+
+    if args.download_workers < 1:
+        parser.error("--download-workers must be at least 1")
+
+    if args.bw_timeout <= 0 or args.bw_min_throughput_kib <= 0:
+        parser.error("--bw-timeout and --bw-min-throughput-kib must be positive")
+
+    if args.bw_retries < 0:
+        parser.error("--bw-retries must not be negative")
+
+    if args.bw_time_budget is not None and args.bw_time_budget <= 0:
+        parser.error("--bw-time-budget must be positive")
+
+    if args.bw_async and (args.bw_transport != "cli" or args.bw_serve_url is not None):
+        parser.error("--bw-async needs --bw-transport cli")
+
+    if args.list_cache_max_mib is not None and args.list_cache_max_mib < 0:
+        parser.error("--list-cache-max-mib must not be negative")
+
+    if args.list_cache and args.bw_transport == "offline":
+        parser.error("--list-cache has nothing to save with --bw-transport offline, which reads the lists locally")
+
+    if args.bw_data_file is not None and args.bw_transport != "offline":
+        parser.error("--bw-data-file needs --bw-transport offline")
+
+    if args.progress_interval <= 0:
+        parser.error("--progress-interval must be positive")
+
+    if args.raw_snapshot_format == "zstd" and importlib.util.find_spec("zstandard") is None:
+        parser.error("--raw-snapshot-format zstd needs the zstandard package, pip install zstandard")
+
+    if args.attachment_cache_max_mib is not None and args.attachment_cache_max_mib < 0:
+        parser.error("--attachment-cache-max-mib must not be negative")
+
+    if args.kdf_iterations is not None and args.kdf_target_ms is not None:
+        parser.error("Please provide either --kdf-iterations or --kdf-target-ms, not both")
+
+    for kdf_option in ("kdf_iterations", "kdf_memory_mib", "kdf_parallelism", "kdf_target_ms"):
+        if getattr(args, kdf_option) is not None and getattr(args, kdf_option) < 1:
+            parser.error(f"--{kdf_option.replace('_', '-')} must be at least 1")
+
+    if args.shard_workers < 1:
+        parser.error("--shard-workers must be at least 1")
+
+    if args.verify and (args.shard_by_organization or args.resume):
+        parser.error("--verify checks a single export, it can not be combined with --shard-by-organization or --resume")
+
+    if args.max_memory and args.shard_by_organization:
+        parser.error("--max-memory can not be combined with --shard-by-organization")
+
+    if args.batch_workers < 1:
+        parser.error("--batch-workers must be at least 1")
+
+    if args.shard_manifest is not None and not args.shard_by_organization:
+        parser.error("--shard-manifest needs --shard-by-organization")
+
+    if args.s3_url is None and (args.s3_keep is not None or args.s3_sidecar):
+        parser.error("--s3-keep and --s3-sidecar need --s3-url")
+
+    if args.s3_url is not None and args.verify:
+        parser.error("--verify does not write an export to upload, it can not be combined with --s3-url")
+
+    if args.s3_url is not None and not (
+        os.environ.get("AWS_ACCESS_KEY_ID") and os.environ.get("AWS_SECRET_ACCESS_KEY")
+    ):
+        parser.error("--s3-url needs AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY in the environment")
+
+    if args.s3_part_size_mib < 5:
+        parser.error("--s3-part-size-mib must be at least 5, the smallest part S3 accepts")
+
+    if args.s3_parallelism < 1 or (args.s3_keep is not None and args.s3_keep < 1):
+        parser.error("--s3-parallelism and --s3-keep must be at least 1")
+
+
+def get_bitwarden_settings_based_on_args() -> BitwardenExportSettings:  # pylint: disable=too-many-statements
     """
     Manage Input Arguments for Bitwarden Exporter
     """
@@ -73,6 +243,14 @@ def get_bitwarden_settings_based_on_args() -> BitwardenExportSettings:
         default=False,
     )
 
+    parser.add_argument(
+        "--incremental",
+        help="If the export location already exists, update it in place, only items that changed in Bitwarden"
+        " are rewritten and only their attachments are downloaded, Default: --no-incremental",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+
     parser.add_argument(
         "--tmp-dir",
         help="Temporary Directory to store temporary sensitive files,"
@@ -81,6 +259,340 @@ def get_bitwarden_settings_based_on_args() -> BitwardenExportSettings:
         default=os.path.abspath("bitwarden_dump_attachments"),
     )
 
+    parser.add_argument(
+        "--resume",
+        help="Keep a journal of the export in --tmp-dir and continue an export that died from it, lists Bitwarden"
+        " already answered and attachments already downloaded are taken from there, The journal is encrypted with"
+        " the export password and removed once the export is saved, without --resume no part of the vault but the"
+        " attachments is written to --tmp-dir, Default: --no-resume",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--verify",
+        help="Do not export, compare the export at --export-location with the vault and report items missing from"
+        " it, entries of items no longer in Bitwarden and items that differ, attachments are compared by size and"
+        " by the digest the attachment cache keeps and only downloaded if it has none, exits with an error if the"
+        " export does not match, Default: --no-verify",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        help="Keep as little of the vault in memory as possible, only the fields that place an item in its group are"
+        " kept while items are listed, every item is read again from an encrypted temporary file in --tmp-dir when"
+        " its entry is built and the raw snapshots are spooled to disk, the database itself is still built in memory,"
+        " can not be combined with --shard-by-organization, Default: --no-max-memory",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--download-workers",
+        help="Number of attachments to download concurrently, Default: 4",
+        type=int,
+        default=4,
+    )
+
+    parser.add_argument(
+        "--attachment-cache-dir",
+        help="Directory that keeps downloaded attachments across runs, attachments are validated by size and SHA-256"
+        " before they are reused, It holds sensitive files like --tmp-dir, Default: <tmp dir>/attachment-cache",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--attachment-cache-max-mib",
+        help="After the export, evict the least recently used attachments until the cache is at most this many MiB,"
+        " Default: no limit",
+        type=int,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--attachment-cache-max-age-days",
+        help="After the export, evict attachments that were not used for this many days, Default: no limit",
+        type=float,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--list-cache",
+        help="Keep the folders, organizations, collections and items bw list answers in --list-cache-dir, encrypted"
+        " with the export password, and reuse them while bw status reports the same lastSync for the account, bw"
+        " sync invalidates them, so does an edit with this bw CLI only after bw sync or --clear-list-cache, lists"
+        " fetched ahead by --bw-async are not cached, Default: --no-list-cache",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--list-cache-dir",
+        help="Directory that keeps the encrypted lists of --list-cache, Default: <tmp dir>/list-cache",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--list-cache-max-mib",
+        help="After the export, evict the least recently used lists until the list cache is at most this many MiB,"
+        " Default: 256",
+        type=int,
+        default=256,
+    )
+
+    parser.add_argument(
+        "--clear-list-cache",
+        help="Remove every list from --list-cache-dir before the run, Default: --no-clear-list-cache",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--bw-transport",
+        help="How to talk to Bitwarden, cli: one bw process per call, serve: a single bw serve process over HTTP,"
+        " falls back to cli if bw serve can not be started, offline: read the status, folders, organizations,"
+        " collections and items from the data file the bw CLI keeps after bw sync, decrypted with BW_SESSION,"
+        " attachments are still downloaded with the bw CLI, Default: cli. bw serve has no authentication, while the"
+        " export runs any local process or user can read and change the unlocked vault through its port",
+        choices=["cli", "serve", "offline"],
+        default="cli",
+    )
+
+    parser.add_argument(
+        "--bw-serve-url",
+        help="Use an already running bw serve at this url instead of starting one, Implies --bw-transport serve",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--bw-serve-port",
+        help="Local port to start bw serve on, it must not be in use, Default: a free port picked by the system",
+        type=int,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--bw-data-file",
+        help="Data file of the bw CLI for --bw-transport offline, Default: data.json in BITWARDENCLI_APPDATA_DIR or in"
+        " the Bitwarden CLI directory of the platform",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--bw-timeout",
+        help="Seconds every Bitwarden call may take, lists and attachment downloads get more time for every byte"
+        " they transfer, see --bw-min-throughput-kib, Default: 60",
+        type=float,
+        default=60.0,
+    )
+
+    parser.add_argument(
+        "--bw-min-throughput-kib",
+        help="Slowest transfer in KiB/s that is not treated as hung, lists get time for the bytes received and"
+        " attachment downloads for the size Bitwarden reports, Default: 64",
+        type=float,
+        default=64.0,
+    )
+
+    parser.add_argument(
+        "--bw-retries",
+        help="Retries of a Bitwarden call that timed out or failed with a network or server error, with jittered"
+        " exponential backoff, a bw process that failed for another reason, like a locked vault, is not retried,"
+        " Default: 3",
+        type=int,
+        default=3,
+    )
+
+    parser.add_argument(
+        "--bw-time-budget",
+        help="Seconds all Bitwarden calls of the run may take together, no call is started or retried after it,"
+        " Default: no limit",
+        type=float,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--bw-async",
+        help="Talk to the bw CLI from an asyncio event loop, the lists of folders, organizations and collections are"
+        " fetched concurrently and attachments are downloaded as coroutines on one thread, --download-workers at a"
+        " time, Needs --bw-transport cli, Default: --no-bw-async",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--metrics-out",
+        help="Write phase timings, call counts, bytes downloaded, item counts, peak memory and KDBX size to this file,"
+        " it is written even if the export fails",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--metrics-format",
+        help="Format of the metrics file, prometheus writes the text format for the node exporter textfile collector,"
+        " Default: json",
+        choices=["json", "prometheus"],
+        default="json",
+    )
+
+    parser.add_argument(
+        "--progress",
+        help="How to report the progress of the export, bar draws a progress bar on stderr, log writes a summary"
+        " of every phase to the log, Default: auto, a bar if stderr is a terminal and the log otherwise",
+        choices=["auto", "bar", "log", "none"],
+        default="auto",
+    )
+
+    parser.add_argument(
+        "--progress-interval",
+        help="Seconds between two progress summaries in the log, Default: 10",
+        type=float,
+        default=10.0,
+    )
+
+    parser.add_argument(
+        "--raw-snapshot-format",
+        help="Encoding of the raw Bitwarden JSON stored in the Bitwarden Export entry, pretty: indented JSON,"
+        " compact: JSON without whitespace, gzip and zstd: compact JSON compressed, stored as .json.gz or .json.zst,"
+        " zstd needs the zstandard package, Default: pretty",
+        choices=["pretty", "compact", "gzip", "zstd"],
+        default="pretty",
+    )
+
+    parser.add_argument(
+        "--raw-snapshot-split",
+        help="Store the raw items as one snapshot per organization, items-<organization id>.json,"
+        " and items-my-vault.json for the items of no organization, instead of a single items.json,"
+        " Default: --no-raw-snapshot-split",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--kdf",
+        help="Key derivation function of the KeePass database, it runs on every save and unlock,"
+        " Default: argon2d, an incremental export keeps the KDF of the existing database unless a --kdf option"
+        " is given",
+        choices=["argon2d", "argon2id", "aes-kdf"],
+        required=False,
+    )
+
+    parser.add_argument(
+        "--kdf-iterations",
+        help="Iterations of Argon2 or rounds of AES-KDF, Mutually Exclusive with --kdf-target-ms,"
+        " Default: 14 for Argon2, 300000 for AES-KDF",
+        type=int,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--kdf-memory-mib",
+        help="Memory of Argon2 in MiB, Default: 64",
+        type=int,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--kdf-parallelism",
+        help="Lanes of Argon2, Default: 2",
+        type=int,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--kdf-target-ms",
+        help="Measure the KDF on this machine and pick the iterations so that one unlock takes this many"
+        " milliseconds, memory and parallelism are kept",
+        type=int,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--shard-by-organization",
+        help="Write one KeePass database per organization, <export location>-<organization id>.kdbx, and one for"
+        " My Vault, <export location>-my-vault.kdbx, built in parallel processes, each holds only the raw Bitwarden"
+        " JSON of its organization, attachments of all items are downloaded before the shards are built,"
+        " Default: --no-shard-by-organization",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--shard-workers",
+        help=f"Number of processes building shards, Default: number of CPUs, {os.cpu_count() or 1}",
+        type=int,
+        default=os.cpu_count() or 1,
+    )
+
+    parser.add_argument(
+        "--shard-manifest",
+        help="Write the shards with their organization, item count, size and SHA-256 to this JSON file,"
+        " Needs --shard-by-organization",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--s3-url",
+        help="Upload the export to S3 compatible object storage once it is saved, https://host[:port]/bucket/prefix/,"
+        " every run uploads a backup set <prefix><UTC time>/ with the database or the shards and the shard manifest,"
+        " the --s3-sidecar files and a backup.json with the size and SHA-256 of every file, credentials are read"
+        " from AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and AWS_SESSION_TOKEN, Default: no upload",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--s3-region",
+        help="Region the upload requests are signed for, Default: us-east-1",
+        default="us-east-1",
+    )
+
+    parser.add_argument(
+        "--s3-part-size-mib",
+        help="Files larger than this are uploaded in parts of this many MiB, at least 5, Default: 16",
+        type=int,
+        default=16,
+    )
+
+    parser.add_argument(
+        "--s3-parallelism",
+        help="Number of parts uploaded concurrently, at most this many parts are held in memory, Default: 4",
+        type=int,
+        default=4,
+    )
+
+    parser.add_argument(
+        "--s3-keep",
+        help="After the upload, keep the newest this many complete backup sets under the prefix and delete the older"
+        " ones, Default: keep all",
+        type=int,
+        required=False,
+    )
+
+    parser.add_argument(
+        "--s3-sidecar",
+        help="Upload this file with the export, can be given several times",
+        action="append",
+        default=[],
+    )
+
+    parser.add_argument(
+        "--batch-config",
+        help="Export the accounts listed in this JSON file instead of the current session, each in its own process"
+        " with its own BITWARDENCLI_APPDATA_DIR, session, environment and directory in --tmp-dir, see the"
+        " bitwarden_exporter.batch module for the format, the export options of this run are not passed on, the"
+        " config lists the options of the exports",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--batch-workers",
+        help="Number of accounts of --batch-config exported at the same time, Default: 2",
+        type=int,
+        default=2,
+    )
+
     parser.add_argument(
         "--verbose",
         help="Enable Verbose Logging, This will print debug logs, THAT MAY CONTAIN SENSITIVE INFORMATION,"
@@ -91,20 +603,68 @@ def get_bitwarden_settings_based_on_args() -> BitwardenExportSettings:
     print(pyfiglet.figlet_format("Bitwarden Exporter"))
     args = parser.parse_args()
 
-    if args.export_password is None and args.export_password_file is None:
+    if args.export_password is None and args.export_password_file is None and args.batch_config is None:
         parser.error("Please provide either --export-password or --export-password-file")
 
     if args.export_password is not None and args.export_password_file is not None:
         parser.error("Please provide either --export-password or --export-password-file, not both")
 
+    validate_args(parser, args)
+
+    if args.bw_serve_url is not None:
+        args.bw_transport = "serve"
+
     if args.export_password_file is not None:
         with open(args.export_password_file, "r", encoding="utf-8") as file:
             args.export_password = file.read().strip()
 
     return BitwardenExportSettings(
         export_location=args.export_location,
-        export_password=args.export_password,
+        export_password=args.export_password or "",
         allow_duplicates=args.allow_duplicates,
+        incremental=args.incremental,
         tmp_dir=args.tmp_dir,
+        resume=args.resume,
+        verify=args.verify,
+        max_memory=args.max_memory,
+        download_workers=args.download_workers,
+        attachment_cache_dir=args.attachment_cache_dir or os.path.join(args.tmp_dir, "attachment-cache"),
+        attachment_cache_max_mib=args.attachment_cache_max_mib,
+        attachment_cache_max_age_days=args.attachment_cache_max_age_days,
+        list_cache=args.list_cache,
+        list_cache_dir=args.list_cache_dir or os.path.join(args.tmp_dir, "list-cache"),
+        list_cache_max_mib=args.list_cache_max_mib,
+        clear_list_cache=args.clear_list_cache,
+        bw_transport=args.bw_transport,
+        bw_serve_url=args.bw_serve_url,
+        bw_data_file=args.bw_data_file,
+        bw_serve_port=args.bw_serve_port,
+        bw_timeout=args.bw_timeout,
+        bw_min_throughput_kib=args.bw_min_throughput_kib,
+        bw_retries=args.bw_retries,
+        bw_time_budget=args.bw_time_budget,
+        bw_async=args.bw_async,
+        metrics_out=args.metrics_out,
+        metrics_format=args.metrics_format,
+        progress=args.progress,
+        progress_interval=args.progress_interval,
+        raw_snapshot_format=args.raw_snapshot_format,
+        raw_snapshot_split=args.raw_snapshot_split,
+        kdf=args.kdf,
+        kdf_iterations=args.kdf_iterations,
+        kdf_memory_mib=args.kdf_memory_mib,
+        kdf_parallelism=args.kdf_parallelism,
+        kdf_target_ms=args.kdf_target_ms,
+        shard_by_organization=args.shard_by_organization,
+        shard_workers=args.shard_workers,
+        shard_manifest=args.shard_manifest,
+        s3_url=args.s3_url,
+        s3_region=args.s3_region,
+        s3_part_size_mib=args.s3_part_size_mib,
+        s3_parallelism=args.s3_parallelism,
+        s3_keep=args.s3_keep,
+        s3_sidecars=args.s3_sidecar,
+        batch_config=args.batch_config,
+        batch_workers=args.batch_workers,
         verbose=args.verbose,
     )
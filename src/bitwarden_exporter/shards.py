@@ -0,0 +1,185 @@
+"""
+This module builds a sharded export, one KeePass database per organization and one for "My Vault".
+
+Building a database with pykeepass is single threaded and CPU bound, so the shards are built in a pool of processes.
+Every shard only holds the items and the raw Bitwarden JSON of its organization, so one organization can be restored
+without decrypting the others.
+
+Classes:
+    ShardJob: Everything a worker process needs to build one shard.
+    ShardResult: The file, hash and metrics of a built shard.
+
+Functions:
+    shard_location(export_location: str, shard_name: str) -> str:
+        Returns the file of a shard next to the export location.
+
+    build_shard(job: ShardJob) -> ShardResult:
+        Builds one shard, runs in a worker process.
+
+    build_shards(jobs: List[ShardJob], workers: int, on_saved: Optional[Callable[[str], None]] = None)
+      -> List[ShardResult]:
+        Builds all shards in a process pool.
+
+    write_manifest(manifest_file: str, results: List[ShardResult]) -> None:
+        Writes the list of shards and their hashes as JSON.
+
+Exceptions:
+    BitwardenException:
+        Raised when one or more shards could not be built.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from . import BitwardenException
+from .bw_models import BwFolder, BwItem, BwOrganization
+from .kdf import KdfParameters
+from .keepass import KeePassStorage
+from .metrics import METRICS
+from .progress import PROGRESS
+
+LOGGER = logging.getLogger(__name__)
+
+MY_VAULT_SHARD = "my-vault"
+
+
+class ShardJob(BaseModel):
+    """
+    One shard to build, the organization shards leave folders and no folder items empty
+    """
+
+    name: str
+    organization_id: Optional[str] = None
+    organization_name: str
+    kdbx_file: str
+    kdbx_password: str
+    incremental: bool
+    kdf: Optional[KdfParameters] = None
+    organizations: Dict[str, BwOrganization] = {}
+    folders: List[BwFolder] = []
+    no_folder_items: List[BwItem] = []
+    raw_snapshots: Dict[str, bytes] = {}
+    items: int
+
+
+class ShardResult(BaseModel):
+    """
+    A built shard
+    """
+
+    name: str
+    organization_id: Optional[str] = None
+    organization_name: str
+    kdbx_file: str
+    sha256: str
+    size: int
+    items: int
+    metrics: Dict[str, Any]
+
+
+def shard_location(export_location: str, shard_name: str) -> str:
+    """
+    Returns the file of a shard, the export location with the shard name before the extension.
+    """
+    base, extension = os.path.splitext(export_location)
+    return f"{base}-{shard_name}{extension or '.kdbx'}"
+
+
+def build_shard(job: ShardJob) -> ShardResult:
+    """
+    Builds one shard, runs in a worker process and returns the metrics of the worker with the result.
+    """
+    METRICS.reset()
+    LOGGER.info("Building shard %s: %s", job.organization_name, job.kdbx_file)
+    storage = KeePassStorage(job.kdbx_file, job.kdbx_password, incremental=job.incremental, kdf=job.kdf)
+    with storage:
+        storage.process_organizations(job.organizations)
+        if job.organization_id is None:
+            storage.process_folders({str(folder.id): folder for folder in job.folders})
+            storage.process_no_folder_items(job.no_folder_items)
+        storage.process_bw_exports(dict(job.raw_snapshots))
+
+    file_hash = hashlib.sha256()
+    with open(job.kdbx_file, "rb") as kdbx:
+        while chunk := kdbx.read(1024 * 1024):
+            file_hash.update(chunk)
+    return ShardResult(
+        name=job.name,
+        organization_id=job.organization_id,
+        organization_name=job.organization_name,
+        kdbx_file=job.kdbx_file,
+        sha256=file_hash.hexdigest(),
+        size=os.path.getsize(job.kdbx_file),
+        items=job.items,
+        metrics=METRICS.to_dict(),
+    )
+
+
+def build_shards(
+    jobs: List[ShardJob], workers: int, on_saved: Optional[Callable[[str], None]] = None
+) -> List[ShardResult]:
+    """
+    Builds the shards in a pool of processes. A failed shard does not stop the others, all failures are reported.
+    `on_saved` is called with the file of every shard as soon as it is saved.
+    """
+    LOGGER.info("Building %s shards with %s worker processes", len(jobs), min(workers, len(jobs)))
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as executor:
+        futures: Dict[str, "Future[ShardResult]"] = {job.name: executor.submit(build_shard, job) for job in jobs}
+        items = {futures[job.name]: job.items for job in jobs}
+        with PROGRESS.phase("build_shards", total=sum(items.values())):
+            for future in as_completed(futures.values()):
+                PROGRESS.advance("build_shards", items[future])
+                if on_saved is not None and future.exception() is None:
+                    on_saved(future.result().kdbx_file)
+
+    results: List[ShardResult] = []
+    failures: List[str] = []
+    for job in jobs:
+        error = futures[job.name].exception()
+        if error is not None:
+            LOGGER.error("Error building shard %s: %s", job.organization_name, error)
+            failures.append(job.organization_name)
+            continue
+        result = futures[job.name].result()
+        METRICS.merge(result.metrics)
+        LOGGER.info("Shard %s saved: %s, %s items", result.organization_name, result.kdbx_file, result.items)
+        results.append(result)
+
+    if len(failures) > 0:
+        raise BitwardenException(f"Failed to build {len(failures)} shards: {', '.join(failures)}")
+    return results
+
+
+def write_manifest(manifest_file: str, results: List[ShardResult]) -> None:
+    """
+    Writes the shards, their organization, item count, size and SHA-256 as JSON, shard files are relative to it.
+    """
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+    manifest = {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "shards": [
+            {
+                "name": result.name,
+                "organization_id": result.organization_id,
+                "organization_name": result.organization_name,
+                "file": os.path.relpath(os.path.abspath(result.kdbx_file), manifest_dir),
+                "sha256": result.sha256,
+                "size": result.size,
+                "items": result.items,
+            }
+            for result in results
+        ],
+    }
+    os.makedirs(manifest_dir, exist_ok=True)
+    tmp_file = f"{manifest_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as manifest_out:
+        json.dump(manifest, manifest_out, indent=4)
+    os.replace(tmp_file, manifest_file)
+    LOGGER.info("Shard manifest written to %s", manifest_file)
@@ -0,0 +1,139 @@
+"""
+This module encodes the raw Bitwarden JSON snapshots that are stored as attachments of the export entry.
+
+A snapshot is stored pretty printed, which is what earlier versions wrote, or compact, optionally compressed with gzip
+or zstd. Compressed snapshots get the `.gz` or `.zst` suffix so they can be restored with `gunzip` or `unzstd`.
+
+Classes:
+    SnapshotArchive: Streams JSON arrays into encoded snapshots spooled to the temporary directory.
+
+Functions:
+    snapshot_name(name: str, snapshot_format: str) -> str:
+        Returns the attachment name of a snapshot in a format.
+
+    encode_snapshot(value: Any, snapshot_format: str) -> bytes:
+        Encodes a JSON value in a snapshot format.
+
+Variables:
+    SNAPSHOT_FORMATS: The supported snapshot formats.
+"""
+
+import gzip
+import json
+import tempfile
+from types import TracebackType
+from typing import IO, Any, Dict, Optional, Tuple, Type
+
+from . import BitwardenException
+from .json_stream import JsonArrayWriter
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+SNAPSHOT_FORMATS = ("pretty", "compact", "gzip", "zstd")
+
+_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def snapshot_name(name: str, snapshot_format: str) -> str:
+    """
+    Returns the attachment name of a snapshot, with the suffix of its compression.
+    """
+    return name + _SUFFIXES.get(snapshot_format, "")
+
+
+def _check_format(snapshot_format: str) -> None:
+    if snapshot_format not in SNAPSHOT_FORMATS:
+        raise BitwardenException(f"Unknown snapshot format {snapshot_format}")
+    if snapshot_format == "zstd" and zstandard is None:
+        raise BitwardenException("zstd snapshots need the zstandard package, pip install zstandard")
+
+
+def encode_snapshot(value: Any, snapshot_format: str) -> bytes:
+    """
+    Encodes a JSON value in a snapshot format.
+    """
+    _check_format(snapshot_format)
+    if snapshot_format == "pretty":
+        return json.dumps(value, indent=4).encode()
+    data = json.dumps(value, separators=(",", ":")).encode()
+    if snapshot_format == "gzip":
+        return gzip.compress(data, mtime=0)
+    if snapshot_format == "zstd":
+        return bytes(zstandard.ZstdCompressor().compress(data))
+    return data
+
+
+class SnapshotArchive:
+    """
+    Streams JSON arrays into encoded snapshots, one spooled temporary file per snapshot
+
+    Elements are encoded and compressed as they are appended, so a snapshot never has to be held in memory as a
+    whole. Snapshots are created on the first append, `close` finishes all of them.
+    """
+
+    def __init__(self, tmp_dir: str, snapshot_format: str, spool_size: int) -> None:
+        _check_format(snapshot_format)
+        self.__tmp_dir = tmp_dir
+        self.__format = snapshot_format
+        self.__spool_size = spool_size
+        self.__snapshots: Dict[str, Tuple[IO[bytes], Optional[Any], JsonArrayWriter]] = {}
+
+    def __enter__(self) -> "SnapshotArchive":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        for spool, _, _ in self.__snapshots.values():
+            spool.close()
+
+    def __open(self, name: str) -> JsonArrayWriter:
+        """
+        Creates the spooled file of a snapshot and the writer that encodes into it
+        """
+        spool: IO[bytes] = tempfile.SpooledTemporaryFile(  # pylint: disable=consider-using-with
+            max_size=self.__spool_size, dir=self.__tmp_dir
+        )
+        compressor: Optional[Any] = None
+        if self.__format == "gzip":
+            compressor = gzip.GzipFile(fileobj=spool, mode="wb", mtime=0)
+        elif self.__format == "zstd":
+            compressor = zstandard.ZstdCompressor().stream_writer(spool, closefd=False)
+        writer = JsonArrayWriter(compressor if compressor is not None else spool, compact=self.__format != "pretty")
+        self.__snapshots[name] = (spool, compressor, writer)
+        return writer
+
+    def add_array(self, name: str) -> None:
+        """
+        Creates an empty snapshot, if it does not exist yet.
+        """
+        if name not in self.__snapshots:
+            self.__open(name)
+
+    def append(self, name: str, value: Any) -> None:
+        """
+        Appends an element to the array of a snapshot.
+        """
+        snapshot = self.__snapshots.get(name)
+        writer = snapshot[2] if snapshot is not None else self.__open(name)
+        writer.write(value)
+
+    def close(self) -> Dict[str, IO[bytes]]:
+        """
+        Closes the arrays and returns the snapshots by attachment name, positioned at their start.
+        """
+        snapshots: Dict[str, IO[bytes]] = {}
+        for name in sorted(self.__snapshots):
+            spool, compressor, writer = self.__snapshots[name]
+            writer.close()
+            if compressor is not None:
+                compressor.close()
+            spool.seek(0)
+            snapshots[snapshot_name(name, self.__format)] = spool
+        return snapshots
@@ -0,0 +1,516 @@
+"""
+This module provides the transports used to talk to Bitwarden.
+
+Classes:
+    BwTransport: Abstract base class of all transports.
+    SubprocessTransport: Runs every command as a separate `bw` CLI process.
+    ServeTransport: Runs commands over HTTP against a single `bw serve` (Vault Management API) process.
+    OfflineTransport: Answers the status and the lists from the local data file of the `bw` CLI.
+
+Functions:
+    check_status(what: str, status: int, message: Any) -> None:
+        Raises the error of an HTTP answer that is not 200, ServerError if it may pass.
+
+    start_transport(
+        name: str, serve_url: Optional[str], serve_port: Optional[int], data_file: Optional[str]
+    ) -> BwTransport:
+        Creates the transport selected in the settings, falling back to the CLI if `bw serve` can not be started.
+
+Exceptions:
+    BitwardenException:
+        Raised when the Vault Management API returns an error.
+    ServerError:
+        Raised when a server answers with an error that may pass, a 5xx status or 429.
+"""
+
+import abc
+import http.client
+import json
+import logging
+import os
+import socket
+import subprocess  # nosec B404
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import IO, Any, Dict, Iterator, List, Optional
+
+from . import BitwardenException
+from .json_stream import iter_json_array
+from .metrics import METRICS
+from .offline import OFFLINE_LIST_OBJECTS, OfflineVault, default_data_file
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ServerError(http.client.HTTPException):
+    """
+    A server answered with a 5xx status or asked to slow down with 429, the request may succeed later
+    """
+
+
+def check_status(what: str, status: int, message: Any) -> None:
+    """
+    Raises ServerError for a 5xx or 429 answer and BitwardenException for any other status but 200.
+    """
+    if status >= 500 or status == 429:
+        raise ServerError(f"{what} failed with {status}: {message}")
+    if status != 200:
+        raise BitwardenException(f"{what} failed with {status}: {message}")
+
+
+class BwTransport(abc.ABC):
+    """
+    Base class for the ways of talking to Bitwarden, a transport implements `exec` and `download_attachment`
+    """
+
+    @abc.abstractmethod
+    def exec(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        cmd: List[str],
+        ret_encoding: str = "UTF-8",
+        env_vars: Optional[Dict[str, str]] = None,
+        is_raw: bool = True,
+        timeout: Optional[float] = None,
+    ) -> str:
+        """
+        Executes a Bitwarden CLI command and returns the output as a string, within `timeout` seconds if given.
+        """
+
+    def iter_list(  # pylint: disable=unused-argument
+        self, object_name: str, timeout: Optional[float] = None, bytes_per_second: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the objects of `bw list <object_name>` one by one.
+
+        The output may take `timeout` seconds plus one second for every `bytes_per_second` bytes received, so a large
+        list that keeps arriving is not cut off.
+        """
+        yield from json.loads(self.exec(["list", object_name], timeout=timeout))
+
+    @abc.abstractmethod
+    def download_attachment(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        item_id: str,
+        attachment_id: str,
+        download_location: str,
+        expected_bytes: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """
+        Downloads an attachment of an item to the given location, `expected_bytes` is the size Bitwarden reports.
+        """
+
+    def close(self) -> None:
+        """
+        Releases everything held by the transport.
+        """
+
+
+class _TimedReader:
+    """
+    Wraps a binary stream, counts the bytes read and raises TimeoutError once they took longer than allowed
+    """
+
+    def __init__(self, stream: IO[bytes], timeout: Optional[float], bytes_per_second: Optional[float]) -> None:
+        self.__stream = stream
+        self.__timeout = timeout
+        self.__bytes_per_second = bytes_per_second
+        self.__start = time.monotonic()
+        self.received = 0
+
+    def expired(self) -> bool:
+        """
+        Returns whether the time allowed for the bytes received so far has passed
+        """
+        if self.__timeout is None:
+            return False
+        allowed = self.__timeout
+        if self.__bytes_per_second:
+            allowed += self.received / self.__bytes_per_second
+        return time.monotonic() - self.__start > allowed
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Reads from the stream, raises TimeoutError if the read completed too late
+        """
+        chunk = self.__stream.read(size)
+        self.received += len(chunk)
+        if self.expired():
+            raise TimeoutError(f"No complete answer after {time.monotonic() - self.__start:.0f} seconds")
+        return chunk
+
+
+class SubprocessTransport(BwTransport):
+    """
+    Runs one `bw` CLI process per command
+    """
+
+    def exec(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        cmd: List[str],
+        ret_encoding: str = "UTF-8",
+        env_vars: Optional[Dict[str, str]] = None,
+        is_raw: bool = True,
+        timeout: Optional[float] = None,
+    ) -> str:
+        cmd = ["bw"] + cmd
+
+        if is_raw:
+            cmd.append("--raw")
+
+        cli_env_vars = dict(os.environ)
+
+        if env_vars is not None:
+            cli_env_vars.update(env_vars)
+        LOGGER.debug("Executing CLI :: %s", {" ".join(cmd)})
+        start = time.perf_counter()
+        try:
+            command_out = subprocess.run(
+                cmd, capture_output=True, check=False, encoding=ret_encoding, env=cli_env_vars, timeout=timeout
+            )  # nosec B603
+        finally:
+            METRICS.increment("bw_subprocess_calls_total")
+            METRICS.increment("bw_subprocess_seconds_total", time.perf_counter() - start)
+        if len(command_out.stderr) > 0:
+            LOGGER.warning("Error executing command %s", command_out.stderr)
+        command_out.check_returncode()
+        return command_out.stdout
+
+    def iter_list(
+        self, object_name: str, timeout: Optional[float] = None, bytes_per_second: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Parses the objects from the stdout pipe of the CLI while it is still writing them, a watchdog thread kills
+        the CLI once it is too slow
+        """
+        cmd = ["bw", "list", object_name, "--raw"]
+        LOGGER.debug("Streaming CLI :: %s", {" ".join(cmd)})
+        start = time.perf_counter()
+        timed_out = threading.Event()
+        finished = threading.Event()
+        with tempfile.TemporaryFile() as stderr_file:
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file) as process:  # nosec B603
+                if process.stdout is None:
+                    raise BitwardenException(f"No output from {' '.join(cmd)}")
+                reader = _TimedReader(process.stdout, timeout, bytes_per_second)
+
+                def watchdog() -> None:
+                    while not finished.wait(0.5):
+                        if reader.expired():
+                            timed_out.set()
+                            process.kill()
+                            return
+
+                if timeout is not None:
+                    threading.Thread(target=watchdog, name="bw-list-watchdog", daemon=True).start()
+                try:
+                    yield from iter_json_array(reader)  # type: ignore[arg-type]
+                except (BitwardenException, TimeoutError) as e:
+                    if timed_out.is_set() or isinstance(e, TimeoutError):
+                        raise subprocess.TimeoutExpired(cmd, timeout or 0) from e
+                    raise
+                finally:
+                    finished.set()
+                    process.stdout.close()
+                    return_code = process.wait()
+                    METRICS.increment("bw_subprocess_calls_total")
+                    METRICS.increment("bw_subprocess_seconds_total", time.perf_counter() - start)
+            if timed_out.is_set():
+                raise subprocess.TimeoutExpired(cmd, timeout or 0)
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode(errors="replace")
+        if len(stderr) > 0:
+            LOGGER.warning("Error executing command %s", stderr)
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, cmd, stderr=stderr)
+
+    def download_attachment(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        item_id: str,
+        attachment_id: str,
+        download_location: str,
+        expected_bytes: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.exec(
+            ["get", "attachment", attachment_id, "--itemid", item_id, "--output", download_location],
+            is_raw=False,
+            timeout=timeout,
+        )
+
+
+class ServeTransport(BwTransport):
+    """
+    Talks to the Vault Management API of a `bw serve` process over HTTP
+
+    If no `base_url` is given, `bw serve` is started on localhost and stopped again in `close`, on `port` or on a free
+    port the system picks. `bw serve` has no authentication, any local process can use the vault through the port
+    while it runs. Each thread keeps its own keep-alive connection. Commands without an API equivalent are passed on
+    to the `fallback` transport.
+    """
+
+    __LIST_OBJECTS = ("folders", "organizations", "collections", "items")
+    __SOCKET_TIMEOUT = 300.0
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        port: Optional[int] = None,
+        fallback: Optional[BwTransport] = None,
+        startup_timeout: float = 60,
+    ) -> None:
+        self.__process: Optional["subprocess.Popen[bytes]"] = None
+        self.__fallback = fallback if fallback is not None else SubprocessTransport()
+        self.__local = threading.local()
+        self.__connections: List[http.client.HTTPConnection] = []
+        self.__connections_lock = threading.Lock()
+        if base_url is None:
+            port = self.__free_port(port)
+            base_url = f"http://127.0.0.1:{port}"
+            self.__start_server(port, startup_timeout)
+        self.__url = urllib.parse.urlsplit(base_url)
+        if self.__url.scheme != "http" or not self.__url.hostname:
+            self.close()
+            raise BitwardenException(f"Unsupported bw serve url {base_url}")
+        if self.__process is None:
+            self.__request("GET", "/status")
+
+    @staticmethod
+    def __free_port(port: Optional[int]) -> int:
+        """
+        Returns `port` if nothing is bound to it, or a free port the system picks if it is None. A port in use is
+        refused, whatever answers there is not the `bw serve` this export starts.
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+            try:
+                probe.bind(("127.0.0.1", port or 0))
+            except OSError as e:
+                raise BitwardenException(f"Port {port} for bw serve is already in use: {e}") from e
+            free_port: int = probe.getsockname()[1]
+            return free_port
+
+    def __start_server(self, port: int, startup_timeout: float) -> None:
+        """
+        Starts `bw serve` and waits until it answers
+        """
+        cmd = ["bw", "serve", "--hostname", "127.0.0.1", "--port", str(port)]
+        LOGGER.info("Starting Bitwarden Vault Management API on port %s", port)
+        self.__process = subprocess.Popen(  # pylint: disable=consider-using-with
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )  # nosec B603
+        self.__url = urllib.parse.urlsplit(f"http://127.0.0.1:{port}")
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if self.__process.poll() is not None:
+                stderr = self.__process.stderr.read().decode() if self.__process.stderr else ""
+                self.__process = None
+                raise BitwardenException(f"bw serve exited on startup: {stderr.strip()}")
+            try:
+                self.__request("GET", "/status")
+                if self.__process.poll() is None:
+                    LOGGER.info("Bitwarden Vault Management API is ready")
+                    return
+                continue
+            except (OSError, http.client.HTTPException):
+                self.__local.connection = None
+            if time.monotonic() > deadline:
+                self.close()
+                raise BitwardenException("Timed out waiting for bw serve to start")
+            time.sleep(0.2)
+
+    def __connection(self) -> http.client.HTTPConnection:
+        """
+        Returns the keep-alive connection of the current thread
+        """
+        connection: Optional[http.client.HTTPConnection] = getattr(self.__local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(
+                str(self.__url.hostname), self.__url.port, timeout=self.__SOCKET_TIMEOUT
+            )
+            self.__local.connection = connection
+            with self.__connections_lock:
+                self.__connections.append(connection)
+        return connection
+
+    def __send(self, method: str, path: str, timeout: Optional[float] = None) -> http.client.HTTPResponse:
+        """
+        Sends a request, reconnecting once if the kept-alive connection was dropped, `timeout` limits every socket
+        operation
+        """
+        for attempt in range(2):
+            connection = self.__connection()
+            connection.timeout = timeout if timeout is not None else self.__SOCKET_TIMEOUT
+            if connection.sock is not None:
+                connection.sock.settimeout(connection.timeout)
+            start = time.perf_counter()
+            try:
+                connection.request(method, self.__url.path.rstrip("/") + path)
+                return connection.getresponse()
+            except (ConnectionError, http.client.HTTPException):
+                connection.close()
+                self.__local.connection = None
+                if attempt == 1:
+                    raise
+            finally:
+                METRICS.increment("bw_http_requests_total")
+                METRICS.increment("bw_http_seconds_total", time.perf_counter() - start)
+        raise BitwardenException("Unreachable")
+
+    def __request(self, method: str, path: str, timeout: Optional[float] = None) -> Any:
+        """
+        Sends a request and returns the `data` of the JSON answer
+        """
+        LOGGER.debug("Executing API :: %s %s", method, path)
+        response = self.__send(method, path, timeout)
+        data = response.read()
+        try:
+            body = json.loads(data)
+        except ValueError:
+            check_status(f"{method} {path}", response.status, data[:200])
+            raise
+        check_status(f"{method} {path}", response.status, body.get("message"))
+        if not body.get("success", False):
+            raise BitwardenException(f"{method} {path} failed: {body.get('message')}")
+        return body.get("data")
+
+    def exec(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        cmd: List[str],
+        ret_encoding: str = "UTF-8",
+        env_vars: Optional[Dict[str, str]] = None,
+        is_raw: bool = True,
+        timeout: Optional[float] = None,
+    ) -> str:
+        if cmd == ["status"]:
+            return json.dumps(self.__request("GET", "/status", timeout)["template"])
+        if len(cmd) == 2 and cmd[0] == "list" and cmd[1] in self.__LIST_OBJECTS:
+            return json.dumps(self.__request("GET", f"/list/object/{cmd[1]}", timeout)["data"])
+        return self.__fallback.exec(cmd, ret_encoding=ret_encoding, env_vars=env_vars, is_raw=is_raw, timeout=timeout)
+
+    def iter_list(
+        self, object_name: str, timeout: Optional[float] = None, bytes_per_second: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Parses the objects from the HTTP response body while it is still being received
+        """
+        if object_name not in self.__LIST_OBJECTS:
+            yield from self.__fallback.iter_list(object_name, timeout, bytes_per_second)
+            return
+        path = f"/list/object/{object_name}"
+        LOGGER.debug("Streaming API :: GET %s", path)
+        response = self.__send("GET", path, timeout)
+        if response.status != 200:
+            check_status(f"GET {path}", response.status, repr(response.read()[:200]))
+        reader = _TimedReader(response, timeout, bytes_per_second)  # type: ignore[arg-type]
+        yield from iter_json_array(reader, ("data", "data"))  # type: ignore[arg-type]
+        response.read()
+
+    def download_attachment(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        item_id: str,
+        attachment_id: str,
+        download_location: str,
+        expected_bytes: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        query = urllib.parse.urlencode({"itemid": item_id})
+        path = f"/object/attachment/{urllib.parse.quote(attachment_id)}?{query}"
+        LOGGER.debug("Executing API :: GET %s", path)
+        response = self.__send("GET", path, timeout)
+        if response.status != 200:
+            check_status(f"GET {path}", response.status, repr(response.read()[:200]))
+        reader = _TimedReader(response, timeout, None)  # type: ignore[arg-type]
+        try:
+            with open(download_location, "wb") as file_out:
+                while chunk := reader.read(1024 * 1024):
+                    file_out.write(chunk)
+        except BaseException:
+            if os.path.exists(download_location):
+                os.remove(download_location)
+            raise
+
+    def close(self) -> None:
+        with self.__connections_lock:
+            for connection in self.__connections:
+                connection.close()
+            self.__connections.clear()
+        self.__local = threading.local()
+        if self.__process is not None:
+            LOGGER.info("Stopping Bitwarden Vault Management API")
+            self.__process.terminate()
+            try:
+                self.__process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.__process.kill()
+            self.__process = None
+
+
+class OfflineTransport(BwTransport):
+    """
+    Answers `bw status` and `bw list` from the data file the `bw` CLI keeps after `bw sync`, decrypted with the
+    session in BW_SESSION, no `bw` process runs for them. Attachments are not in the data file, their downloads and
+    all other commands are passed on to the `fallback` transport.
+    """
+
+    def __init__(self, data_file: Optional[str] = None, fallback: Optional[BwTransport] = None) -> None:
+        self.__vault = OfflineVault(data_file or default_data_file(), os.environ.get("BW_SESSION"))
+        self.__fallback = fallback if fallback is not None else SubprocessTransport()
+
+    def exec(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        cmd: List[str],
+        ret_encoding: str = "UTF-8",
+        env_vars: Optional[Dict[str, str]] = None,
+        is_raw: bool = True,
+        timeout: Optional[float] = None,
+    ) -> str:
+        if cmd == ["status"]:
+            return json.dumps(self.__vault.status())
+        if len(cmd) == 2 and cmd[0] == "list" and cmd[1] in OFFLINE_LIST_OBJECTS:
+            return json.dumps(list(self.__vault.iter_list(cmd[1])))
+        return self.__fallback.exec(cmd, ret_encoding=ret_encoding, env_vars=env_vars, is_raw=is_raw, timeout=timeout)
+
+    def iter_list(
+        self, object_name: str, timeout: Optional[float] = None, bytes_per_second: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        if object_name not in OFFLINE_LIST_OBJECTS:
+            yield from self.__fallback.iter_list(object_name, timeout, bytes_per_second)
+            return
+        yield from self.__vault.iter_list(object_name)
+
+    def download_attachment(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        item_id: str,
+        attachment_id: str,
+        download_location: str,
+        expected_bytes: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.__fallback.download_attachment(
+            item_id, attachment_id, download_location, expected_bytes=expected_bytes, timeout=timeout
+        )
+
+    def close(self) -> None:
+        self.__fallback.close()
+
+
+def start_transport(
+    name: str, serve_url: Optional[str], serve_port: Optional[int], data_file: Optional[str] = None
+) -> BwTransport:
+    """
+    Creates the transport with the given name, falls back to the CLI if `bw serve` is not usable. The offline
+    transport reads `data_file`, the data file of the CLI if it is None.
+    """
+    if name == "cli":
+        return SubprocessTransport()
+    if name == "offline":
+        return OfflineTransport(data_file)
+    if name == "serve":
+        try:
+            return ServeTransport(base_url=serve_url, port=serve_port)
+        except (BitwardenException, OSError, http.client.HTTPException) as e:
+            LOGGER.warning("Unable to use bw serve, falling back to the CLI: %s", e)
+            return SubprocessTransport()
+    raise BitwardenException(f"Unknown transport {name}")
@@ -0,0 +1,456 @@
+"""
+This module uploads finished exports to S3 compatible object storage.
+
+Every run uploads its files as one backup set, `<prefix><UTC time>/<file name>`: the database or the shards as soon as
+they are saved, then the sidecar files, then `backup.json` with the size and SHA-256 of every file, which marks the
+set as complete. A file is read part by part and uploaded as a multipart upload with up to `parallelism` parts in
+flight, so no more than that many parts are held in memory, a file that fits in one part is a single PUT. A multipart
+upload that fails is aborted.
+
+Requests are signed with AWS Signature Version 4 and sign the SHA-256 of their payload, every part also carries its
+Content-MD5, so the storage rejects a part that was corrupted on the way. Requests that fail for a transient reason,
+or with a server error, are retried. The bucket is addressed by path, which every S3 compatible storage supports.
+Credentials are taken from AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and AWS_SESSION_TOKEN.
+
+With `keep`, the newest `keep` complete backup sets are kept once the upload is done, every set older than the oldest
+of them is deleted. Objects under the prefix that are not in a backup set are never touched.
+
+Classes:
+    S3Client: Signed requests against a bucket of an S3 compatible storage.
+    UploadedFile: Key, size and SHA-256 of an uploaded file.
+    BackupUploader: Uploads the files of a backup set in the background and prunes old sets.
+
+Functions:
+    parse_s3_url(url: str) -> Tuple[str, str, str]:
+        Splits an upload url into endpoint, bucket and prefix.
+
+Exceptions:
+    BitwardenException:
+        Raised when the storage refuses a request or an upload fails on every attempt.
+"""
+
+import base64
+import datetime
+import hashlib
+import hmac
+import http.client
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ET  # nosec B405
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from types import TracebackType
+from typing import BinaryIO, Dict, List, Optional, Set, Tuple, Type
+
+from pydantic import BaseModel
+
+from . import BitwardenException
+from .metrics import METRICS
+from .progress import PROGRESS, format_bytes
+from .retry import RETRYABLE_ERRORS, Retrier
+from .transport import check_status
+
+LOGGER = logging.getLogger(__name__)
+
+BACKUP_FILE = "backup.json"
+BACKUP_SET_PATTERN = re.compile(r"\d{8}T\d{6}Z")
+UPLOAD_PHASE = "upload"
+
+
+def parse_s3_url(url: str) -> Tuple[str, str, str]:
+    """
+    Splits `https://host[:port]/bucket/prefix/` into the endpoint, the bucket and the prefix of the backup sets.
+    """
+    parts = urllib.parse.urlsplit(url)
+    bucket, _, prefix = parts.path.lstrip("/").partition("/")
+    if parts.scheme not in ("http", "https") or not parts.hostname or not bucket:
+        raise BitwardenException(f"Unsupported upload url {url}, expected https://host/bucket/prefix/")
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    return f"{parts.scheme}://{parts.netloc}", bucket, prefix
+
+
+class S3Client:  # pylint: disable=too-many-instance-attributes
+    """
+    Signed requests against one bucket, safe to use from several threads, each keeps its own connection
+    """
+
+    def __init__(self, endpoint: str, bucket: str, region: str, retrier: Retrier) -> None:
+        self.__endpoint = urllib.parse.urlsplit(endpoint)
+        self.__bucket = bucket
+        self.__region = region
+        self.__retrier = retrier
+        self.__access_key = os.environ.get("AWS_ACCESS_KEY_ID", "")
+        self.__secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY", "")
+        self.__session_token = os.environ.get("AWS_SESSION_TOKEN")
+        if not self.__access_key or not self.__secret_key:
+            raise BitwardenException("Uploads need AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY in the environment")
+        self.__local = threading.local()
+
+    def __connection(self, timeout: float) -> http.client.HTTPConnection:
+        """
+        Returns the connection of the calling thread
+        """
+        connection: Optional[http.client.HTTPConnection] = getattr(self.__local, "connection", None)
+        if connection is None:
+            connection_class = (
+                http.client.HTTPSConnection if self.__endpoint.scheme == "https" else http.client.HTTPConnection
+            )
+            connection = connection_class(str(self.__endpoint.hostname), self.__endpoint.port, timeout=timeout)
+            self.__local.connection = connection
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection
+
+    def __signed_headers(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, method: str, path: str, query: Dict[str, str], headers: Dict[str, str], payload_hash: str
+    ) -> Dict[str, str]:
+        """
+        Returns the headers of a request with its AWS Signature Version 4
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        headers = {
+            **{name.lower(): value for name, value in headers.items()},
+            "host": str(self.__endpoint.netloc),
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": payload_hash,
+        }
+        if self.__session_token:
+            headers["x-amz-security-token"] = self.__session_token
+        signed_headers = ";".join(sorted(headers))
+        canonical_request = "\n".join(
+            [
+                method,
+                path,
+                _canonical_query(query),
+                "".join(f"{name}:{headers[name].strip()}\n" for name in sorted(headers)),
+                signed_headers,
+                payload_hash,
+            ]
+        )
+        scope = f"{amz_date[:8]}/{self.__region}/s3/aws4_request"
+        string_to_sign = "\n".join(
+            ["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()]
+        )
+        signing_key = f"AWS4{self.__secret_key}".encode()
+        for scope_part in (amz_date[:8], self.__region, "s3", "aws4_request"):
+            signing_key = hmac.new(signing_key, scope_part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.__access_key}/{scope}, SignedHeaders={signed_headers}, "
+            f"Signature={signature}"
+        )
+        return headers
+
+    def __send(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self, method: str, path: str, query: Dict[str, str], body: bytes, headers: Dict[str, str], timeout: float
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        Sends one signed request and reads the whole answer, server errors are raised to be retried
+        """
+        headers = self.__signed_headers(method, path, query, headers, hashlib.sha256(body).hexdigest())
+        url = path + (f"?{_canonical_query(query)}" if query else "")
+        connection = self.__connection(timeout)
+        try:
+            connection.request(method, url, body=body, headers=headers)
+            response = connection.getresponse()
+            data = response.read()
+        except BaseException:
+            connection.close()
+            self.__local.connection = None
+            raise
+        if response.status >= 500 or response.status == 429:
+            check_status(f"{method} {path}", response.status, repr(data[:200]))
+        return response.status, {name.lower(): value for name, value in response.getheaders()}, data
+
+    def request(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        method: str,
+        key: str = "",
+        query: Optional[Dict[str, str]] = None,
+        body: bytes = b"",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[Dict[str, str], bytes]:
+        """
+        Sends a request for an object of the bucket, or the bucket itself, with retries and returns the headers and
+        body of the answer, raises if the storage refuses it.
+        """
+        path = urllib.parse.quote(f"/{self.__bucket}/{key}" if key else f"/{self.__bucket}", safe="/-_.~")
+        what = f"{method} {path}"
+        attempt = 0
+        while True:
+            try:
+                status, response_headers, data = self.__send(
+                    method, path, query or {}, body, headers or {}, self.__retrier.timeout(what, len(body))
+                )
+                break
+            except RETRYABLE_ERRORS as e:
+                time.sleep(self.__retrier.backoff(what, attempt, e))
+                attempt += 1
+        if status >= 300 or b"<Error>" in data[:512]:
+            raise BitwardenException(f"{what} failed with {status}: {data[:500].decode(errors='replace')}")
+        return response_headers, data
+
+    def put_object(self, key: str, data: bytes) -> None:
+        """
+        Uploads an object in one request.
+        """
+        self.request("PUT", key, body=data, headers={"Content-MD5": _content_md5(data)})
+
+    def create_multipart_upload(self, key: str) -> str:
+        """
+        Starts a multipart upload and returns its id.
+        """
+        _, data = self.request("POST", key, {"uploads": ""})
+        return _xml_text(data, "UploadId")
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """
+        Uploads one part of a multipart upload and returns its ETag.
+        """
+        headers, _ = self.request(
+            "PUT",
+            key,
+            {"partNumber": str(part_number), "uploadId": upload_id},
+            body=data,
+            headers={"Content-MD5": _content_md5(data)},
+        )
+        etag = headers.get("etag", "")
+        expected = hashlib.md5(data, usedforsecurity=False).hexdigest()
+        if re.fullmatch(r'"?[0-9a-f]{32}"?', etag) and etag.strip('"') != expected:
+            raise BitwardenException(f"Part {part_number} of {key} was stored with ETag {etag}, expected {expected}")
+        return etag
+
+    def complete_multipart_upload(self, key: str, upload_id: str, etags: List[str]) -> None:
+        """
+        Completes a multipart upload from the ETags of its parts, in the order of the parts.
+        """
+        body = "".join(
+            f"<Part><PartNumber>{part_number}</PartNumber><ETag>{etag}</ETag></Part>"
+            for part_number, etag in enumerate(etags, start=1)
+        )
+        self.request(
+            "POST",
+            key,
+            {"uploadId": upload_id},
+            body=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode(),
+        )
+
+    def abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        """
+        Aborts a multipart upload, so the storage drops its parts.
+        """
+        self.request("DELETE", key, {"uploadId": upload_id})
+
+    def list_objects(self, prefix: str, delimiter: Optional[str] = None) -> Tuple[List[str], List[str]]:
+        """
+        Returns the keys and, with a delimiter, the common prefixes of the objects under a prefix.
+        """
+        keys: List[str] = []
+        prefixes: List[str] = []
+        query = {"list-type": "2", "prefix": prefix}
+        if delimiter is not None:
+            query["delimiter"] = delimiter
+        while True:
+            _, data = self.request("GET", query=query)
+            root = ET.fromstring(data)  # nosec B314
+            keys += [element.text or "" for element in root.findall("{*}Contents/{*}Key")]
+            prefixes += [element.text or "" for element in root.findall("{*}CommonPrefixes/{*}Prefix")]
+            token = root.findtext("{*}NextContinuationToken")
+            if root.findtext("{*}IsTruncated") != "true" or not token:
+                return keys, prefixes
+            query["continuation-token"] = token
+
+    def delete_object(self, key: str) -> None:
+        """
+        Deletes an object.
+        """
+        self.request("DELETE", key)
+
+    def close(self) -> None:
+        """
+        Closes the connection of the calling thread, the connections of other threads close with them.
+        """
+        connection: Optional[http.client.HTTPConnection] = getattr(self.__local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.__local.connection = None
+
+
+def _canonical_query(query: Dict[str, str]) -> str:
+    return "&".join(
+        f"{urllib.parse.quote(name, safe='-_.~')}={urllib.parse.quote(value, safe='-_.~')}"
+        for name, value in sorted(query.items())
+    )
+
+
+def _content_md5(data: bytes) -> str:
+    return base64.b64encode(hashlib.md5(data, usedforsecurity=False).digest()).decode()
+
+
+def _xml_text(data: bytes, tag: str) -> str:
+    text = ET.fromstring(data).findtext(f"{{*}}{tag}")  # nosec B314
+    if not text:
+        raise BitwardenException(f"The storage answered without {tag}: {data[:200]!r}")
+    return text
+
+
+class UploadedFile(BaseModel):
+    """
+    A file of a backup set, as recorded in its `backup.json`
+    """
+
+    key: str
+    size: int
+    sha256: str
+
+
+class BackupUploader:  # pylint: disable=too-many-instance-attributes
+    """
+    Uploads the files of one backup set under `prefix`, one file at a time in the background, each with up to
+    `parallelism` parts of `part_size` bytes in flight
+
+    `submit` queues a file as soon as it is saved, `finish` uploads the sidecar files and `backup.json` and prunes the
+    sets beyond `keep`. Leaving the context without `finish` cancels the files that did not start.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        client: S3Client,
+        prefix: str,
+        part_size: int,
+        parallelism: int,
+        keep: Optional[int] = None,
+        sidecars: Optional[List[str]] = None,
+    ) -> None:
+        self.__client = client
+        self.__prefix = prefix
+        self.__set_prefix = f"{prefix}{datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')}/"
+        self.__part_size = part_size
+        self.__parallelism = parallelism
+        self.__keep = keep
+        self.__sidecars = sidecars or []
+        self.__files = ThreadPoolExecutor(max_workers=1, thread_name_prefix="s3-file")
+        self.__parts = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="s3-part")
+        self.__uploads: List["Future[UploadedFile]"] = []
+        PROGRESS.start(UPLOAD_PHASE, unit="files", total=0)
+
+    def __enter__(self) -> "BackupUploader":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.__files.shutdown(wait=True, cancel_futures=True)
+        self.__parts.shutdown(wait=True, cancel_futures=True)
+        PROGRESS.finish(UPLOAD_PHASE, summary=exc_type is None)
+
+    def submit(self, path: str) -> None:
+        """
+        Queues a saved file for upload into the backup set.
+        """
+        PROGRESS.add_total(UPLOAD_PHASE, nbytes=os.path.getsize(path))
+        self.__uploads.append(self.__files.submit(self.__upload_file, path))
+
+    def __upload_file(self, path: str) -> UploadedFile:
+        """
+        Uploads one file, part by part if it does not fit in one
+        """
+        key = self.__set_prefix + os.path.basename(path)
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        with open(path, "rb") as file_in:
+            if size <= self.__part_size:
+                data = file_in.read()
+                sha256 = hashlib.sha256(data).hexdigest()
+                self.__client.put_object(key, data)
+            else:
+                sha256 = self.__upload_parts(key, file_in)
+        PROGRESS.advance(UPLOAD_PHASE, nbytes=size)
+        METRICS.increment("upload_files_total")
+        METRICS.increment("upload_bytes_total", size)
+        LOGGER.info("Uploaded %s to %s, %s in %.1f seconds", path, key, format_bytes(size), time.perf_counter() - start)
+        return UploadedFile(key=key, size=size, sha256=sha256)
+
+    def __upload_parts(self, key: str, file_in: BinaryIO) -> str:
+        """
+        Uploads a file as a multipart upload and returns its SHA-256, at most `parallelism` parts are read ahead of
+        the finished ones
+        """
+        file_hash = hashlib.sha256()
+        upload_id = self.__client.create_multipart_upload(key)
+        try:
+            pending: Set["Future[str]"] = set()
+            parts: List["Future[str]"] = []
+            while chunk := file_in.read(self.__part_size):
+                file_hash.update(chunk)
+                if len(pending) >= self.__parallelism:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                part = self.__parts.submit(self.__client.upload_part, key, upload_id, len(parts) + 1, chunk)
+                pending.add(part)
+                parts.append(part)
+                METRICS.increment("upload_parts_total")
+            self.__client.complete_multipart_upload(key, upload_id, [part.result() for part in parts])
+            return file_hash.hexdigest()
+        except BaseException:
+            LOGGER.error("Upload of %s failed, aborting it", key)
+            try:
+                self.__client.abort_multipart_upload(key, upload_id)
+            except BitwardenException as e:
+                LOGGER.warning("Unable to abort the upload of %s: %s", key, e)
+            raise
+
+    def finish(self) -> List[UploadedFile]:
+        """
+        Uploads the sidecar files, waits for all uploads, marks the set complete with `backup.json` and prunes old
+        sets.
+        """
+        for sidecar in self.__sidecars:
+            if os.path.isfile(sidecar):
+                self.submit(sidecar)
+            else:
+                LOGGER.warning("Sidecar file %s does not exist, it is not uploaded", sidecar)
+        uploaded = [upload.result() for upload in self.__uploads]
+        backup = {
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "files": [uploaded_file.model_dump() for uploaded_file in uploaded],
+        }
+        self.__client.put_object(self.__set_prefix + BACKUP_FILE, json.dumps(backup, indent=4).encode())
+        LOGGER.info("Backup set %s uploaded, %s files", self.__set_prefix, len(uploaded))
+        if self.__keep is not None:
+            self.__prune()
+        return uploaded
+
+    def __prune(self) -> None:
+        """
+        Deletes the backup sets older than the newest `keep` complete ones
+        """
+        _, set_prefixes = self.__client.list_objects(self.__prefix, delimiter="/")
+        backup_sets = sorted(
+            set_prefix
+            for set_prefix in set_prefixes
+            if BACKUP_SET_PATTERN.fullmatch(set_prefix[len(self.__prefix) :].rstrip("/"))
+        )
+        complete = [set_prefix for set_prefix in backup_sets if self.__client.list_objects(set_prefix + BACKUP_FILE)[0]]
+        if self.__keep is None or len(complete) <= self.__keep:
+            return
+        oldest_kept = complete[-self.__keep]
+        for set_prefix in backup_sets:
+            if set_prefix >= oldest_kept:
+                break
+            keys, _ = self.__client.list_objects(set_prefix)
+            for key in keys:
+                self.__client.delete_object(key)
+            METRICS.increment("upload_sets_pruned_total")
+            LOGGER.info("Pruned backup set %s, %s objects", set_prefix, len(keys))
@@ -0,0 +1,205 @@
+"""
+This module verifies an export against the vault without exporting it again.
+
+The entries of the export are indexed by Bitwarden item id as digests of their content: revision, title, username,
+password, URL, notes, OTP, the custom properties that hold the fields and URIs, and the size and SHA-256 of every
+attachment. Every item of a fresh `bw list items` is turned into the digest of the entry it is written as and
+compared with the index. The size and SHA-256 of an attachment are taken from the attachment cache, which records
+them for the decrypted file by attachment id and the size Bitwarden reports, the reported size is the size of the
+encrypted file and is never compared with the export. An attachment is only downloaded if the cache does not know it
+and the export holds an attachment of the same name.
+
+Classes:
+    EntryDigest: Hashes of the content of one entry.
+    VerificationReport: Items missing from the export, entries of items no longer in the vault, and differing items.
+    ExportVerifier: Compares the items of the vault with the index of an export.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from pykeepass import PyKeePass  # type: ignore
+from pykeepass.entry import Entry  # type: ignore
+
+from . import BitwardenException
+from .bw_models import BwItem, BwItemAttachment
+from .keepass import (
+    BW_ITEM_ID_PROPERTY,
+    BW_REVISION_DATE_PROPERTY,
+    entry_attachment_names,
+    entry_fields,
+    entry_otp,
+    entry_url,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _sha256(value: Optional[str]) -> str:
+    return hashlib.sha256((value or "").encode("utf-8")).hexdigest()
+
+
+class EntryDigest(BaseModel):
+    """
+    Hashes of the content of an entry, attachments map their name to size and SHA-256, None if it is not known
+    """
+
+    revision_date: str
+    title: str
+    username: str
+    password: str
+    url: str
+    notes: str
+    otp: str
+    fields: Dict[str, str]
+    attachments: Dict[str, Optional[Tuple[int, str]]]
+
+    def differences(self, expected: "EntryDigest") -> List[str]:
+        """
+        Returns the parts that differ from the expected digest, an unknown attachment matches any of the same name.
+        """
+        parts = [
+            part
+            for part in ("revision_date", "title", "username", "password", "url", "notes", "otp", "fields")
+            if getattr(self, part) != getattr(expected, part)
+        ]
+        if self.attachments.keys() != expected.attachments.keys() or any(
+            content is not None and self.attachments[name] != content for name, content in expected.attachments.items()
+        ):
+            parts.append("attachments")
+        return parts
+
+
+class VerificationReport(BaseModel):
+    """
+    Result of a verification, items are listed by id with their name, differing items with the parts that differ
+    """
+
+    items: int = 0
+    missing: Dict[str, str] = {}
+    extra: Dict[str, str] = {}
+    differing: Dict[str, List[str]] = {}
+
+    @property
+    def matches(self) -> bool:
+        """
+        Returns whether the export holds exactly the items of the vault.
+        """
+        return len(self.missing) == 0 and len(self.extra) == 0 and len(self.differing) == 0
+
+
+class ExportVerifier:
+    """
+    Indexes the entries of an export by Bitwarden item id and checks the items of the vault against the index
+
+    `attachment_content` returns the size and SHA-256 of an attachment as `bw get attachment` writes it, None if it is
+    not known without downloading it.
+    """
+
+    def __init__(
+        self,
+        kdbx_file: str,
+        kdbx_password: str,
+        attachment_content: Callable[[BwItemAttachment], Optional[Tuple[int, str]]],
+    ) -> None:
+        if not os.path.exists(kdbx_file):
+            raise BitwardenException(f"There is no export to verify at {kdbx_file}")
+        self.__attachment_content = attachment_content
+        self.__report = VerificationReport()
+        self.__index: Dict[str, List[EntryDigest]] = {}
+        self.__titles: Dict[str, str] = {}
+        binary_digests: Dict[int, Tuple[int, str]] = {}
+        py_kee_pass = PyKeePass(kdbx_file, password=kdbx_password)
+        for entry in py_kee_pass.entries:
+            item_id = entry.get_custom_property(BW_ITEM_ID_PROPERTY)
+            if not item_id:
+                continue
+            self.__index.setdefault(item_id, []).append(self.__entry_digest(entry, binary_digests))
+            self.__titles[item_id] = entry.title or ""
+        LOGGER.info("Indexed %s entries of %s items of %s", len(py_kee_pass.entries), len(self.__index), kdbx_file)
+
+    @staticmethod
+    def __entry_digest(entry: Entry, binary_digests: Dict[int, Tuple[int, str]]) -> EntryDigest:
+        """
+        Returns the digest of an entry of the export, binaries shared by several entries are hashed once
+        """
+        attachments: Dict[str, Optional[Tuple[int, str]]] = {}
+        for attachment in entry.attachments:
+            if attachment.id not in binary_digests:
+                binary = attachment.binary or b""
+                binary_digests[attachment.id] = (len(binary), hashlib.sha256(binary).hexdigest())
+            attachments[attachment.filename] = binary_digests[attachment.id]
+        return EntryDigest(
+            revision_date=entry.get_custom_property(BW_REVISION_DATE_PROPERTY) or "",
+            title=_sha256(entry.title),
+            username=_sha256(entry.username),
+            password=_sha256(entry.password),
+            url=_sha256(entry.url),
+            notes=_sha256(entry.notes),
+            otp=_sha256(entry.otp),
+            fields={
+                name: _sha256(value)
+                for name, value in entry.custom_properties.items()
+                if name not in (BW_ITEM_ID_PROPERTY, BW_REVISION_DATE_PROPERTY)
+            },
+            attachments=attachments,
+        )
+
+    def __item_digest(self, bw_item: BwItem) -> EntryDigest:
+        """
+        Returns the digest of the entry an item is written as
+        """
+        return EntryDigest(
+            revision_date=bw_item.revisionDate,
+            title=_sha256(bw_item.name),
+            username=_sha256(bw_item.login.username if bw_item.login else None),
+            password=_sha256(bw_item.login.password if bw_item.login else None),
+            url=_sha256(entry_url(bw_item)),
+            notes=_sha256(bw_item.notes),
+            otp=_sha256(entry_otp(bw_item)),
+            fields={field.name: _sha256(field.value) for field in entry_fields(bw_item)},
+            attachments={
+                name: self.__attachment_content(attachment)
+                for name, attachment in zip(entry_attachment_names(bw_item), bw_item.attachments)
+            },
+        )
+
+    def needs_download(self, bw_item: BwItem) -> bool:
+        """
+        Returns whether an attachment of the item has to be downloaded to compare it, which is only the case if the
+        export holds an attachment of the same name and the size and digest of the item's attachment are not known.
+        """
+        entries = self.__index.get(bw_item.id, [])
+        return any(
+            self.__attachment_content(attachment) is None and any(name in entry.attachments for entry in entries)
+            for name, attachment in zip(entry_attachment_names(bw_item), bw_item.attachments)
+        )
+
+    def check(self, bw_item: BwItem) -> None:
+        """
+        Compares an item of the vault with its entries in the export.
+        """
+        self.__report.items += 1
+        entries = self.__index.pop(bw_item.id, None)
+        if entries is None:
+            LOGGER.warning("Item %s is missing from the export", bw_item.name)
+            self.__report.missing[bw_item.id] = bw_item.name
+            return
+        expected = self.__item_digest(bw_item)
+        parts = sorted({part for entry in entries for part in entry.differences(expected)})
+        if len(parts) > 0:
+            LOGGER.warning("Item %s differs from the export in %s", bw_item.name, ", ".join(parts))
+            self.__report.differing[bw_item.id] = parts
+
+    def report(self) -> VerificationReport:
+        """
+        Returns the report, entries of items that were not checked are reported as no longer in the vault.
+        """
+        for item_id in self.__index:
+            LOGGER.warning("Entry %s of the export is no longer in Bitwarden", self.__titles[item_id])
+            self.__report.extra[item_id] = self.__titles[item_id]
+        self.__index = {}
+        return self.__report